@@ -0,0 +1,78 @@
+"""Benchmark de l'admission du cache : TinyLFU vs admission systématique (LRU seul).
+
+Rejoue un trafic synthétique proche du nôtre à travers get_cache / set_cache :
+des pages chaudes (catalogues et fiches, popularité en loi de Zipf) mélangées à
+des clés vues une seule fois (recherches, pages /download/, robots) qui arrivent
+en rafales. Affiche le taux de succès obtenu par chaque politique.
+
+Usage : python bench/bench_admission.py [--requests 200000] [--capacity 500] [--scan-ratio 0.4]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main  # noqa: E402
+
+
+def build_trace(args):
+    """Liste de clés : pages chaudes (Zipf) entrecoupées de rafales de clés uniques."""
+    rng = random.Random(args.seed)
+    weights = [1 / (rank ** args.zipf) for rank in range(1, args.hot_keys + 1)]
+    hot = rng.choices(range(args.hot_keys), weights=weights, k=args.requests)
+    trace = []
+    one_off = 0
+    for key in hot:
+        if rng.random() < args.scan_ratio:
+            # Rafale de clés froides (un robot qui parcourt des pages, une recherche paginée...)
+            for _ in range(rng.randint(1, args.burst)):
+                trace.append(f"scan-{one_off}")
+                one_off += 1
+        trace.append(f"hot-{key}")
+    return trace
+
+
+def replay(trace, admission, capacity):
+    main.CACHE_ADMISSION = admission
+    main.CACHE_MAX_ENTRIES = capacity
+    main._frequency_sketch = main.FrequencySketch(max(capacity, 1024))
+    main._cache.clear()
+    main._cache_expiry.clear()
+    for name in main._cache_stats:
+        main._cache_stats[name] = 0
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for key in trace:
+            if main.get_cache(key) is None:
+                main.set_cache(key, key)
+    elapsed = time.perf_counter() - start
+
+    stats = main._cache_stats
+    ratio = stats["hits"] / (stats["hits"] + stats["misses"])
+    # Les clés froides sont uniques : tous les succès viennent des pages chaudes
+    hot_ratio = stats["hits"] / sum(1 for key in trace if key.startswith("hot-"))
+    print(f"{admission:<8} taux de succès {ratio:6.1%} (pages chaudes {hot_ratio:6.1%})   admis {stats['admitted']:>7}   refusés {stats['rejected']:>7}   "
+          f"{len(trace) / elapsed / 1000:6.0f} k op/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000, help="Nombre de requêtes sur des pages chaudes")
+    parser.add_argument("--hot-keys", type=int, default=2000)
+    parser.add_argument("--zipf", type=float, default=0.9)
+    parser.add_argument("--capacity", type=int, default=500)
+    parser.add_argument("--scan-ratio", type=float, default=0.4, help="Probabilité d'une rafale froide avant chaque requête chaude")
+    parser.add_argument("--burst", type=int, default=5, help="Taille maximale d'une rafale froide")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    trace = build_trace(args)
+    print(f"{len(trace)} requêtes, {args.hot_keys} pages chaudes, cache de {args.capacity} entrées\n")
+    for admission in ("always", "tinylfu"):
+        replay(trace, admission, args.capacity)
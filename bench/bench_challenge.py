@@ -0,0 +1,140 @@
+"""Benchmark de la détection des challenges Cloudflare : ancien détecteur vs is_cloudflare_challenge.
+
+Corpus synthétique proche de ce que renvoient Akwam et Cloudflare : challenges JS (503),
+challenges gérés (403 + cf-mitigated), pages de blocage, et pages normales dont certaines
+citent Cloudflare (scripts cdnjs, protection des e-mails, pied de page), erreurs d'origine.
+Des pages réelles peuvent s'y ajouter : --corpus DIR avec DIR/challenge/* et DIR/normal/*.
+Affiche faux positifs, faux négatifs et coût moyen par appel.
+
+Usage : python bench/bench_challenge.py [--corpus DIR] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+
+CF = {"server": "cloudflare", "cf-ray": "8a1b2c3d4e5f6789-CDG"}
+ORIGIN = {"server": "nginx"}
+
+
+def legacy_is_cloudflare_challenge(response_content, status_code):
+    """Détecteur d'origine : décodage et minuscules de tout le corps, mot "cloudflare" seul compris."""
+    if status_code in [403, 503, 429]:
+        return True
+    if isinstance(response_content, bytes):
+        content_str = response_content.decode('utf-8', errors='ignore').lower()
+    else:
+        content_str = str(response_content).lower()
+    cloudflare_signatures = [
+        'challenge-platform', 'cloudflare', 'cf-wrapper', 'cf_chl_opt',
+        'checking your browser', 'just a moment', '__cf_chl_jschl_tk__'
+    ]
+    return any(sig in content_str for sig in cloudflare_signatures)
+
+
+def challenge_page(title="Just a moment...", extra=""):
+    return (f'<!DOCTYPE html><html lang="en-US"><head><title>{title}</title>'
+            '<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">'
+            '<meta name="robots" content="noindex,nofollow"><style>*{box-sizing:border-box}</style>'
+            '<script>(function(){window._cf_chl_opt={cvId: \'3\',cZone: "ak.sv",cType: \'managed\'};'
+            'var cpo=document.createElement(\'script\');cpo.src=\'/cdn-cgi/challenge-platform/h/g/orchestrate/chl_page/v1\';'
+            f'}}());</script></head><body><div class="main-wrapper" role="main">{extra}</div></body></html>').encode()
+
+
+def akwam_page(body_blocks, extra_head=""):
+    """Page Akwam : <head> chargé (CSS, scripts cdnjs), puis le contenu."""
+    head = ('<!DOCTYPE html><html lang="ar" dir="rtl"><head><meta charset="utf-8"><title>اكوام</title>'
+            '<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css">'
+            '<script src="https://cdnjs.cloudflare.com/ajax/libs/jquery/3.6.0/jquery.min.js"></script>'
+            + '<link rel="preload" href="https://ak.sv/style/assets/fonts/font.woff2">' * 20 + extra_head + '</head><body>')
+    return (head + body_blocks + '</body></html>').encode()
+
+
+def listing_blocks(count):
+    return "".join(
+        f'<div class="col-lg-auto col-md-4 col-6 mb-12"><div class="entry-box"><a class="box" href="https://ak.sv/movie/{i}/x"></a>'
+        f'<img class="img-fluid w-100 lazy" data-src="https://img.ak.sv/thumb/260x380/{i}.jpg"/>'
+        f'<h3 class="entry-title">فيلم رقم {i}</h3></div></div>' for i in range(count))
+
+
+def build_corpus():
+    """[(nom, challenge attendu, statut, en-têtes, corps)]"""
+    series = "".join(f'<div class="bg-primary2"><h2 class="font-size-18"><a href="https://ak.sv/episode/{n}/x">حلقة {n}</a></h2></div>'
+                     for n in range(400))
+    return [
+        ("challenge JS (503)", True, 503, CF, challenge_page()),
+        ("challenge géré (403, cf-mitigated)", True, 403, {**CF, "cf-mitigated": "challenge"}, challenge_page()),
+        ("challenge sans en-têtes", True, 200, {}, challenge_page()),
+        ("blocage WAF (403)", True, 403, CF, challenge_page("Attention Required! | Cloudflare")),
+        ("ancien challenge jschl", True, 503, {}, b'<html><form id="challenge-form" action="/?__cf_chl_jschl_tk__=abc"></form></html>'),
+        ("liste Akwam", False, 200, CF, akwam_page(listing_blocks(24))),
+        ("série Akwam (400 épisodes)", False, 200, CF, akwam_page(series)),
+        ("page avec protection e-mail", False, 200, CF,
+         akwam_page('<a href="/cdn-cgi/l/email-protection#abc">[email&#160;protected]</a>' + listing_blocks(12))),
+        ("pied de page 'Cloudflare'", False, 200, CF, akwam_page(listing_blocks(24) + '<footer>Performance &amp; security by Cloudflare</footer>')),
+        ("description citant 'just a moment'", False, 200, CF,
+         akwam_page('<div class="text-white">just a moment before the end of the world...</div>')),
+        ("404 servie par Cloudflare", False, 404, CF, akwam_page('<h1>الصفحة غير موجودة</h1>')),
+        ("503 de l'origine (nginx)", False, 503, ORIGIN, b'<html><head><title>503 Service Temporarily Unavailable</title></head></html>'),
+        ("page de téléchargement", False, 200, CF,
+         akwam_page('<a href="https://s101.downet.net/download/abc/file.mp4" class="link btn">تحميل</a>' + "x" * 40000)),
+    ]
+
+
+def load_directory(path):
+    corpus = []
+    for label, expected in (("challenge", True), ("normal", False)):
+        folder = os.path.join(path, label)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            with open(os.path.join(folder, name), "rb") as f:
+                corpus.append((f"{label}/{name}", expected, 403 if expected else 200, {}, f.read()))
+    return corpus
+
+
+def per_call_us(fn, corpus, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in corpus:
+            fn(item)
+    return (time.perf_counter() - start) / (repeat * len(corpus)) * 1e6
+
+
+def main_bench(args):
+    corpus = build_corpus() + (load_directory(args.corpus) if args.corpus else [])
+    # En-têtes construits une fois, comme response.headers dans l'application
+    corpus = [(name, expected, status, httpx.Headers(headers), body) for name, expected, status, headers, body in corpus]
+    detectors = {
+        "ancien": lambda item: legacy_is_cloudflare_challenge(item[4], item[2]),
+        "nouveau": lambda item: main.is_cloudflare_challenge(item[4], item[2], item[3]),
+    }
+    print(f"{'page':<38} {'taille':>8} {'attendu':>8} {'ancien':>7} {'nouveau':>8}")
+    for item in corpus:
+        name, expected, _, _, body = item
+        verdicts = ["oui" if detect(item) else "non" for detect in detectors.values()]
+        flags = ["" if (v == "oui") == expected else "✗" for v in verdicts]
+        print(f"{name:<38} {len(body):>8} {'oui' if expected else 'non':>8} "
+              f"{verdicts[0] + flags[0]:>7} {verdicts[1] + flags[1]:>8}")
+
+    normal = [item for item in corpus if not item[1]]
+    challenges = [item for item in corpus if item[1]]
+    print(f"\n{'détecteur':<10} {'faux positifs':>14} {'faux négatifs':>14} {'µs/appel':>10} {'µs/appel (pages normales)':>27}")
+    for label, detect in detectors.items():
+        false_positives = sum(detect(item) for item in normal)
+        false_negatives = sum(not detect(item) for item in challenges)
+        print(f"{label:<10} {f'{false_positives}/{len(normal)}':>14} {f'{false_negatives}/{len(challenges)}':>14} "
+              f"{per_call_us(detect, corpus, args.repeat):>10.1f} {per_call_us(detect, normal, args.repeat):>27.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="Dossier de pages réelles (challenge/ et normal/)")
+    parser.add_argument("--repeat", type=int, default=200)
+    main_bench(parser.parse_args())
@@ -0,0 +1,105 @@
+"""Cache L2 partagé (protocole Redis) contre la doublure en mémoire de bench/redis_standin.py.
+
+Simule deux répliques : le nœud A récupère des pages (mises en cache L1 + L2), le nœud B
+démarre à froid (L1 vide) et les retrouve dans le L2 sans requête upstream. Compare un
+MGET à des GET successifs pour une fenêtre de catalogue, mesure la compression, puis
+coupe le serveur pour vérifier que le cache continue de répondre (L1 seul) sans bloquer.
+
+Usage : python bench/bench_l2.py [--pages 200] [--page-kb 60] [--latency 0.0005]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from redis_standin import RedisStandIn  # noqa: E402
+
+
+def page(i, size_kb):
+    """Page HTML proche d'une liste Akwam (répétitive, donc très compressible)."""
+    block = (f'<div class="col-lg-auto col-md-4 col-6 mb-12"><div class="entry-box">'
+             f'<a class="box" href="https://ak.sv/movie/{i}/slug"></a><h3 class="entry-title">فيلم رقم {i}</h3></div></div>')
+    return ("<html>" + block * (size_kb * 1024 // len(block.encode())) + "</html>").encode()
+
+
+def wait_flushed(main, standin, expected, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if main.cache_l2.writes.qsize() == 0 and len(standin.data) >= expected:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def clear_local(main):
+    with main._cache_lock:
+        main._cache.clear()
+        main._cache_expiry.clear()
+
+
+def bench(args):
+    standin = RedisStandIn(latency=args.latency)
+    port = standin.start_in_thread()
+    os.environ["CACHE_L2_URL"] = f"redis://127.0.0.1:{port}/0"
+    import main
+
+    keys = [main.make_cache_key(f"https://ak.sv/movies?category=0&page={i}") for i in range(args.pages)]
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        # Nœud A : pages récupérées puis mises en cache (écriture L2 différée)
+        start = time.perf_counter()
+        for i, key in enumerate(keys):
+            main.set_cache(key, main.FlareSolverrResponse(page(i, args.page_kb), 200, f"https://ak.sv/movies?page={i}"))
+        set_us = (time.perf_counter() - start) / len(keys) * 1e6
+        flushed = wait_flushed(main, standin, len(keys))
+
+        # Nœud B : démarrage à froid, tout vient du L2
+        clear_local(main)
+        start = time.perf_counter()
+        found = sum(main.get_cache(key) is not None for key in keys)
+        get_ms = (time.perf_counter() - start) / len(keys) * 1000
+
+        # Fenêtre de catalogue : MGET unique vs GET successifs
+        window = keys[:args.window]
+        clear_local(main)
+        start = time.perf_counter()
+        for key in window:
+            main.cache_l2.get(key)
+        sequential_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        prefetched = main.prefetch_cache(window)
+        mget_ms = (time.perf_counter() - start) * 1000
+
+        # Panne : le L2 disparaît, le L1 continue de répondre
+        standin.stop()
+        clear_local(main)
+        main.set_cache(keys[0], b"local")
+        start = time.perf_counter()
+        local_hit = main.get_cache(keys[0]) == b"local"
+        first_miss = main.get_cache(keys[1])
+        outage_first_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for key in keys[2:]:
+            main.get_cache(key)
+        outage_next_us = (time.perf_counter() - start) / max(1, len(keys) - 2) * 1e6
+        report = main.cache_l2.report()
+
+    print(f"{args.pages} pages de {args.page_kb} Ko, latence Redis simulée {args.latency * 1000:.2f} ms\n")
+    print(f"set_cache (L1 + écriture L2 différée)   {set_us:>8.1f} µs/appel   écritures vidées: {'oui' if flushed else 'NON'}")
+    print(f"nœud froid : trouvées dans le L2        {found:>5}/{len(keys)}    {get_ms:>6.2f} ms/get")
+    print(f"compression (stocké / brut)             {report['compression_ratio']}")
+    print(f"fenêtre de {len(window)} pages : GET successifs {sequential_ms:>7.2f} ms   MGET {mget_ms:>6.2f} ms ({prefetched} trouvées)")
+    print(f"panne L2 : hit L1 {'oui' if local_hit else 'NON'}, miss {'None' if first_miss is None else '?'} "
+          f"en {outage_first_ms:.1f} ms, puis {outage_next_us:.1f} µs/get (L2 mis de côté)")
+    print(f"\nstatistiques L2 : {report}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--page-kb", type=int, default=60)
+    parser.add_argument("--window", type=int, default=24)
+    parser.add_argument("--latency", type=float, default=0.0005)
+    bench(parser.parse_args())
@@ -0,0 +1,86 @@
+"""Benchmark de l'analyse HTML : dans la boucle d'événements vs pool de processus (PARSE_WORKERS).
+
+Analyse en parallèle des pages de série synthétiques (beaucoup d'épisodes) avec
+run_parser, pendant qu'une tâche témoin mesure le retard de la boucle d'événements.
+Affiche le débit (pages/s) et le pire retard de la boucle pour chaque taille de pool.
+
+Usage : python bench/bench_parse.py [--pages 64] [--episodes 300] [--workers 0,2,4]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main  # noqa: E402
+
+
+def series_page(episodes):
+    """Page de série proche d'Akwam : en-tête, description, puis un bloc par épisode."""
+    blocks = "".join(
+        f'<div class="bg-primary2"><h2 class="font-size-18">'
+        f'<a href="https://ak.sv/episode/{n}/slug-{n}">حلقة {n} : عنوان الحلقة</a></h2>'
+        f'<p class="entry-date">السبت 01 فبراير 2020 - 10:42 صباحا</p>'
+        f'<img src="https://img.ak.sv/thumb/{n}.jpg"/></div>'
+        for n in range(1, episodes + 1)
+    )
+    return (
+        '<html><h1 class="entry-title">مسلسل تجريبي</h1>'
+        '<div class="col-lg-3"><img src="https://img.ak.sv/thumb/260x380/1.jpg"/></div>'
+        '<div>السنة : 2020</div>'
+        '<div class="widget-body"><div class="text-white">' + "قصة المسلسل. " * 200 + '</div></div>'
+        '<a class="badge badge-pill badge-light">دراما</a>' + blocks + '</html>'
+    ).encode()
+
+
+async def watch_loop(stop, lags):
+    """Tâche témoin : se réveille toutes les 5 ms et note le retard constaté."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.005)
+        lags.append(time.perf_counter() - start - 0.005)
+
+
+async def run(workers, pages, content):
+    main.PARSE_WORKERS = workers
+    main.shutdown_parse_executor()
+    if workers:
+        # Démarrage des processus hors mesure
+        await asyncio.gather(*(main.run_parser(main.parse_listing_page, b"<html></html>") for _ in range(workers)))
+
+    stop = asyncio.Event()
+    lags = []
+    watcher = asyncio.create_task(watch_loop(stop, lags))
+    await asyncio.sleep(0.02)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(main.run_parser(main.parse_meta_page, content, "series") for _ in range(pages)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await watcher
+    main.shutdown_parse_executor()
+    assert all(len(r["videos"]) == len(results[0]["videos"]) for r in results)
+    return pages / elapsed, max(lags) * 1000 if lags else 0.0
+
+
+async def bench(args):
+    content = series_page(args.episodes)
+    print(f"Page de {len(content) // 1024} Ko, {args.episodes} épisodes, {args.pages} pages, {os.cpu_count()} cœurs")
+    print(f"{'workers':>8} {'pages/s':>10} {'retard max boucle (ms)':>24}")
+    for workers in args.workers:
+        rate, lag = await run(workers, args.pages, content)
+        label = "boucle" if workers == 0 else str(workers)
+        print(f"{label:>8} {rate:>10.1f} {lag:>24.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=64)
+    parser.add_argument("--episodes", type=int, default=300)
+    parser.add_argument("--workers", type=lambda v: [int(w) for w in v.split(",")], default=[0, 2, 4])
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(bench(parse_args()))
@@ -0,0 +1,115 @@
+"""Benchmark du transport HTTP : pool partagé (ancien comportement) vs pools par upstream.
+
+Lance deux faux upstreams locaux (pages "Akwam" rapides, API "FlareSolverr" lente),
+occupe FlareSolverr avec des requêtes longues et mesure en parallèle un fan-out de
+pages Akwam : débit, latences et nombre de connexions TCP ouvertes.
+
+Usage : python bench/bench_transport.py [--pages 400] [--fanout 64] [--solves 40]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+
+PAGE_BODY = b"<html>" + b"x" * 60000 + b"</html>"
+
+
+class FakeUpstream:
+    """Serveur HTTP/1.1 minimal avec keep-alive et latence fixe."""
+
+    def __init__(self, delay, body):
+        self.delay = delay
+        self.body = body
+        self.connections = 0
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                if length:
+                    await reader.readexactly(length)
+                self.requests += 1
+                await asyncio.sleep(self.delay)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\nConnection: keep-alive\r\n\r\n" % len(self.body))
+                writer.write(self.body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+
+async def run_scenario(name, akwam_client, solver_client, akwam_url, solver_url, args):
+    akwam, solver = args.servers
+    akwam.connections = solver.connections = 0
+    latencies = []
+    semaphore = asyncio.Semaphore(args.fanout)
+
+    async def fetch_page(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await akwam_client.get(f"{akwam_url}/movies?page={i}")
+            latencies.append(time.perf_counter() - start)
+
+    async def solve(i):
+        await solver_client.post(solver_url, json={"cmd": "request.get", "url": f"{akwam_url}/{i}"})
+
+    solves = [asyncio.create_task(solve(i)) for i in range(args.solves)]
+    await asyncio.sleep(0.05)  # Les résolutions occupent déjà le transport
+    start = time.perf_counter()
+    await asyncio.gather(*(fetch_page(i) for i in range(args.pages)))
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*solves)
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<22} {args.pages / elapsed:>9.1f} req/s   p50 {statistics.median(latencies) * 1000:>7.1f} ms   "
+          f"p95 {p95 * 1000:>7.1f} ms   connexions akwam {akwam.connections:>4}")
+
+
+async def bench(args):
+    akwam = FakeUpstream(args.page_delay, PAGE_BODY)
+    solver = FakeUpstream(args.solve_delay, b'{"status": "ok"}')
+    akwam_url = f"http://127.0.0.1:{await akwam.start()}"
+    solver_url = f"http://127.0.0.1:{await solver.start()}/v1"
+    args.servers = (akwam, solver)
+
+    print(f"{args.pages} pages (fan-out {args.fanout}) pendant {args.solves} résolutions FlareSolverr de {args.solve_delay}s\n")
+
+    shared = httpx.AsyncClient(timeout=60.0, follow_redirects=True)
+    await run_scenario("pool partagé (avant)", shared, shared, akwam_url, solver_url, args)
+    await shared.aclose()
+
+    akwam_client = main.build_http_client("akwam")
+    solver_client = main.build_http_client("flaresolverr")
+    await run_scenario("pools par upstream", akwam_client, solver_client, akwam_url, solver_url, args)
+    await akwam_client.aclose()
+    await solver_client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--fanout", type=int, default=64)
+    parser.add_argument("--solves", type=int, default=90)
+    parser.add_argument("--page-delay", type=float, default=0.02)
+    parser.add_argument("--solve-delay", type=float, default=2.0)
+    asyncio.run(bench(parser.parse_args()))
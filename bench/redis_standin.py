@@ -0,0 +1,165 @@
+"""Doublure Redis en mémoire : juste ce que le cache L2 utilise (RESP2).
+
+Commandes : PING, AUTH, SELECT, GET, SET (EX/PX), MGET, DEL, EXISTS, PTTL, DBSIZE,
+FLUSHDB, QUIT. Expiration paresseuse, une seule base. Latence ajoutée réglable
+pour simuler un Redis distant.
+
+Usage : python bench/redis_standin.py [--port 6379] [--latency 0.0005]
+        puis CACHE_L2_URL=redis://127.0.0.1:6379/0 uvicorn main:app
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+
+class RedisStandIn:
+    def __init__(self, latency=0.0, password=None):
+        self.latency = latency
+        self.password = password
+        self.data = {}  # clé -> (valeur, expiration monotone ou None)
+        self.commands = 0
+        self.server = None
+        self.loop = None
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args, state):
+        name = args[0].upper()
+        self.commands += 1
+        if self.password and not state["auth"] and name not in (b"AUTH", b"QUIT"):
+            return Exception("NOAUTH Authentication required.")
+        if name == b"PING":
+            return "PONG"
+        if name == b"AUTH":
+            state["auth"] = args[-1].decode() == self.password
+            return "OK" if state["auth"] else Exception("WRONGPASS invalid password")
+        if name in (b"SELECT", b"QUIT"):
+            return "OK"
+        if name == b"GET":
+            return self._get(args[1])
+        if name == b"MGET":
+            return [self._get(key) for key in args[1:]]
+        if name == b"SET":
+            expires = None
+            options = [arg.upper() for arg in args[3:]]
+            for option, value in zip(options, args[4:]):
+                if option == b"PX":
+                    expires = time.monotonic() + int(value) / 1000
+                elif option == b"EX":
+                    expires = time.monotonic() + int(value)
+            self.data[args[1]] = (args[2], expires)
+            return "OK"
+        if name == b"DEL":
+            return sum(self.data.pop(key, None) is not None for key in args[1:])
+        if name == b"EXISTS":
+            return sum(self._get(key) is not None for key in args[1:])
+        if name == b"PTTL":
+            if self._get(args[1]) is None:
+                return -2
+            expires = self.data[args[1]][1]
+            return -1 if expires is None else int((expires - time.monotonic()) * 1000)
+        if name == b"DBSIZE":
+            return len(self.data)
+        if name == b"FLUSHDB":
+            self.data.clear()
+            return "OK"
+        return Exception(f"ERR unknown command '{name.decode(errors='ignore')}'")
+
+    @staticmethod
+    def encode(reply):
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, Exception):
+            return b"-%s\r\n" % str(reply).encode()
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(RedisStandIn.encode(item) for item in reply)
+
+    async def read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # Commande "inline" (telnet, redis-cli minimal)
+        args = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def handle(self, reader, writer):
+        state = {"auth": False}
+        try:
+            while True:
+                args = await self.read_command(reader)
+                if not args:
+                    break
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                writer.write(self.encode(self.execute(args, state)))
+                await writer.drain()
+                if args[0].upper() == b"QUIT":
+                    break
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    def start_in_thread(self, host="127.0.0.1", port=0):
+        """Démarre le serveur dans un thread (boucle dédiée) ; renvoie le port."""
+        started = threading.Event()
+        result = {}
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            result["port"] = self.loop.run_until_complete(self.start(host, port))
+            started.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name="redis-standin", daemon=True).start()
+        started.wait()
+        return result["port"]
+
+    def stop(self):
+        """Arrête d'accepter et coupe les connexions ouvertes (simule une panne)."""
+        async def shutdown():
+            self.server.close()
+            for task in asyncio.all_tasks():
+                if task is not asyncio.current_task():
+                    task.cancel()
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latence ajoutée par commande (s)")
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    async def serve():
+        standin = RedisStandIn(args.latency, args.password)
+        port = await standin.start(args.host, args.port)
+        print(f"Doublure Redis sur {args.host}:{port}")
+        async with standin.server:
+            await standin.server.serve_forever()
+
+    asyncio.run(serve())
@@ -0,0 +1,457 @@
+"""Rejeu de trafic réel (logs d'accès uvicorn ou liste enregistrée) contre l'addon.
+
+L'application tourne dans le processus (ASGI, lifespan compris) et ses clients HTTP
+sont branchés sur des doublures locales d'Akwam et de FlareSolverr : pages générées
+à la volée, latences réglables, part de challenges Cloudflare (résolus par le faux
+FlareSolverr). Les requêtes sont rejouées avec leur rythme d'origine, accéléré
+(--speed 10) ou au plus vite (--speed 0 : --concurrency clients qui enchaînent les
+requêtes). Rapport : latences par route (p50/p95/p99), taux de succès du cache par
+fenêtre de temps et nombre de requêtes upstream. Une ligne de progression par fenêtre
+est écrite sur stderr pendant le rejeu.
+
+Au plus vite, le débit est surtout borné par l'ordonnanceur upstream (4 req/s par hôte
+par défaut) : --upstream-rate 0 le désactive pour mesurer l'addon seul.
+
+Formats d'entrée (détectés ligne par ligne) :
+  - log d'accès uvicorn : ... "GET /catalog/movie/akwam-movies.json HTTP/1.1" 200,
+    horodaté si la ligne commence par une date (docker logs -t), sinon --interval ;
+  - liste enregistrée JSONL : {"t": 12.5, "path": "/meta/series/akwam-s42.json"}.
+
+Usage :
+  python bench/replay.py --generate 2000 --out /tmp/trafic.jsonl
+  python bench/replay.py /tmp/trafic.jsonl [--speed 10] [--challenge-rate 0.1]
+  python bench/replay.py /tmp/trafic.jsonl --speed 0 --concurrency 64 --upstream-rate 0
+  python bench/replay.py access.log --interval 0.2 --solve-latency 6
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import parse_qs, quote, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+FLARESOLVERR_STANDIN = "http://flaresolverr.replay:8191/v1"
+# Doublures locales : pas de crawler ni de fichiers persistants, sauf si l'environnement les demande
+os.environ.setdefault("FLARESOLVERR_LINK", FLARESOLVERR_STANDIN)
+os.environ.setdefault("METADATA_CRAWL_ENABLE", "false")
+os.environ.setdefault("CACHE_SNAPSHOT_PATH", "")
+os.environ.setdefault("SEARCH_INDEX_PATH", "")
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+
+RGX_ACCESS = re.compile(r'"GET (\S+) HTTP/[\d.]+"')
+RGX_TIMESTAMP = re.compile(r'^\[?(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?)')
+SKIPPED_PREFIXES = ("/cache/", "/session/", "/trace/", "/static/", "/ready")
+CHALLENGE_PAGE = b'<html><head><title>Just a moment...</title></head><div id="cf-wrapper"></div></html>'
+TINY_JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 2048
+
+
+# Doublures d'Akwam et de FlareSolverr
+
+def entry(i, kind):
+    name = "فيلم" if kind == "movie" else "مسلسل"
+    return (f'<div class="col-lg-auto col-md-4 col-6 mb-12"><div class="entry-box">'
+            f'<a class="box" href="https://ak.sv/{kind}/{i}/slug-{i}"></a>'
+            f'<img class="img-fluid w-100 lazy" data-src="https://img.ak.sv/thumb/260x380/{i}.jpg"/>'
+            f'<span class="badge badge-pill badge-secondary">{2000 + i % 25}</span>'
+            f'<span class="badge badge-pill badge-light">دراما</span>'
+            f'<h3 class="entry-title">{name} رقم {i}</h3></div></div>')
+
+
+def listing(ids, kind):
+    return '<html><div class="widget-body row flex-wrap">' + "".join(entry(i, kind) for i in ids) + '</div></html>'
+
+
+def content_page(i, name):
+    """Page de film ou d'épisode : deux qualités, chacune avec son lien et sa taille."""
+    return (f'<html><h1 class="entry-title">{name}</h1>'
+            f'<div class="col-lg-3"><img src="https://img.ak.sv/thumb/260x380/{i}.jpg"/></div>'
+            f'<div>السنة : {2000 + i % 25}</div>'
+            f'<ul class="header-tabs tabs-qualities"><li><a href="#tab-5">1080p</a></li><li><a href="#tab-4">720p</a></li></ul>'
+            f'<div class="tab-content quality" id="tab-5"><a href="https://ak.sv/link/{i}1" class="link-btn">x</a>'
+            f'<span class="font-size-14 mr-auto">1.2 GB</span></div>'
+            f'<div class="tab-content quality" id="tab-4"><a href="https://ak.sv/link/{i}2" class="link-btn">x</a>'
+            f'<span class="font-size-14 mr-auto">700 MB</span></div>'
+            f'<a class="badge badge-pill badge-light">دراما</a>'
+            f'<div class="widget-body"><div class="text-white">{"قصة العمل. " * 400}</div></div></html>')
+
+
+def series_page(i):
+    """Page de série : 6 à 25 épisodes, identifiants i * 100 + n."""
+    episodes = "".join(
+        f'<div class="bg-primary2"><h2 class="font-size-18">'
+        f'<a href="https://ak.sv/episode/{i * 100 + n}/ep-{n}">حلقة {n} : عنوان</a></h2>'
+        f'<p class="entry-date">السبت 01 فبراير 2020 - 10:42 صباحا</p></div>'
+        for n in range(1, series_episodes(i) + 1)
+    )
+    return (f'<html><h1 class="entry-title">مسلسل رقم {i}</h1>'
+            f'<div class="col-lg-3"><img src="https://img.ak.sv/thumb/260x380/{i}.jpg"/></div>'
+            f'<div>السنة : {2000 + i % 25}</div>{episodes}</html>')
+
+
+def series_episodes(i):
+    return 6 + i % 20
+
+
+class StandIn:
+    """Akwam, FlareSolverr, hôte d'images et CDN simulés ; compte les requêtes reçues."""
+
+    def __init__(self, args):
+        self.akwam_latency = args.akwam_latency
+        self.solve_latency = args.solve_latency
+        self.challenge_rate = args.challenge_rate
+        self.rng = random.Random(args.seed)
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def akwam_page(self, url):
+        parts = urlsplit(url)
+        path = parts.path
+        params = parse_qs(parts.query)
+        page = int(params.get("page", ["1"])[0])
+        if match := re.match(r"^/(movies|series)$", path):
+            kind = "movie" if match.group(1) == "movies" else "series"
+            return "listing", listing(range((page - 1) * 24, page * 24), kind)
+        if path == "/search":
+            query = params.get("q", [""])[0]
+            kind = params.get("section", ["movie"])[0]
+            start = sum(map(ord, query)) % 5000
+            return "search", listing(range(start, start + 8), kind)
+        if match := re.match(r"^/movie/(\d+)", path):
+            return "movie", content_page(int(match.group(1)), f"فيلم رقم {match.group(1)}")
+        if match := re.match(r"^/series/(\d+)", path):
+            return "series", series_page(int(match.group(1)))
+        if match := re.match(r"^/episode/(\d+)", path):
+            return "episode", content_page(int(match.group(1)), f"حلقة {match.group(1)}")
+        if match := re.match(r"^/link/(\d+)", path):
+            return "link", f'<html><a href="https://ak.sv/download/{match.group(1)}/file">تحميل</a>{"y" * 8000}</html>'
+        if match := re.match(r"^/download/(\d+)", path):
+            return "download", f'<a href="https://s101.downet.net/download/{match.group(1)}abcd/file.mp4">go</a>'
+        return "home", "<html>home</html>"
+
+    def route(self, request):
+        """(latence simulée, réponse) pour une requête ; la compte au passage."""
+        host = request.url.host
+        if host == urlsplit(main.FLARESOLVERR_URL).hostname:
+            payload = json.loads(request.content or b"{}")
+            cmd = payload.get("cmd", "")
+            self.count(f"flaresolverr:{cmd}")
+            if cmd != "request.get":
+                return 0.0, httpx.Response(200, json={"status": "ok", "session": payload.get("session")})
+            _, body = self.akwam_page(payload["url"])
+            solution = {"response": body, "status": 200, "url": payload["url"]}
+            return self.solve_latency, httpx.Response(200, json={"status": "ok", "solution": solution})
+        if host.startswith("img."):
+            self.count("images")
+            return 0.0, httpx.Response(200, content=TINY_JPEG)
+        if host in main._akwam_hosts:
+            kind, body = self.akwam_page(str(request.url))
+            with self.lock:
+                challenged = self.rng.random() < self.challenge_rate
+            if challenged:
+                self.count("akwam:challenge")
+                return self.akwam_latency, httpx.Response(403, content=CHALLENGE_PAGE)
+            self.count(f"akwam:{kind}")
+            return self.akwam_latency, httpx.Response(200, text=body)
+        self.count("cdn")
+        return 0.0, httpx.Response(200, content=b"")
+
+
+class AsyncStandInTransport(httpx.AsyncBaseTransport):
+    def __init__(self, standin):
+        self.standin = standin
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        latency, response = self.standin.route(request)
+        if latency:
+            await asyncio.sleep(latency)
+        return response
+
+
+class SyncStandInTransport(httpx.BaseTransport):
+    def __init__(self, standin):
+        self.standin = standin
+
+    def handle_request(self, request):
+        request.read()
+        latency, response = self.standin.route(request)
+        if latency:
+            time.sleep(latency)
+        return response
+
+
+def install_standins(standin):
+    """Remplace les clients HTTP de l'application par des clients branchés sur les doublures."""
+    for upstream in list(main.http_clients):
+        main.http_clients[upstream] = httpx.AsyncClient(transport=AsyncStandInTransport(standin), follow_redirects=True)
+    for upstream in list(main.http_clients_sync):
+        main.http_clients_sync[upstream] = httpx.Client(transport=SyncStandInTransport(standin), follow_redirects=True)
+
+
+# Lecture du trafic
+
+def parse_timestamp(text):
+    return datetime.fromisoformat(text.replace(",", ".").replace(" ", "T")[:26]).timestamp()
+
+
+def load_records(path, interval):
+    """Liste [(décalage en secondes, chemin)] depuis un log uvicorn ou une liste JSONL."""
+    records = []
+    first = None
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        for number, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                offset, target = float(record.get("t", number * interval)), record["path"]
+            else:
+                access = RGX_ACCESS.search(line)
+                if not access:
+                    continue
+                target = access.group(1)
+                stamp = RGX_TIMESTAMP.match(line)
+                if stamp:
+                    moment = parse_timestamp(stamp.group(1))
+                    first = moment if first is None else first
+                    offset = moment - first
+                else:
+                    offset = len(records) * interval
+            if not target.startswith(SKIPPED_PREFIXES):
+                records.append((offset, target))
+    records.sort(key=lambda record: record[0])
+    return records
+
+
+def generate_records(count, seed):
+    """Trafic synthétique : défilement de catalogues, recherches, ouvertures de fiches, séries regardées d'affilée."""
+    rng = random.Random(seed)
+    popular = [1 / (rank ** 1.1) for rank in range(1, 481)]  # Les premières pages des catalogues
+    records = []
+    start = 0.0
+    while len(records) < count:
+        start += rng.expovariate(1 / 1.5)
+        t = start
+        kind = rng.choices(["scroll", "search", "movie", "binge"], weights=[35, 20, 25, 20])[0]
+        catalog_type = "movie" if kind in ("movie", "search") or rng.random() < 0.5 else "series"
+        catalog = f"/catalog/{catalog_type}/akwam-{'movies' if catalog_type == 'movie' else 'series'}"
+        if kind == "scroll":
+            for page in range(rng.randint(1, 6)):
+                records.append((t, f"{catalog}.json" if page == 0 else f"{catalog}/skip={page * 24}.json"))
+                t += rng.uniform(0.5, 3)
+        elif kind == "search":
+            query = rng.choice(["حب", "الحب", "العائلة", "رمضان", "الهيبة", "love", "batman", "2024"])
+            for n in range(2, len(query) + 1):
+                # Saisie progressive : une requête par caractère tapé
+                records.append((t, f"{catalog}-search/search={quote(query[:n])}.json"))
+                t += rng.uniform(0.15, 0.6)
+            records.append((t + 1, f"/meta/{catalog_type}/akwam-{catalog_type[0]}{sum(map(ord, query)) % 5000}.json"))
+        elif kind == "movie":
+            movie = rng.choices(range(480), weights=popular)[0]
+            records.append((t, f"/meta/movie/akwam-m{movie}.json"))
+            records.append((t + rng.uniform(2, 10), f"/stream/movie/akwam-m{movie}.json"))
+        else:
+            series = rng.choices(range(480), weights=popular)[0]
+            records.append((t, f"/meta/series/akwam-s{series}.json"))
+            first = rng.randint(1, series_episodes(series))
+            for episode in range(first, min(first + rng.randint(1, 4), series_episodes(series) + 1)):
+                t += rng.uniform(3, 40)
+                records.append((t, f"/stream/series/akwam-e{series * 100 + episode}.json"))
+    records.sort(key=lambda record: record[0])
+    return records[:count]
+
+
+# Rejeu et rapport
+
+def route_of(path):
+    if "/search=" in path:
+        return "search"
+    for route in ("catalog", "meta", "stream", "img"):
+        if f"/{route}/" in path:
+            return route
+    return "other"
+
+
+def percentile(values, ratio):
+    return values[min(len(values) - 1, int(len(values) * ratio))] if values else 0.0
+
+
+class Sampler:
+    """Relevé périodique du cache et des doublures : une ligne par fenêtre."""
+
+    def __init__(self, standin, window, total):
+        self.standin = standin
+        self.window = window
+        self.total = total
+        self.rows = []
+        self.requests = 0
+        self.latencies = []  # Latences de la fenêtre en cours (progression)
+
+    def snapshot(self):
+        with self.standin.lock:
+            upstream = sum(n for name, n in self.standin.counts.items() if name.startswith("akwam:"))
+            solves = self.standin.counts["flaresolverr:request.get"]
+        return (self.requests, main._cache_stats["hits"], main._cache_stats["misses"],
+                main._render_stats["hits"], main._render_stats["misses"], upstream, solves)
+
+    async def run(self, stop):
+        start = time.monotonic()
+        previous = self.snapshot()
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            current = self.snapshot()
+            row = (time.monotonic() - start, *(b - a for a, b in zip(previous, current)))
+            self.rows.append(row)
+            self.progress(row)
+            previous = current
+
+    def progress(self, row):
+        """Ligne de progression sur stderr (stdout est coupé sans --verbose)."""
+        t, requests, hits, misses, _, _, upstream, solves = row
+        latencies, self.latencies = sorted(self.latencies), []
+        cache = f"{100 * hits / (hits + misses):.0f}%" if hits + misses else "-"
+        print(f"[{t:6.0f} s] {self.requests}/{self.total} requêtes (+{requests}), "
+              f"p50 {percentile(latencies, 0.5) * 1000:.0f} ms, p95 {percentile(latencies, 0.95) * 1000:.0f} ms, "
+              f"cache {cache}, akwam +{upstream}, solves +{solves}", file=sys.stderr, flush=True)
+
+
+async def replay(records, args, standin):
+    latencies = {}
+    statuses = Counter()
+    sampler = Sampler(standin, args.window, len(records))
+    transport = httpx.ASGITransport(app=main.app)
+
+    async def send(client, path):
+        route = route_of(path)
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            statuses[(route, response.status_code)] += 1
+        except Exception:
+            statuses[(route, "erreur")] += 1
+        latency = time.perf_counter() - start
+        latencies.setdefault(route, []).append(latency)
+        sampler.latencies.append(latency)
+        sampler.requests += 1
+
+    async def worker(client, pending):
+        """Au plus vite : un client qui enchaîne les requêtes (la latence ne compte pas l'attente en file)."""
+        while pending:
+            _, path = pending.pop()
+            await send(client, path)
+
+    async with main.lifespan(main.app):
+        for _ in range(int(args.ready_timeout * 10)):
+            if main._readiness["ready"]:
+                break
+            await asyncio.sleep(0.1)
+        stop = asyncio.Event()
+        sampling = asyncio.create_task(sampler.run(stop))
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=None) as client:
+            start = time.monotonic()
+            if args.speed <= 0:
+                pending = list(reversed(records))
+                await asyncio.gather(*(worker(client, pending) for _ in range(max(1, args.concurrency))))
+            else:
+                tasks = []
+                for offset, path in records:
+                    delay = start + offset / args.speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    tasks.append(asyncio.create_task(send(client, path)))
+                await asyncio.gather(*tasks)
+            elapsed = time.monotonic() - start
+        stop.set()
+        await sampling
+    return latencies, statuses, sampler.rows, elapsed
+
+
+def print_report(records, latencies, statuses, rows, elapsed, standin):
+    print(f"\n{len(records)} requêtes rejouées en {elapsed:.1f} s\n")
+    print(f"{'route':<8} {'n':>6} {'erreurs':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for route in sorted(latencies):
+        values = sorted(latencies[route])
+        errors = sum(n for (r, status), n in statuses.items() if r == route and (status == "erreur" or status >= 400))
+        print(f"{route:<8} {len(values):>6} {errors:>8} {percentile(values, 0.5) * 1000:>9.1f} "
+              f"{percentile(values, 0.95) * 1000:>9.1f} {percentile(values, 0.99) * 1000:>9.1f} {values[-1] * 1000:>9.1f}")
+
+    print(f"\n{'t (s)':>7} {'requêtes':>9} {'cache %':>8} {'rendu %':>8} {'akwam':>7} {'solves':>7}")
+    for t, requests, hits, misses, render_hits, render_misses, upstream, solves in rows:
+        cache = f"{100 * hits / (hits + misses):.0f}" if hits + misses else "-"
+        render = f"{100 * render_hits / (render_hits + render_misses):.0f}" if render_hits + render_misses else "-"
+        print(f"{t:>7.0f} {requests:>9} {cache:>8} {render:>8} {upstream:>7} {solves:>7}")
+
+    print("\nRequêtes upstream reçues par les doublures :")
+    for name, count in sorted(standin.counts.items()):
+        print(f"  {name:<28} {count:>7}")
+    print(f"\nOrdonnanceur : {json.dumps(main.upstream_scheduler.stats, default=round)}")
+    print(f"Concurrence finale : {main.concurrency_limiter.limit:.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", nargs="?", help="Log d'accès uvicorn ou liste JSONL")
+    parser.add_argument("--generate", type=int, help="Écrit un trafic synthétique de N requêtes dans --out")
+    parser.add_argument("--out", default="trafic.jsonl")
+    parser.add_argument("--speed", type=float, default=1.0, help="Accélération du rythme d'origine (0 = au plus vite)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Clients simultanés avec --speed 0")
+    parser.add_argument("--upstream-rate", type=float, help="Débit upstream par hôte (req/s, 0 = illimité ; défaut : config)")
+    parser.add_argument("--interval", type=float, default=0.1, help="Écart entre les lignes d'un log non horodaté")
+    parser.add_argument("--window", type=float, default=10.0, help="Fenêtre du relevé du cache et de la progression (s)")
+    parser.add_argument("--akwam-latency", type=float, default=0.08)
+    parser.add_argument("--solve-latency", type=float, default=4.0)
+    parser.add_argument("--challenge-rate", type=float, default=0.0, help="Part des pages Akwam renvoyant un challenge")
+    parser.add_argument("--ready-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="Garder les logs de l'application")
+    return parser.parse_args()
+
+
+def run(args):
+    if args.generate:
+        with open(args.out, "w", encoding="utf-8") as f:
+            for offset, path in generate_records(args.generate, args.seed):
+                f.write(json.dumps({"t": round(offset, 3), "path": path}, ensure_ascii=False) + "\n")
+        print(f"{args.generate} requêtes écrites dans {args.out}")
+        return
+    if not args.log:
+        sys.exit("Indiquer un log à rejouer ou --generate N")
+
+    records = load_records(args.log, args.interval)
+    standin = StandIn(args)
+    install_standins(standin)
+    if args.upstream_rate is not None:
+        main.upstream_scheduler.rate = args.upstream_rate
+        main.upstream_scheduler.buckets.clear()
+    span = records[-1][0] if records else 0
+    rate = f"{main.upstream_scheduler.rate:g} req/s par hôte" if main.upstream_scheduler.rate > 0 else "illimité"
+    print(f"{len(records)} requêtes sur {span:.0f} s (vitesse {args.speed or 'max'}, upstream {rate})")
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        results = asyncio.run(replay(records, args, standin))
+    print_report(records, *results, standin)
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -1,87 +1,808 @@
 import base64
 import os
 from fastapi import FastAPI, Request, HTTPException, Query, Path
-from fastapi.responses import JSONResponse, RedirectResponse, FileResponse
+from fastapi.responses import JSONResponse, RedirectResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
 from dotenv import load_dotenv
 import httpx
+import httpcore
 import asyncio
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import threading
+import multiprocessing
+import socket
+import queue
+import zlib
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
 from bs4 import BeautifulSoup
 from functools import lru_cache
-from datetime import datetime, timedelta
+from contextlib import contextmanager, asynccontextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+try:
+    import brotli  # Optionnel : variantes br des réponses
+except ImportError:
+    brotli = None
+try:
+    from PIL import Image  # Optionnel : réduction des affiches du proxy d'images
+except ImportError:
+    Image = None
 import hashlib
+import hmac
+import ipaddress
+import codecs
+import io
+import gzip
+import sqlite3
+import uuid
+import contextvars
+from collections import OrderedDict
+from urllib.parse import quote, unquote, urlsplit, urlunsplit, parse_qsl, urlencode
 
 load_dotenv()
 
-app = FastAPI()
+# lifespan est défini en fin de fichier, une fois toutes les étapes de démarrage déclarées
+app = FastAPI(lifespan=lambda app: lifespan(app))
+
+# Clients HTTP globaux : un pool de connexions par classe d'upstream
+# - akwam : pages Akwam (catalogues, fiches, /link/, /download/)
+# - flaresolverr : API JSON de FlareSolverr (requêtes longues, peu de parallélisme)
+# - cdn : hébergeurs des fichiers et images
+try:
+    import h2  # noqa: F401 (nécessaire pour http2=True dans httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Cache DNS des clients upstream : évite une résolution à chaque nouvelle connexion (0 = désactivé).
+# Limité à nos pools httpx (backend réseau httpcore) : socket.getaddrinfo reste intact pour le reste du processus.
+# getaddrinfo ne donne pas le TTL réel : DNS_CACHE_TTL en est la borne haute, et une adresse
+# qui refuse la connexion est oubliée aussitôt.
+DNS_CACHE_TTL = int(os.getenv("DNS_CACHE_TTL_SECONDS", 60))
+DNS_CACHE_MAX_ENTRIES = int(os.getenv("DNS_CACHE_MAX_ENTRIES", 256))
+_dns_cache = OrderedDict()  # (hôte, port) -> (expiration monotone, [adresses IP])
+_dns_lock = threading.Lock()
+
+def dns_cached(host, port):
+    if DNS_CACHE_TTL <= 0:
+        return None
+    with _dns_lock:
+        cached = _dns_cache.get((host, port))
+        if cached is None:
+            return None
+        if cached[0] <= time.monotonic():
+            del _dns_cache[(host, port)]
+            return None
+        _dns_cache.move_to_end((host, port))
+        return cached[1]
+
+def dns_store(host, port, infos):
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    if DNS_CACHE_TTL > 0 and addresses:
+        with _dns_lock:
+            _dns_cache[(host, port)] = (time.monotonic() + DNS_CACHE_TTL, addresses)
+            _dns_cache.move_to_end((host, port))
+            while len(_dns_cache) > DNS_CACHE_MAX_ENTRIES:
+                _dns_cache.popitem(last=False)
+    return addresses
+
+def dns_forget(host, port):
+    with _dns_lock:
+        _dns_cache.pop((host, port), None)
+
+def is_ip_address(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+class CachedDNSBackend(httpcore.SyncBackend):
+    """Backend réseau des clients sync : connexion aux adresses en cache, SNI inchangé (nom d'origine)."""
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        if is_ip_address(host) or DNS_CACHE_TTL <= 0:
+            return super().connect_tcp(host, port, timeout, local_address, socket_options)
+        addresses = dns_cached(host, port) or dns_store(host, port, socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        for index, address in enumerate(addresses):
+            try:
+                return super().connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                if index == len(addresses) - 1:
+                    dns_forget(host, port)
+                    raise
+
+class AsyncCachedDNSBackend(httpcore.AnyIOBackend):
+    """Équivalent async : la résolution passe par loop.getaddrinfo (hors de la boucle)."""
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        if is_ip_address(host) or DNS_CACHE_TTL <= 0:
+            return await super().connect_tcp(host, port, timeout, local_address, socket_options)
+        addresses = dns_cached(host, port)
+        if not addresses:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            addresses = dns_store(host, port, infos)
+        for index, address in enumerate(addresses):
+            try:
+                return await super().connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                if index == len(addresses) - 1:
+                    dns_forget(host, port)
+                    raise
+
+HTTP_TRANSPORT_DEFAULTS = {
+    "akwam": {"MAX_CONNECTIONS": 20, "MAX_KEEPALIVE": 20, "KEEPALIVE_EXPIRY": 30, "CONNECT_TIMEOUT": 10, "READ_TIMEOUT": 30, "HTTP2": "true"},
+    "flaresolverr": {"MAX_CONNECTIONS": 8, "MAX_KEEPALIVE": 8, "KEEPALIVE_EXPIRY": 120, "CONNECT_TIMEOUT": 5, "READ_TIMEOUT": 60, "HTTP2": "false"},
+    "cdn": {"MAX_CONNECTIONS": 20, "MAX_KEEPALIVE": 5, "KEEPALIVE_EXPIRY": 15, "CONNECT_TIMEOUT": 5, "READ_TIMEOUT": 15, "HTTP2": "true"},
+}
+
+def transport_setting(upstream, name):
+    """Lit HTTP_<UPSTREAM>_<NAME> (ex: HTTP_AKWAM_MAX_CONNECTIONS) avec la valeur par défaut de la classe."""
+    return os.getenv(f"HTTP_{upstream.upper()}_{name}", str(HTTP_TRANSPORT_DEFAULTS[upstream][name]))
+
+def build_http_client(upstream, sync=False):
+    """Crée le client httpx (async ou sync) d'une classe d'upstream."""
+    limits = httpx.Limits(
+        max_connections=int(transport_setting(upstream, "MAX_CONNECTIONS")),
+        max_keepalive_connections=int(transport_setting(upstream, "MAX_KEEPALIVE")),
+        keepalive_expiry=float(transport_setting(upstream, "KEEPALIVE_EXPIRY")),
+    )
+    read_timeout = float(transport_setting(upstream, "READ_TIMEOUT"))
+    timeout = httpx.Timeout(read_timeout, connect=float(transport_setting(upstream, "CONNECT_TIMEOUT")))
+    http2 = HTTP2_AVAILABLE and transport_setting(upstream, "HTTP2").lower() == "true"
+    if sync:
+        transport = httpx.HTTPTransport(limits=limits, http2=http2)
+        install_dns_backend(transport, CachedDNSBackend())
+        return httpx.Client(transport=transport, timeout=timeout, follow_redirects=True)
+    transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+    install_dns_backend(transport, AsyncCachedDNSBackend())
+    return httpx.AsyncClient(transport=transport, timeout=timeout, follow_redirects=True)
+
+_dns_backend_warned = False
+
+def install_dns_backend(transport, backend):
+    """Branche le backend à cache DNS sur le pool httpcore du transport.
+
+    httpx n'expose pas le backend du pool : on passe par des attributs privés, vérifiés ici
+    (versions épinglées dans requirements.txt). S'ils changent, on le signale et on continue sans cache DNS.
+    """
+    global _dns_backend_warned
+    if DNS_CACHE_TTL <= 0:
+        return
+    pool = getattr(transport, "_pool", None)
+    if pool is None or not hasattr(pool, "_network_backend"):
+        if not _dns_backend_warned:
+            _dns_backend_warned = True
+            print(f"⚠️ Cache DNS désactivé : pool httpx/httpcore inattendu "
+                  f"(httpx {httpx.__version__}, httpcore {httpcore.__version__})")
+        return
+    pool._network_backend = backend
+
+http_clients = {upstream: build_http_client(upstream) for upstream in HTTP_TRANSPORT_DEFAULTS}  # Pour les routes async
+http_clients_sync = {upstream: build_http_client(upstream, sync=True) for upstream in HTTP_TRANSPORT_DEFAULTS}  # Pour les threads
+
+# Hôtes servis par Akwam (complété avec le domaine obtenu après redirection de ak.sv)
+_akwam_hosts = {"ak.sv"}
+
+def add_akwam_host(host):
+    if host and host not in _akwam_hosts:
+        _akwam_hosts.add(host)
+        canonical_url.cache_clear()  # Les formes déjà calculées pour cet hôte ne sont plus canoniques
+
+def upstream_class(url):
+    """Détermine la classe d'upstream (et donc le pool) d'une URL."""
+    host = urlsplit(url).hostname or ""
+    if host == urlsplit(FLARESOLVERR_URL).hostname:
+        return "flaresolverr"
+    if host in _akwam_hosts or "akwam" in host:
+        return "akwam"
+    return "cdn"
 
-# Clients HTTP globaux
-http_client = httpx.AsyncClient(timeout=60.0, follow_redirects=True)  # Pour les routes async
-http_client_sync = httpx.Client(timeout=60.0, follow_redirects=True)  # Pour les threads
+def get_http_client(url, sync=False):
+    return (http_clients_sync if sync else http_clients)[upstream_class(url)]
 
 # Configuration FlareSolverr
 FLARESOLVERR_ENABLE = os.getenv("FLARESOLVERR_ENABLE", "true").lower() == "true"
 FLARESOLVERR_URL = os.getenv("FLARESOLVERR_LINK", "http://flaresolverr:8191/v1")
 FLARESOLVERR_AUTO = os.getenv("FLARESOLVERR_AUTO", "true").lower() == "true"  # Utiliser FlareSolverr seulement si challenge détecté
 
-# Cache simple en mémoire avec expiration
-_cache = {}
+# Cache simple en mémoire avec expiration (ordre LRU : les plus anciens en tête)
+_cache = OrderedDict()
 _cache_expiry = {}
+_cache_lock = threading.RLock()
 CACHE_TTL = int(os.getenv("CACHE_TTL_SECONDS", 3600))  # 1 heure par défaut
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 5000))  # 0 = illimité
+CACHE_ADMISSION = os.getenv("CACHE_ADMISSION", "tinylfu").lower()  # "tinylfu" ou "always"
+_cache_stats = {"hits": 0, "misses": 0, "l2_hits": 0, "admitted": 0, "rejected": 0, "evicted": 0}
+
+class FrequencySketch:
+    """Count-Min sketch à compteurs 4 bits avec vieillissement, comme dans TinyLFU.
+
+    Estime combien de fois une clé a été demandée récemment, pour un coût
+    mémoire fixe (depth * width octets) quel que soit le nombre de clés vues.
+    """
+    SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+
+    def __init__(self, width):
+        self.width = 1 << max(4, (width - 1).bit_length())  # Puissance de 2
+        self.mask = self.width - 1
+        self.rows = [bytearray(self.width) for _ in self.SEEDS]
+        self.additions = 0
+        self.sample_size = 10 * self.width
+
+    def _indexes(self, key):
+        h = hash(key)
+        return [((h ^ seed) * 0x45D9F3B >> 16) & self.mask for seed in self.SEEDS]
+
+    def increment(self, key):
+        for row, index in zip(self.rows, self._indexes(key)):
+            if row[index] < 15:
+                row[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            # Vieillissement : diviser tous les compteurs par 2
+            self.rows = [bytearray(count >> 1 for count in row) for row in self.rows]
+            self.additions //= 2
+
+    def frequency(self, key):
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+_frequency_sketch = FrequencySketch(max(CACHE_MAX_ENTRIES, 1024))
 
 # Gestion des sessions FlareSolverr (garde les cookies Cloudflare)
 _flaresolverr_session_id = None
 _session_last_used = None
 SESSION_TIMEOUT = 600  # 10 minutes d'inactivité max
 
+def on_event_loop():
+    """Vrai dans le thread de la boucle d'événements (où rien de bloquant ne doit tourner)."""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
 def get_cache(key):
-    """Récupère une valeur du cache si elle existe et n'est pas expirée."""
-    if key in _cache and key in _cache_expiry:
-        if datetime.now() < _cache_expiry[key]:
-            print(f"✓ Cache hit for: {key[:50]}...")
-            return _cache[key]
-        else:
-            # Expirée, on la supprime
-            del _cache[key]
-            del _cache_expiry[key]
+    """Récupère une valeur du cache si elle existe et n'est pas expirée (L1 local, puis L2 partagé).
+
+    Sur la boucle d'événements, L1 seul : le L2 est un aller-retour réseau bloquant
+    (le code async passe par get_cache_async).
+    """
+    value = get_local_cache(key)
+    if value is not None or not cache_l2 or on_event_loop():
+        return value
+    return get_l2_cache(key)
+
+async def get_cache_async(key):
+    """get_cache pour le code async : la lecture L2 se fait dans un thread."""
+    value = get_local_cache(key)
+    if value is not None or not cache_l2 or not cache_l2.ready(key):
+        return value
+    return await run_in_thread(get_l2_cache, key)
+
+def get_local_cache(key):
+    """Lecture du cache local (L1) seul."""
+    with _cache_lock:
+        _frequency_sketch.increment(key)
+        if key in _cache and key in _cache_expiry:
+            if datetime.now() < _cache_expiry[key]:
+                print(f"✓ Cache hit for: {key[:50]}...")
+                _cache.move_to_end(key)
+                _cache_stats["hits"] += 1
+                record_render_source(key)
+                return _cache[key]
+            else:
+                # Expirée, on la supprime
+                del _cache[key]
+                del _cache_expiry[key]
+        _cache_stats["misses"] += 1
     return None
 
-def set_cache(key, value):
-    """Stocke une valeur dans le cache avec expiration."""
-    _cache[key] = value
-    _cache_expiry[key] = datetime.now() + timedelta(seconds=CACHE_TTL)
+def get_l2_cache(key):
+    """Lecture du L2 partagé (bloquante, hors boucle) ; un succès est recopié dans le L1."""
+    found = cache_l2.get(key)
+    if found is None:
+        return None
+    value, expires_at = found
+    print(f"✓ Cache L2 hit for: {key[:50]}...")
+    store_local_cache(key, value, expires_at)
+    _cache_stats["l2_hits"] += 1
+    return value
+
+def set_cache(key, value, ttl=None):
+    """Stocke une valeur dans le cache avec expiration (L1 et, en écriture différée, L2)."""
+    expires_at = datetime.now() + timedelta(seconds=CACHE_TTL if ttl is None else ttl)
+    store_local_cache(key, value, expires_at)
+    if cache_l2:
+        cache_l2.set_later(key, value, expires_at)
+
+def store_local_cache(key, value, expires_at):
+    """Stocke une valeur dans le cache local (L1).
+
+    Cache plein : la clé n'entre qu'en évinçant l'entrée la moins récemment utilisée,
+    et seulement si elle est plus fréquemment demandée qu'elle (admission TinyLFU).
+    """
+    with _cache_lock:
+        if key not in _cache and CACHE_MAX_ENTRIES > 0 and len(_cache) >= CACHE_MAX_ENTRIES:
+            victim = next(iter(_cache))
+            victim_expired = datetime.now() >= _cache_expiry.get(victim, datetime.min)
+            if (not victim_expired and CACHE_ADMISSION == "tinylfu"
+                    and _frequency_sketch.frequency(key) <= _frequency_sketch.frequency(victim)):
+                # Clé froide (vue une seule fois) : elle ne chasse pas une entrée plus demandée
+                _cache_stats["rejected"] += 1
+                return
+            delete_cache(victim)
+            _cache_stats["evicted"] += 1
+        _cache[key] = value
+        _cache.move_to_end(key)
+        _cache_expiry[key] = expires_at
+        _cache_stats["admitted"] += 1
+        record_render_source(key)
+
+def delete_cache(key):
+    """Supprime une entrée du cache local (sans erreur si absente)."""
+    with _cache_lock:
+        _cache.pop(key, None)
+        _cache_expiry.pop(key, None)
+
+def invalidate_cache(key):
+    """Supprime une entrée partout : cache local et L2 partagé (les autres nœuds ne la reverront plus)."""
+    delete_cache(key)
+    if cache_l2:
+        cache_l2.delete_later(key)
+
+def prefetch_cache(keys):
+    """Charge en un seul aller-retour (MGET) les clés absentes du L1 mais présentes dans le L2."""
+    if not cache_l2:
+        return 0
+    with _cache_lock:
+        now = datetime.now()
+        missing = [key for key in keys if not (key in _cache and _cache_expiry.get(key, now) > now)]
+    found = cache_l2.get_many(missing) if missing else {}
+    for key, (value, expires_at) in found.items():
+        store_local_cache(key, value, expires_at)
+    return len(found)
+
+# Forme canonique des URL : toutes les variantes équivalentes partagent la même clé de cache
+RGX_CONTENT_PATH = re.compile(r'^/(movie|series|episode)/(\d+)(?:/.*)?$')
+CANONICAL_TRACK_MAX = 10000  # Formes canoniques suivies pour compter les doublons fusionnés
+CANONICAL_MAX_VARIANTS = 8
+
+_canonical_variants = OrderedDict()  # forme canonique -> variantes brutes vues (la première en tête)
+_canonical_lock = threading.Lock()
+_canonical_stats = {"merged_lookups": 0, "merged_variants": 0}
+
+@lru_cache(maxsize=20000)
+def canonical_url(url):
+    """https, hôte Akwam unique (ak.sv), sans slash final ni fragment, paramètres triés, espaces en %20,
+    et pages de contenu réduites à /type/identifiant (le slug varie selon la page d'origine)."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if host in _akwam_hosts:
+        host = "ak.sv"
+    elif parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r'/{2,}', '/', quote(unquote(parts.path), safe="/-._~!$&'()*,;=:@")).rstrip('/')
+    content = RGX_CONTENT_PATH.match(path)
+    if content:
+        path = f"/{content.group(1)}/{content.group(2)}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)), quote_via=quote)
+    return urlunsplit(("https", host, path, query, ""))
+
+def track_canonical(raw, canonical):
+    """Compte les accès par une variante différente de la première vue pour la même forme canonique."""
+    with _canonical_lock:
+        variants = _canonical_variants.get(canonical)
+        if variants is None:
+            _canonical_variants[canonical] = [raw]
+            if len(_canonical_variants) > CANONICAL_TRACK_MAX:
+                _canonical_variants.popitem(last=False)
+            return
+        if raw != variants[0]:
+            _canonical_stats["merged_lookups"] += 1
+            if raw not in variants and len(variants) < CANONICAL_MAX_VARIANTS:
+                variants.append(raw)
+                _canonical_stats["merged_variants"] += 1
+
+def canonical_report(limit=5):
+    """Statistiques de fusion et quelques exemples de variantes regroupées."""
+    with _canonical_lock:
+        examples = {canonical: variants[:] for canonical, variants in _canonical_variants.items() if len(variants) > 1}
+    return {
+        "tracked": len(_canonical_variants),
+        **_canonical_stats,
+        "examples": dict(list(examples.items())[-limit:]),
+    }
 
 def make_cache_key(url):
-    """Crée une clé de cache à partir d'une URL."""
+    """Crée une clé de cache à partir d'une URL (sous sa forme canonique)."""
+    if url.startswith(("http://", "https://")):
+        canonical = canonical_url(url)
+        track_canonical(url, canonical)
+        url = canonical
     return hashlib.md5(url.encode()).hexdigest()
 
-def is_cloudflare_challenge(response_content, status_code):
-    """Détecte si la réponse contient un challenge Cloudflare."""
-    # Codes HTTP typiques de Cloudflare
-    if status_code in [403, 503, 429]:
+# Instantané du cache sur disque (rechargé au démarrage, écrit à l'arrêt)
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "")  # Fichier .json.gz (vide = désactivé)
+
+def encode_cache_value(value):
+    """Convertit une valeur du cache en JSON (réponses, tuples et octets balisés)."""
+    if isinstance(value, FlareSolverrResponse):
+        return {"__response__": [base64.b64encode(value.content).decode(), value.status_code, value.url]}
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode()}
+    if isinstance(value, tuple):
+        return {"__tuple__": [encode_cache_value(item) for item in value]}
+    if isinstance(value, list):
+        return [encode_cache_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: encode_cache_value(item) for key, item in value.items()}
+    return value
+
+def decode_cache_value(value):
+    """Inverse de encode_cache_value."""
+    if isinstance(value, list):
+        return [decode_cache_value(item) for item in value]
+    if isinstance(value, dict):
+        if "__response__" in value:
+            content, status_code, url = value["__response__"]
+            return FlareSolverrResponse(base64.b64decode(content), status_code, url)
+        if "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+        if "__tuple__" in value:
+            return tuple(decode_cache_value(item) for item in value["__tuple__"])
+        return {key: decode_cache_value(item) for key, item in value.items()}
+    return value
+
+def save_cache_snapshot(path):
+    """Écrit les entrées encore valides, de la moins à la plus récemment utilisée."""
+    now = datetime.now()
+    with _cache_lock:
+        entries = [[key, encode_cache_value(value), _cache_expiry[key].timestamp()]
+                   for key, value in _cache.items() if _cache_expiry.get(key, now) > now]
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump({"version": 1, "entries": entries}, f)
+    os.replace(tmp_path, path)
+    print(f"💾 Instantané du cache écrit: {len(entries)} entrées")
+    return len(entries)
+
+def load_cache_snapshot(path):
+    """Recharge un instantané en conservant les expirations d'origine."""
+    if not os.path.exists(path):
+        return 0
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    now = datetime.now()
+    loaded = 0
+    with _cache_lock:
+        for key, value, expiry in data.get("entries", []):
+            expires_at = datetime.fromtimestamp(expiry)
+            if expires_at <= now:
+                continue
+            if CACHE_MAX_ENTRIES > 0 and len(_cache) >= CACHE_MAX_ENTRIES:
+                break
+            _cache[key] = decode_cache_value(value)
+            _cache_expiry[key] = expires_at
+            loaded += 1
+    print(f"💾 Instantané du cache rechargé: {loaded} entrées")
+    return loaded
+
+# Cache L2 partagé entre les répliques (protocole Redis) : pages et liens résolus une fois pour tous les nœuds
+CACHE_L2_URL = os.getenv("CACHE_L2_URL", "")  # redis://[:motdepasse@]hôte:port/base (vide = désactivé)
+CACHE_L2_PREFIX = os.getenv("CACHE_L2_PREFIX", "akwam:")
+CACHE_L2_TIMEOUT = float(os.getenv("CACHE_L2_TIMEOUT_SECONDS", 0.2))  # Le L2 doit rester plus rapide qu'Akwam
+CACHE_L2_RETRY = float(os.getenv("CACHE_L2_RETRY_SECONDS", 10))  # Pause après une erreur avant de réessayer
+CACHE_L2_POOL = int(os.getenv("CACHE_L2_POOL", 8))  # Connexions gardées ouvertes
+CACHE_L2_QUEUE = int(os.getenv("CACHE_L2_QUEUE", 1000))  # Écritures en attente au plus (au-delà : abandonnées)
+CACHE_L2_COMPRESS_LEVEL = int(os.getenv("CACHE_L2_COMPRESS_LEVEL", 6))
+CACHE_L2_COMPRESS_MIN = 512  # Octets : en dessous, zlib ne gagne rien
+
+class RespError(Exception):
+    """Erreur renvoyée par le serveur (-ERR ...)."""
+
+class RespConnection:
+    """Connexion minimale au protocole Redis (RESP2) : commandes et pipelines."""
+
+    def __init__(self, host, port, password=None, db=0, timeout=CACHE_L2_TIMEOUT):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.settimeout(timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if password:
+            self.execute("AUTH", password)
+        if db:
+            self.execute("SELECT", db)
+
+    @staticmethod
+    def encode(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connexion L2 fermée")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Réponse L2 tronquée")
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self.read_reply() for _ in range(count)]
+        raise ConnectionError(f"Réponse L2 illisible: {line[:20]!r}")
+
+    def pipeline(self, commands):
+        """Envoie plusieurs commandes d'un coup puis lit les réponses (un seul aller-retour)."""
+        self.sock.sendall(b"".join(self.encode(command) for command in commands))
+        return [self.read_reply() for _ in commands]
+
+    def execute(self, *args):
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+class RedisCache:
+    """Cache L2 : valeurs compressées (zlib) avec leur date d'expiration, lectures synchrones
+    courtes, écritures différées dans un thread. Au moindre incident réseau le L2 est mis de côté
+    CACHE_L2_RETRY secondes : l'application continue avec son seul cache local.
+    """
+
+    def __init__(self, url, prefix=CACHE_L2_PREFIX):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.strip("/") or 0)
+        self.prefix = prefix
+        self.idle = []
+        self.lock = threading.Lock()  # Protège idle, down_until et absent (partagés entre threads)
+        self.down_until = 0.0
+        self.writes = queue.Queue(maxsize=CACHE_L2_QUEUE)
+        self.writer = None
+        self.absent = {}  # Clés que le dernier MGET n'a pas trouvées -> fin de validité (évite un GET juste après)
+        self.stats = {"hits": 0, "misses": 0, "mget_batches": 0, "writes": 0, "deletes": 0, "dropped_writes": 0,
+                      "errors": 0, "skipped": 0, "bytes_raw": 0, "bytes_stored": 0}
+
+    # Connexions
+    def available(self):
+        with self.lock:
+            down = time.monotonic() < self.down_until
+        if down:
+            self.stats["skipped"] += 1
+            return False
         return True
-    
-    # Vérifier le contenu de la page
-    if isinstance(response_content, bytes):
-        content_str = response_content.decode('utf-8', errors='ignore').lower()
-    else:
-        content_str = str(response_content).lower()
-    
-    # Signatures Cloudflare
-    cloudflare_signatures = [
-        'challenge-platform',
-        'cloudflare',
-        'cf-wrapper',
-        'cf_chl_opt',
-        'checking your browser',
-        'just a moment',
-        '__cf_chl_jschl_tk__'
-    ]
-    
-    return any(sig in content_str for sig in cloudflare_signatures)
+
+    def _run(self, commands):
+        """Exécute un pipeline sur une connexion du pool ; None (et L2 mis de côté) en cas d'erreur réseau."""
+        with self.lock:
+            connection = self.idle.pop() if self.idle else None
+        try:
+            if connection is None:
+                connection = RespConnection(self.host, self.port, self.password, self.db)
+            replies = connection.pipeline(commands)
+        except (OSError, ValueError, RespError) as e:
+            if connection:
+                connection.close()
+            self.stats["errors"] += 1
+            with self.lock:
+                self.down_until = max(self.down_until, time.monotonic() + CACHE_L2_RETRY)
+            print(f"⚠️ Cache L2 indisponible ({e}), cache local seul pendant {CACHE_L2_RETRY:.0f}s")
+            return None
+        with self.lock:
+            if len(self.idle) < CACHE_L2_POOL:
+                self.idle.append(connection)
+                connection = None
+        if connection:
+            connection.close()
+        return replies
+
+    def close(self):
+        if self.writer:
+            self.writes.put(None)
+            self.writer.join(timeout=2)
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+    # Sérialisation
+    def pack(self, value, expires_at):
+        raw = json.dumps({"e": expires_at.timestamp(), "v": encode_cache_value(value)}, separators=(",", ":")).encode()
+        self.stats["bytes_raw"] += len(raw)
+        data = b"z" + zlib.compress(raw, CACHE_L2_COMPRESS_LEVEL) if len(raw) >= CACHE_L2_COMPRESS_MIN else b"j" + raw
+        self.stats["bytes_stored"] += len(data)
+        return data
+
+    @staticmethod
+    def unpack(data):
+        raw = zlib.decompress(data[1:]) if data[:1] == b"z" else data[1:]
+        payload = json.loads(raw)
+        expires_at = datetime.fromtimestamp(payload["e"])
+        if expires_at <= datetime.now():
+            return None
+        return decode_cache_value(payload["v"]), expires_at
+
+    def _decode_reply(self, reply):
+        if reply is None or isinstance(reply, RespError):
+            self.stats["misses"] += 1
+            return None
+        try:
+            found = self.unpack(reply)
+        except (ValueError, KeyError, zlib.error):
+            found = None
+        self.stats["hits" if found else "misses"] += 1
+        return found
+
+    # Lectures
+    def ready(self, key):
+        """Vrai si un GET de `key` irait jusqu'au serveur (ni absence récente, ni L2 mis de côté).
+
+        Permet au code async d'éviter un passage par un thread pour une lecture sans réseau.
+        """
+        now = time.monotonic()
+        with self.lock:
+            return self.absent.get(key, 0) <= now and now >= self.down_until
+
+    def get(self, key):
+        """(valeur, expiration) ou None."""
+        with self.lock:
+            absent_until = self.absent.pop(key, 0)
+        if absent_until > time.monotonic():
+            self.stats["misses"] += 1
+            return None
+        if not self.available():
+            return None
+        replies = self._run([("GET", self.prefix + key)])
+        return self._decode_reply(replies[0]) if replies else None
+
+    def get_many(self, keys):
+        """{clé: (valeur, expiration)} pour les clés présentes, en un seul MGET."""
+        if not keys or not self.available():
+            return {}
+        replies = self._run([("MGET", *(self.prefix + key for key in keys))])
+        if not replies or not isinstance(replies[0], list):
+            return {}
+        self.stats["mget_batches"] += 1
+        found = {}
+        missing = []
+        for key, reply in zip(keys, replies[0]):
+            entry = self._decode_reply(reply)
+            if entry:
+                found[key] = entry
+            else:
+                missing.append(key)
+        absent_until = time.monotonic() + 1.0
+        with self.lock:
+            if len(self.absent) > 10000:
+                self.absent.clear()
+            for key in missing:
+                self.absent[key] = absent_until
+        return found
+
+    # Écritures (différées : ni sérialisation ni réseau sur le chemin de la requête)
+    def _enqueue(self, operation):
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._write_loop, name="cache-l2-writer", daemon=True)
+            self.writer.start()
+        try:
+            self.writes.put_nowait(operation)
+        except queue.Full:
+            self.stats["dropped_writes"] += 1
+
+    def set_later(self, key, value, expires_at):
+        self._enqueue(("set", key, value, expires_at))
+
+    def delete_later(self, key):
+        self._enqueue(("del", key))
+
+    def _write_loop(self):
+        while True:
+            operation = self.writes.get()
+            if operation is None:
+                return
+            batch = [operation]
+            # Regrouper ce qui attend déjà : un pipeline pour toutes les écritures
+            while len(batch) < 64:
+                try:
+                    operation = self.writes.get_nowait()
+                except queue.Empty:
+                    break
+                if operation is None:
+                    self.writes.put(None)
+                    break
+                batch.append(operation)
+            if not self.available():
+                self.stats["dropped_writes"] += len(batch)
+                continue
+            commands = []
+            for operation in batch:
+                if operation[0] == "del":
+                    commands.append(("DEL", self.prefix + operation[1]))
+                    self.stats["deletes"] += 1
+                    continue
+                _, key, value, expires_at = operation
+                ttl_ms = int((expires_at - datetime.now()).total_seconds() * 1000)
+                if ttl_ms <= 0:
+                    continue
+                try:
+                    commands.append(("SET", self.prefix + key, self.pack(value, expires_at), "PX", ttl_ms))
+                except (TypeError, ValueError) as e:
+                    print(f"⚠️ Valeur non sérialisable pour le L2 ({key[:20]}): {e}")
+                    continue
+                self.stats["writes"] += 1
+            if commands:
+                self._run(commands)
+
+    def report(self):
+        with self.lock:
+            available = time.monotonic() >= self.down_until
+        return {
+            "url": f"{self.host}:{self.port}/{self.db}",
+            "available": available,
+            "pending_writes": self.writes.qsize(),
+            "compression_ratio": round(self.stats["bytes_stored"] / self.stats["bytes_raw"], 3) if self.stats["bytes_raw"] else None,
+            **self.stats,
+        }
+
+cache_l2 = RedisCache(CACHE_L2_URL) if CACHE_L2_URL else None
+
+# Détection des challenges Cloudflare : en-têtes d'abord, puis marqueurs précis dans le début du corps
+CHALLENGE_SCAN_BYTES = int(os.getenv("CHALLENGE_SCAN_BYTES", 16384))  # Les marqueurs sont dans le <head>
+CHALLENGE_STATUSES = (403, 429, 503)
+CHALLENGE_MARKERS = (
+    b"<title>Just a moment...</title>",
+    b"_cf_chl_opt",
+    b"/cdn-cgi/challenge-platform/",
+    b"cf-browser-verification",
+    b"__cf_chl_jschl_tk__",
+    b"<title>Attention Required! | Cloudflare</title>",
+)
+
+def is_cloudflare_challenge(response_content, status_code, headers=None):
+    """Détecte si la réponse est un challenge Cloudflare.
+
+    cf-mitigated: challenge suffit ; un 403/429/503 servi par Cloudflare aussi. Sinon, seuls des
+    marqueurs propres aux pages de challenge sont cherchés, dans les CHALLENGE_SCAN_BYTES premiers
+    octets bruts (le mot "cloudflare" seul apparaît dans des pages normales : cdnjs, pieds de page).
+    """
+    if headers is not None:
+        if headers.get("cf-mitigated", "").lower() == "challenge":
+            return True
+        if status_code in CHALLENGE_STATUSES and headers.get("server", "").lower() == "cloudflare":
+            return True
+    if isinstance(response_content, str):
+        response_content = response_content.encode("utf-8", errors="ignore")
+    # find borné : ni copie ni décodage du corps
+    return any(response_content.find(marker, 0, CHALLENGE_SCAN_BYTES) != -1 for marker in CHALLENGE_MARKERS)
 
 async def get_or_create_session():
     """Obtient ou crée une session FlareSolverr persistante."""
@@ -107,7 +828,7 @@ async def get_or_create_session():
             "cmd": "sessions.create",
             "session": session_name
         }
-        response = await http_client.post(FLARESOLVERR_URL, json=payload)
+        response = await http_clients["flaresolverr"].post(FLARESOLVERR_URL, json=payload)
         data = response.json()
         
         if data.get("status") == "ok":
@@ -134,7 +855,7 @@ async def destroy_session():
             "cmd": "sessions.destroy",
             "session": _flaresolverr_session_id
         }
-        await http_client.post(FLARESOLVERR_URL, json=payload)
+        await http_clients["flaresolverr"].post(FLARESOLVERR_URL, json=payload)
         print(f"🗑️ Session détruite: {_flaresolverr_session_id}")
     except Exception as e:
         print(f"⚠️ Erreur destruction session: {e}")
@@ -166,7 +887,7 @@ def get_or_create_session_sync():
             "cmd": "sessions.create",
             "session": session_name
         }
-        response = http_client_sync.post(FLARESOLVERR_URL, json=payload)
+        response = http_clients_sync["flaresolverr"].post(FLARESOLVERR_URL, json=payload)
         data = response.json()
         
         if data.get("status") == "ok":
@@ -193,7 +914,7 @@ def destroy_session_sync():
             "cmd": "sessions.destroy",
             "session": _flaresolverr_session_id
         }
-        http_client_sync.post(FLARESOLVERR_URL, json=payload)
+        http_clients_sync["flaresolverr"].post(FLARESOLVERR_URL, json=payload)
         print(f"🗑️ Session détruite: {_flaresolverr_session_id}")
     except Exception as e:
         print(f"⚠️ Erreur destruction session: {e}")
@@ -201,6 +922,319 @@ def destroy_session_sync():
         _flaresolverr_session_id = None
         _session_last_used = None
 
+# Mesure des étapes d'une requête : en-tête Server-Timing, trace détaillée sur demande
+SERVER_TIMING_ENABLE = os.getenv("SERVER_TIMING_ENABLE", "true").lower() == "true"
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", 50))  # Traces détaillées conservées pour GET /trace/{id}
+
+_request_trace = contextvars.ContextVar("request_trace", default=None)
+_traces = OrderedDict()
+_NO_SPAN = nullcontext()
+
+class RequestTrace:
+    """Durées cumulées par étape (cache, direct, challenge, solve, parse, link, download, render...).
+
+    En mode détaillé, chaque span est aussi conservé avec son début, son thread et son détail.
+    """
+    def __init__(self, detailed=False):
+        self.start = time.perf_counter()
+        self.totals = {}  # nom -> [millisecondes, nombre]
+        self.events = [] if detailed else None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, detail=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                total = self.totals.setdefault(name, [0.0, 0])
+                total[0] += (end - start) * 1000
+                total[1] += 1
+                if self.events is not None:
+                    self.events.append({
+                        "span": name,
+                        "start_ms": round((start - self.start) * 1000, 3),
+                        "duration_ms": round((end - start) * 1000, 3),
+                        "thread": threading.current_thread().name,
+                        "detail": detail,
+                    })
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self):
+        # Les spans imbriqués ou parallèles se recouvrent : seul "total" est une durée murale
+        with self.lock:
+            parts = [f'{name};dur={ms:.1f};desc="x{count}"' for name, (ms, count) in self.totals.items()]
+        parts.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(parts)
+
+def trace_span(name, detail=None):
+    """Contexte qui mesure une étape de la requête en cours (rien à faire hors requête)."""
+    trace = _request_trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return trace.span(name, detail)
+
+def wants_trace(request):
+    return request.headers.get("x-trace") == "1" or request.query_params.get("trace") == "1"
+
+# Ordonnanceur des requêtes upstream : un token bucket par hôte et des classes de priorité.
+# Une classe ne consomme un jeton que si le seau reste au-dessus de sa réserve, ce qui laisse
+# la capacité aux classes plus prioritaires (le préchargement n'utilise que la capacité libre).
+UPSTREAM_RATE = float(os.getenv("UPSTREAM_RATE_PER_HOST", 4))  # Requêtes par seconde et par hôte
+UPSTREAM_BURST = float(os.getenv("UPSTREAM_BURST", 8))  # Taille du seau (rafale maximale)
+UPSTREAM_PRIORITY_RESERVE = {
+    "stream": 0.0,     # Clic sur "play" : passe dès qu'un jeton est disponible
+    "meta": 0.25,
+    "catalog": 0.5,
+    "prefetch": 0.75,  # Préchargement et réchauffage : seulement quand le seau est presque plein
+    "warm": 0.75,
+}
+_upstream_priority = contextvars.ContextVar("upstream_priority", default="meta")
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self, reserve):
+        """Prend un jeton si le seau reste au-dessus de `reserve` ; sinon retourne l'attente estimée."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            floor = reserve * self.burst
+            if self.tokens - 1 >= floor:
+                self.tokens -= 1
+                return 0.0
+            return (floor + 1 - self.tokens) / self.rate
+
+def ensure_off_loop(what):
+    """Les attentes bloquantes (scheduler, limiteur) sont réservées aux threads de travail.
+
+    Sur la boucle, elles figeraient toutes les requêtes (priorités comprises), voire attendraient
+    des places que seule la boucle peut libérer.
+    """
+    if on_event_loop():
+        raise RuntimeError(f"{what} appelé depuis la boucle d'événements : passer par run_in_thread")
+
+class UpstreamScheduler:
+    """Régule le débit vers chaque hôte upstream (sync et async)."""
+    MAX_SLEEP = 0.25  # Ré-essayer souvent : un jeton peut être pris par une requête plus prioritaire
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.stats = {priority: {"requests": 0, "delayed": 0, "wait_seconds": 0.0} for priority in UPSTREAM_PRIORITY_RESERVE}
+
+    def _bucket(self, url):
+        host = urlsplit(url).hostname or ""
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def _delay(self, bucket, priority):
+        return bucket.try_acquire(UPSTREAM_PRIORITY_RESERVE.get(priority, 0.25))
+
+    def _record(self, priority, waited):
+        stats = self.stats.setdefault(priority, {"requests": 0, "delayed": 0, "wait_seconds": 0.0})
+        stats["requests"] += 1
+        if waited:
+            stats["delayed"] += 1
+            stats["wait_seconds"] += waited
+
+    def acquire_sync(self, url):
+        ensure_off_loop("UpstreamScheduler.acquire_sync")  # time.sleep bloquerait toutes les requêtes
+        if self.rate <= 0:
+            return
+        priority = _upstream_priority.get()
+        bucket = self._bucket(url)
+        start = time.monotonic()
+        delay = self._delay(bucket, priority)
+        while delay > 0:
+            time.sleep(min(delay, self.MAX_SLEEP))
+            delay = self._delay(bucket, priority)
+        waited = time.monotonic() - start
+        self._record(priority, waited if waited > 0.001 else 0)
+
+    async def acquire_async(self, url):
+        if self.rate <= 0:
+            return
+        priority = _upstream_priority.get()
+        bucket = self._bucket(url)
+        start = time.monotonic()
+        delay = self._delay(bucket, priority)
+        while delay > 0:
+            await asyncio.sleep(min(delay, self.MAX_SLEEP))
+            delay = self._delay(bucket, priority)
+        waited = time.monotonic() - start
+        self._record(priority, waited if waited > 0.001 else 0)
+
+upstream_scheduler = UpstreamScheduler(UPSTREAM_RATE, UPSTREAM_BURST)
+
+# Concurrence adaptative (AIMD) : nombre de requêtes upstream simultanées
+ADAPTIVE_CONCURRENCY_ENABLE = os.getenv("ADAPTIVE_CONCURRENCY_ENABLE", "true").lower() == "true"
+CONCURRENCY_MIN = int(os.getenv("CONCURRENCY_MIN", 1))
+CONCURRENCY_MAX = int(os.getenv("CONCURRENCY_MAX", 16))
+CONCURRENCY_INITIAL = int(os.getenv("MAX_WORKERS", 3))  # Ancienne limite fixe, point de départ
+# Au-delà, on réduit (plus large si chaque requête passe par FlareSolverr, qui est lent par nature)
+CONCURRENCY_LATENCY_TARGET = float(os.getenv("CONCURRENCY_LATENCY_TARGET_SECONDS",
+                                             20 if FLARESOLVERR_ENABLE and not FLARESOLVERR_AUTO else 3))
+CONCURRENCY_BACKOFF = float(os.getenv("CONCURRENCY_BACKOFF", 0.5))  # Facteur de réduction
+
+# Marque la requête en cours comme challengée : sa latence inclut alors la résolution FlareSolverr
+_fetch_challenged = contextvars.ContextVar("fetch_challenged", default=False)
+
+class AdaptiveLimiter:
+    """Limite de concurrence AIMD : +1 par fenêtre de requêtes réussies, ×0.5 sur lenteur, erreur ou challenge.
+
+    Une seule réduction par période de CONCURRENCY_LATENCY_TARGET : une rafale de réponses lentes
+    causée par la même surcharge ne fait pas s'effondrer la limite.
+    """
+
+    def __init__(self, initial, minimum, maximum):
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+        self.async_waiters = []  # (boucle, future) réveillés par release, qui peut tourner dans un thread
+        self.stats = {"acquired": 0, "waited": 0, "successes": 0, "slow": 0, "errors": 0, "challenges": 0,
+                      "decreases": 0, "max_limit_reached": 0}
+
+    def _take(self):
+        """Prend une place si possible (appelé sous self.condition)."""
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self.stats["acquired"] += 1
+            _fetch_challenged.set(False)
+            return True
+        return False
+
+    def acquire_sync(self):
+        ensure_off_loop("AdaptiveLimiter.acquire_sync")
+        with self.condition:
+            if self._take():
+                return
+            self.stats["waited"] += 1
+            while not self._take():
+                self.condition.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        waited = False
+        while True:
+            with self.condition:
+                if self._take():
+                    return
+                if not waited:
+                    waited = True
+                    self.stats["waited"] += 1
+                future = loop.create_future()
+                self.async_waiters.append((loop, future))
+            try:
+                await future
+            finally:
+                with self.condition:
+                    if (loop, future) in self.async_waiters:
+                        self.async_waiters.remove((loop, future))
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self.last_decrease < CONCURRENCY_LATENCY_TARGET:
+            return
+        self.last_decrease = now
+        self.limit = max(self.minimum, self.limit * CONCURRENCY_BACKOFF)
+        self.stats["decreases"] += 1
+
+    def release(self, latency, failed=False):
+        with self.condition:
+            self.in_flight -= 1
+            if failed:
+                self.stats["errors"] += 1
+                self._decrease()
+            elif _fetch_challenged.get():
+                # Déjà compté par on_challenge ; la durée de résolution FlareSolverr n'est pas un signal de lenteur
+                pass
+            elif latency > CONCURRENCY_LATENCY_TARGET:
+                self.stats["slow"] += 1
+                self._decrease()
+            else:
+                self.stats["successes"] += 1
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                if self.limit >= self.maximum:
+                    self.stats["max_limit_reached"] += 1
+            self.condition.notify_all()
+            waiters, self.async_waiters = self.async_waiters, []
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake_waiter, future)
+
+    def on_challenge(self):
+        """Un challenge Cloudflare signale qu'on va trop vite : réduction immédiate."""
+        _fetch_challenged.set(True)
+        with self.condition:
+            self.stats["challenges"] += 1
+            self._decrease()
+
+    @contextmanager
+    def slot(self):
+        """Bloc qui occupe une place (synchrone) ; une exception compte comme une erreur."""
+        self.acquire_sync()
+        start = time.monotonic()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.release(time.monotonic() - start, failed)
+
+def _wake_waiter(future):
+    if not future.done():
+        future.set_result(None)
+
+if ADAPTIVE_CONCURRENCY_ENABLE:
+    concurrency_limiter = AdaptiveLimiter(CONCURRENCY_INITIAL, CONCURRENCY_MIN, CONCURRENCY_MAX)
+else:
+    # Limite fixe : bornes égales, rien à ajuster
+    concurrency_limiter = AdaptiveLimiter(CONCURRENCY_INITIAL, CONCURRENCY_INITIAL, CONCURRENCY_INITIAL)
+
+def upstream_failed(result):
+    """Réponse qui indique une surcharge ou une panne (nos échecs sont des réponses 500 vides)."""
+    return result.status_code >= 500 or result.status_code == 429
+
+def cache_response(cache_key, result):
+    """Met en cache une réponse upstream, sauf les erreurs (429, 5xx...) qui sont passagères."""
+    if result.status_code < 400:
+        set_cache(cache_key, result)
+
+@contextmanager
+def upstream_priority(priority):
+    """Classe de priorité des requêtes upstream faites dans ce bloc."""
+    token = _upstream_priority.set(priority)
+    try:
+        yield
+    finally:
+        _upstream_priority.reset(token)
+
+def _run_with_priority(priority, fn, *args):
+    with upstream_priority(priority):
+        return fn(*args)
+
+def submit_with_priority(executor, fn, *args):
+    """executor.submit en conservant le contexte courant (priorité, trace) : les threads ne le copient pas."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
 class FlareSolverrResponse:
     """Classe pour simuler une réponse httpx"""
     def __init__(self, content, status_code, url):
@@ -209,21 +1243,72 @@ class FlareSolverrResponse:
         self.status_code = status_code
         self.url = url
 
+class InflightFetch:
+    """Requête upstream en cours, partagée par tous les appelants qui veulent la même URL."""
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+        self.sent = False  # Faux tant que la requête attend un jeton de l'ordonnanceur
+
+_inflight = {}
+_cancel_stats = {"coalesced": 0, "disconnects": 0, "cancelled_fetches": 0, "cancelled_jobs": 0}
+
 async def flaresolverr_get_async(url: str):
-    """Effectue une requête GET, utilise FlareSolverr seulement si challenge Cloudflare détecté"""
+    """Effectue une requête GET, utilise FlareSolverr seulement si challenge Cloudflare détecté
+
+    Les appels simultanés pour une même URL partagent une seule requête. Si l'appelant est
+    annulé, la requête continue (elle alimente le cache) sauf si personne d'autre ne l'attend
+    et qu'elle n'est pas encore partie.
+    """
     # Vérifier le cache d'abord
     cache_key = make_cache_key(url)
-    cached_response = get_cache(cache_key)
+    with trace_span("cache"):
+        cached_response = await get_cache_async(cache_key)
     if cached_response:
         return cached_response
-    
+
+    fetch = _inflight.get(cache_key)
+    if fetch is None:
+        fetch = InflightFetch()
+        fetch.task = asyncio.ensure_future(_fetch_async(url, cache_key, fetch))
+        _inflight[cache_key] = fetch
+        fetch.task.add_done_callback(lambda _: _inflight.pop(cache_key, None) if _inflight.get(cache_key) is fetch else None)
+    else:
+        _cancel_stats["coalesced"] += 1
+    fetch.waiters += 1
+    try:
+        return await asyncio.shield(fetch.task)
+    except asyncio.CancelledError:
+        if fetch.waiters == 1 and not fetch.sent:
+            fetch.task.cancel()
+            _cancel_stats["cancelled_fetches"] += 1
+        raise
+    finally:
+        fetch.waiters -= 1
+
+async def _fetch_async(url: str, cache_key: str, fetch: InflightFetch):
+    """Requête réelle derrière flaresolverr_get_async (ordonnanceur, HTTP direct ou FlareSolverr)."""
+    with trace_span("queue"):
+        await upstream_scheduler.acquire_async(url)
+        await concurrency_limiter.acquire_async()
+    fetch.sent = True
+    start = time.monotonic()
+    result = None
+    try:
+        result = await _fetch_uncached_async(url, cache_key)
+        return result
+    finally:
+        concurrency_limiter.release(time.monotonic() - start, result is None or upstream_failed(result))
+
+async def _fetch_uncached_async(url: str, cache_key: str):
     # Si FlareSolverr est complètement désactivé
     if not FLARESOLVERR_ENABLE:
         try:
             print(f"📡 HTTP direct (FlareSolverr désactivé)")
-            response = await http_client.get(url)
+            with trace_span("direct", url):
+                response = await get_http_client(url).get(url)
             result = FlareSolverrResponse(response.content, response.status_code, str(response.url))
-            set_cache(cache_key, result)
+            cache_response(cache_key, result)
             return result
         except Exception as e:
             print(f"✗ HTTP direct échoué: {e}")
@@ -233,18 +1318,22 @@ async def flaresolverr_get_async(url: str):
     if FLARESOLVERR_AUTO:
         try:
             print(f"📡 Tentative HTTP direct...")
-            response = await http_client.get(url)
+            with trace_span("direct", url):
+                response = await get_http_client(url).get(url)
             
             # Vérifier si c'est un challenge Cloudflare
-            if is_cloudflare_challenge(response.content, response.status_code):
+            with trace_span("challenge"):
+                challenged = is_cloudflare_challenge(response.content, response.status_code, response.headers)
+            if challenged:
                 print(f"🛡️ Challenge Cloudflare détecté ! Utilisation de FlareSolverr...")
+                concurrency_limiter.on_challenge()
                 # Utiliser FlareSolverr
                 return await _flaresolverr_request_async(url, cache_key)
             else:
                 # Pas de challenge, utiliser la réponse HTTP directe
                 print(f"✓ HTTP direct réussi (pas de challenge)")
                 result = FlareSolverrResponse(response.content, response.status_code, str(response.url))
-                set_cache(cache_key, result)
+                cache_response(cache_key, result)
                 return result
                 
         except Exception as e:
@@ -269,7 +1358,8 @@ async def _flaresolverr_request_async(url: str, cache_key: str):
         if session_id:
             payload["session"] = session_id
         
-        response = await http_client.post(FLARESOLVERR_URL, json=payload)
+        with trace_span("solve", url):
+            response = await http_clients["flaresolverr"].post(FLARESOLVERR_URL, json=payload)
         data = response.json()
         
         if data.get("status") == "ok":
@@ -277,7 +1367,7 @@ async def _flaresolverr_request_async(url: str, cache_key: str):
             content = solution.get("response", "").encode('utf-8')
             status = solution.get("status", 200)
             result = FlareSolverrResponse(content, status, url)
-            set_cache(cache_key, result)
+            cache_response(cache_key, result)
             print(f"✓ FlareSolverr réussi (cookies conservés)")
             return result
         else:
@@ -293,17 +1383,31 @@ def flaresolverr_get_sync(url: str):
     """Effectue une requête GET, utilise FlareSolverr seulement si challenge Cloudflare détecté"""
     # Vérifier le cache d'abord
     cache_key = make_cache_key(url)
-    cached_response = get_cache(cache_key)
+    with trace_span("cache"):
+        cached_response = get_cache(cache_key)
     if cached_response:
         return cached_response
-    
+
+    with trace_span("queue"):
+        upstream_scheduler.acquire_sync(url)
+        concurrency_limiter.acquire_sync()
+    start = time.monotonic()
+    result = None
+    try:
+        result = _fetch_uncached_sync(url, cache_key)
+        return result
+    finally:
+        concurrency_limiter.release(time.monotonic() - start, result is None or upstream_failed(result))
+
+def _fetch_uncached_sync(url: str, cache_key: str):
     # Si FlareSolverr est complètement désactivé
     if not FLARESOLVERR_ENABLE:
         try:
             print(f"📡 HTTP direct (FlareSolverr désactivé)")
-            response = http_client_sync.get(url)
+            with trace_span("direct", url):
+                response = get_http_client(url, sync=True).get(url)
             result = FlareSolverrResponse(response.content, response.status_code, str(response.url))
-            set_cache(cache_key, result)
+            cache_response(cache_key, result)
             return result
         except Exception as e:
             print(f"✗ HTTP direct échoué: {e}")
@@ -313,18 +1417,22 @@ def flaresolverr_get_sync(url: str):
     if FLARESOLVERR_AUTO:
         try:
             print(f"📡 Tentative HTTP direct...")
-            response = http_client_sync.get(url)
+            with trace_span("direct", url):
+                response = get_http_client(url, sync=True).get(url)
             
             # Vérifier si c'est un challenge Cloudflare
-            if is_cloudflare_challenge(response.content, response.status_code):
+            with trace_span("challenge"):
+                challenged = is_cloudflare_challenge(response.content, response.status_code, response.headers)
+            if challenged:
                 print(f"🛡️ Challenge Cloudflare détecté ! Utilisation de FlareSolverr...")
+                concurrency_limiter.on_challenge()
                 # Utiliser FlareSolverr
                 return _flaresolverr_request_sync(url, cache_key)
             else:
                 # Pas de challenge, utiliser la réponse HTTP directe
                 print(f"✓ HTTP direct réussi (pas de challenge)")
                 result = FlareSolverrResponse(response.content, response.status_code, str(response.url))
-                set_cache(cache_key, result)
+                cache_response(cache_key, result)
                 return result
                 
         except Exception as e:
@@ -349,7 +1457,8 @@ def _flaresolverr_request_sync(url: str, cache_key: str):
         if session_id:
             payload["session"] = session_id
         
-        response = http_client_sync.post(FLARESOLVERR_URL, json=payload)
+        with trace_span("solve", url):
+            response = http_clients_sync["flaresolverr"].post(FLARESOLVERR_URL, json=payload)
         data = response.json()
         
         if data.get("status") == "ok":
@@ -357,7 +1466,7 @@ def _flaresolverr_request_sync(url: str, cache_key: str):
             content = solution.get("response", "").encode('utf-8')
             status = solution.get("status", 200)
             result = FlareSolverrResponse(content, status, url)
-            set_cache(cache_key, result)
+            cache_response(cache_key, result)
             print(f"✓ FlareSolverr réussi (cookies conservés)")
             return result
         else:
@@ -368,6 +1477,127 @@ def _flaresolverr_request_sync(url: str, cache_key: str):
     except Exception as e:
         print(f"✗ FlareSolverr échoué: {e}")
         return FlareSolverrResponse(b"", 500, url)
+
+# Lecture en streaming : on s'arrête dès que la page a livré ce qu'on cherche
+STREAM_FETCH_ENABLE = os.getenv("STREAM_FETCH_ENABLE", "true").lower() == "true"
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 16384))
+STREAM_WINDOW = int(os.getenv("STREAM_WINDOW", 16384))  # Fin de texte conservée entre deux lectures
+
+_stream_stats = {"early_aborts": 0, "full_reads": 0, "fallbacks": 0, "bytes_read": 0}
+
+def _match_value(pattern, match):
+    """Même forme de résultat que re.findall."""
+    if pattern.groups == 0:
+        return match.group(0)
+    if pattern.groups == 1:
+        return match.group(1)
+    return match.groups()
+
+def match_cache_key(url, regex):
+    """Clé de cache des correspondances extraites d'une page."""
+    return make_cache_key(f"match:{regex}:{canonical_url(url)}")
+
+def fetch_matches_sync(url: str, regex: str, enough=None, no_multi_line=False):
+    """GET qui applique `regex` au fil de la lecture et coupe la connexion dès que `enough(matches)` est vrai.
+
+    Par défaut on s'arrête à la première correspondance. Retourne la liste des
+    correspondances (comme re.findall). Les correspondances sont mises en cache,
+    la page partielle ne l'est pas.
+    """
+    pattern = re.compile(regex)
+    if enough is None:
+        enough = lambda matches: len(matches) >= 1
+
+    match_key = match_cache_key(url, regex)
+    with trace_span("cache"):
+        cached_matches = get_cache(match_key)
+    if cached_matches:
+        return cached_matches
+
+    def from_full_page(response):
+        page = response.text
+        if no_multi_line:
+            page = page.replace('\n', '')
+        return pattern.findall(page)
+
+    with trace_span("cache"):
+        cached_page = get_cache(make_cache_key(url))
+    if cached_page:
+        return from_full_page(cached_page)
+    if not STREAM_FETCH_ENABLE or (FLARESOLVERR_ENABLE and not FLARESOLVERR_AUTO):
+        return from_full_page(flaresolverr_get_sync(url))
+
+    with trace_span("queue"):
+        upstream_scheduler.acquire_sync(url)
+    matches = []
+    try:
+        with concurrency_limiter.slot(), trace_span("direct", url), get_http_client(url, sync=True).stream("GET", url) as response:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+            window = ""
+            bytes_read = 0
+            first_chunk = True
+            cacheable = response.status_code < 400
+            for chunk in response.iter_bytes(STREAM_CHUNK_SIZE):
+                bytes_read += len(chunk)
+                _stream_stats["bytes_read"] += len(chunk)
+                if first_chunk:
+                    first_chunk = False
+                    with trace_span("challenge"):
+                        challenged = FLARESOLVERR_ENABLE and is_cloudflare_challenge(chunk, response.status_code, response.headers)
+                    if challenged:
+                        print(f"🛡️ Challenge Cloudflare détecté en streaming ! Utilisation de FlareSolverr...")
+                        concurrency_limiter.on_challenge()
+                        _stream_stats["fallbacks"] += 1
+                        return from_full_page(_flaresolverr_request_sync(url, make_cache_key(url)))
+                piece = decoder.decode(chunk)
+                window += piece.replace('\n', '') if no_multi_line else piece
+                consumed = 0
+                for match in pattern.finditer(window):
+                    matches.append(_match_value(pattern, match))
+                    consumed = match.end()
+                if enough(matches):
+                    _stream_stats["early_aborts"] += 1
+                    print(f"✂️ Lecture interrompue après {bytes_read} octets")
+                    break
+                # Garder la fin du texte pour une correspondance à cheval sur deux morceaux
+                window = window[max(consumed, len(window) - STREAM_WINDOW):]
+            else:
+                _stream_stats["full_reads"] += 1
+    except Exception as e:
+        print(f"⚠️ Lecture en streaming échouée, requête complète: {e}")
+        _stream_stats["fallbacks"] += 1
+        return from_full_page(flaresolverr_get_sync(url))
+
+    if matches and cacheable:
+        set_cache(match_key, matches)
+    return matches
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Ajoute l'en-tête Server-Timing ; avec X-Trace: 1 ou ?trace=1, conserve la trace détaillée."""
+    if not SERVER_TIMING_ENABLE:
+        return await call_next(request)
+    trace = RequestTrace(detailed=wants_trace(request))
+    token = _request_trace.set(trace)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_trace.reset(token)
+    response.headers["Server-Timing"] = trace.server_timing()
+    if trace.events is not None:
+        trace_id = uuid.uuid4().hex[:16]
+        _traces[trace_id] = {
+            "path": request.url.path,
+            "status": response.status_code,
+            "total_ms": round(trace.elapsed_ms(), 3),
+            "spans": {name: {"ms": round(ms, 3), "count": count} for name, (ms, count) in trace.totals.items()},
+            "events": sorted(trace.events, key=lambda event: event["start_ms"]),
+        }
+        while len(_traces) > TRACE_KEEP:
+            _traces.popitem(last=False)
+        response.headers["X-Trace-Id"] = trace_id
+    return response
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -388,6 +1618,56 @@ SPONSOR_MESSAGE = os.getenv("SPONSOR_MESSAGE")
 ADDON_ID = os.getenv("ADDON_ID") if os.getenv("ADDON_ID") else "community.aymene69.akwam"
 RGX_QUALITY_TAG = r'tab-content quality.*?a href="(https?://\w*\.*\w+\.\w+/link/\d+)"'
 RGX_SIZE_TAG = r'font-size-14 mr-auto">([0-9.MGB ]+)</'
+# Balayage de la page d'un titre, dans l'ordre du document :
+# onglet de qualité avec sa cible (#tab-N), début d'un onglet, lien /link/, taille, qualité sans cible.
+# Chaque alternative va jusqu'à un terminateur (">", "<", '"') : une balise coupée en fin de morceau
+# ne correspond pas encore et reste dans la fenêtre conservée pour le morceau suivant.
+RGX_QUALITY_SCAN = (
+    r'href="#(tab-\d+)"[^>]*>\s*(1080p|720p|480p)\s*<'
+    r'|tab-content quality(?:[^>]*?id="(tab-\d+)")?[^>]*>'
+    r'|a href="(https?://\w*\.*\w+\.\w+/link/\d+)"'
+    r'|' + RGX_SIZE_TAG +
+    r'|>(1080p|720p|480p)</'
+)
+
+def parse_quality_scan(matches):
+    """Associe chaque qualité à son onglet, son lien /link/ et sa taille.
+
+    Les onglets sont reliés par leur id (#tab-N) ; sans id, par position
+    (n-ième qualité annoncée = n-ième onglet). Retourne (liens, tailles, annoncées).
+    """
+    tab_labels = {}
+    labels = []
+    tabs = []
+    tab_links = {}
+    tab_sizes = {}
+    current_tab = None
+    for tab_ref, tab_label, tab_id, link, size, label in matches:
+        if tab_label:
+            tab_labels.setdefault(tab_ref, tab_label)
+            if tab_label not in labels:
+                labels.append(tab_label)
+        elif label:
+            if label not in labels:
+                labels.append(label)
+        elif link or size:
+            # Seuls le premier lien et la première taille d'un onglet comptent
+            if current_tab is not None:
+                if link:
+                    tab_links.setdefault(current_tab, link)
+                else:
+                    tab_sizes.setdefault(current_tab, size.strip())
+        else:
+            current_tab = tab_id or f"#{len(tabs)}"
+            tabs.append(current_tab)
+
+    if tab_labels:
+        tab_of = {label: tab for tab, label in tab_labels.items()}
+    else:
+        tab_of = dict(zip(labels, tabs))
+    links = {q: tab_links[tab] for q, tab in tab_of.items() if tab in tab_links}
+    sizes = {q: tab_sizes[tab] for q, tab in tab_of.items() if tab in tab_sizes}
+    return links, sizes, labels
 HTTP = 'https://'
 
 templates = Jinja2Templates(directory="templates")
@@ -455,6 +1735,201 @@ manifest_data = {
     }
 }
 
+# En-têtes de cache HTTP (Cache-Control / ETag / Last-Modified) par type de ressource
+HTTP_CACHE_MAX_AGE = {
+    "manifest": int(os.getenv("HTTP_CACHE_MANIFEST_SECONDS", 86400)),
+    "catalog": int(os.getenv("HTTP_CACHE_CATALOG_SECONDS", 1800)),
+    "search": int(os.getenv("HTTP_CACHE_SEARCH_SECONDS", 600)),
+    "meta": int(os.getenv("HTTP_CACHE_META_SECONDS", 3600)),
+}
+HTTP_CACHE_EMPTY_MAX_AGE = 60  # Réponses vides ou par défaut : ne pas les figer chez les clients
+
+def serialize_json(content):
+    """Sérialise comme JSONResponse (UTF-8, sans espaces)."""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def make_etag(body):
+    return f'"{hashlib.md5(body).hexdigest()}"'
+
+def etag_matches(request, etag):
+    """Vérifie l'en-tête If-None-Match (liste, validateurs faibles et '*')."""
+    header = request.headers.get("if-none-match") if request else None
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Les variantes compressées ont un ETag suffixé ("...-gzip") mais représentent le même contenu
+    accepted = {etag, f'{etag[:-1]}-gzip"', f'{etag[:-1]}-br"'}
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any((tag[2:] if tag.startswith("W/") else tag) in accepted for tag in candidates)
+
+def page_last_modified(url):
+    """Date de récupération d'une page Akwam encore en cache (None si absente)."""
+    expiry = _cache_expiry.get(make_cache_key(url))
+    if not expiry:
+        return None
+    return expiry - timedelta(seconds=CACHE_TTL)
+
+def cached_json_response(request, content, resource, last_modified=None, body=None, max_age=None, render_key=None):
+    """Construit une réponse JSON avec Cache-Control, ETag et Last-Modified, ou un 304.
+
+    Si render_key est fourni et que la réponse est cacheable (max_age par défaut),
+    le rendu est mémorisé dans le cache de réponses.
+    """
+    with trace_span("render"):
+        if max_age is None and render_key is not None:
+            rendered = store_rendered(render_key, content, resource, last_modified)
+            if rendered:
+                return rendered_response(request, rendered)
+        if body is None:
+            body = serialize_json(content)
+        if max_age is None:
+            max_age = HTTP_CACHE_MAX_AGE[resource]
+        etag = make_etag(body)
+        headers = {"Cache-Control": f"public, max-age={max_age}", "ETag": etag, "Vary": "Accept-Encoding"}
+        if last_modified:
+            headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        encoding = choose_encoding(request, len(body))
+        if encoding:
+            body = compress_body(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+        return Response(content=body, media_type="application/json", headers=headers)
+
+# Cache des réponses rendues (JSON sérialisé + variantes gzip/brotli)
+RENDER_CACHE_ENABLE = os.getenv("RENDER_CACHE_ENABLE", "true").lower() == "true"
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", 1000))
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))  # Pas de compression en dessous
+# Niveaux pour du contenu dynamique : compressé dans la boucle à chaque rendu, il doit rester rapide
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 5))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+
+_render_cache = OrderedDict()
+_render_stats = {"hits": 0, "misses": 0, "stored": 0, "invalidated": 0}
+# Pages du cache (_cache) lues pendant le rendu de la requête en cours : {clé: expiration}
+_render_sources = contextvars.ContextVar("render_sources", default=None)
+
+def choose_encoding(request, size):
+    """Choisit br ou gzip selon Accept-Encoding (None = pas de compression)."""
+    if request is None or size < COMPRESS_MIN_BYTES:
+        return None
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def compress_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL)
+
+class RenderedResponse:
+    """Réponse déjà sérialisée, avec ses variantes compressées et les pages dont elle dépend."""
+    def __init__(self, body, resource, last_modified, sources):
+        self.body = body
+        self.resource = resource
+        self.etag = make_etag(body)
+        self.last_modified = last_modified
+        self.sources = sources
+        self.expires = datetime.now() + timedelta(seconds=CACHE_TTL)
+        self.variants = {}
+        if len(body) >= COMPRESS_MIN_BYTES:
+            self.variants["gzip"] = compress_body(body, "gzip")
+            if brotli:
+                self.variants["br"] = compress_body(body, "br")
+
+    def is_valid(self):
+        """Valide tant que toutes les pages sources sont encore les mêmes entrées du cache."""
+        if datetime.now() >= self.expires:
+            return False
+        return all(_cache_expiry.get(key) == expiry for key, expiry in self.sources.items())
+
+def render_cache_key(request):
+    """Clé normalisée : chemin sans le segment de configuration + paramètres triés."""
+    path = unquote(request.url.path)
+    for marker in ("/catalog/", "/meta/"):
+        if marker in path:
+            path = path[path.index(marker):]
+            break
+    params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()) if k != "trace")
+    if IMAGE_PROXY_ENABLE and not IMAGE_PROXY_BASE_URL:
+        # Les URL d'images du proxy reprennent l'hôte de la requête : une réponse par hôte
+        return f"{str(request.base_url).rstrip('/')}{path}?{params}"
+    return f"{path}?{params}"
+
+def get_rendered(request):
+    """Retourne (clé, réponse mise en cache ou None) et commence l'enregistrement des pages sources."""
+    if not RENDER_CACHE_ENABLE:
+        return None, None
+    key = render_cache_key(request)
+    rendered = _render_cache.get(key)
+    if rendered is not None:
+        if rendered.is_valid():
+            _render_cache.move_to_end(key)
+            _render_stats["hits"] += 1
+            return key, rendered
+        # Une page source a été rafraîchie ou a expiré
+        _render_cache.pop(key, None)
+        _render_stats["invalidated"] += 1
+    _render_stats["misses"] += 1
+    _render_sources.set({})
+    return key, None
+
+def record_render_source(key):
+    """Appelé par le cache de pages : note la page comme dépendance du rendu en cours."""
+    sources = _render_sources.get()
+    if sources is not None and key in _cache_expiry:
+        sources[key] = _cache_expiry[key]
+
+def store_rendered(key, content, resource, last_modified):
+    sources = _render_sources.get()
+    _render_sources.set(None)
+    if not sources:
+        # Sans page source connue, impossible d'invalider correctement
+        return None
+    rendered = RenderedResponse(serialize_json(content), resource, last_modified, sources)
+    _render_cache[key] = rendered
+    _render_cache.move_to_end(key)
+    while len(_render_cache) > RENDER_CACHE_MAX_ENTRIES:
+        _render_cache.popitem(last=False)
+    _render_stats["stored"] += 1
+    return rendered
+
+def rendered_response(request, rendered):
+    """Sert une réponse rendue : simple copie mémoire de la variante adaptée."""
+    headers = {
+        "Cache-Control": f"public, max-age={HTTP_CACHE_MAX_AGE[rendered.resource]}",
+        "ETag": rendered.etag,
+        "Vary": "Accept-Encoding",
+    }
+    if rendered.last_modified:
+        headers["Last-Modified"] = format_datetime(rendered.last_modified.astimezone(timezone.utc), usegmt=True)
+    if etag_matches(request, rendered.etag):
+        return Response(status_code=304, headers=headers)
+    encoding = choose_encoding(request, len(rendered.body))
+    if encoding in rendered.variants:
+        headers["Content-Encoding"] = encoding
+        headers["ETag"] = f'{rendered.etag[:-1]}-{encoding}"'
+        return Response(content=rendered.variants[encoding], media_type="application/json", headers=headers)
+    return Response(content=rendered.body, media_type="application/json", headers=headers)
+
+# Manifest sérialisé une seule fois au démarrage
+MANIFEST_BODY = serialize_json(manifest_data)
+MANIFEST_LAST_MODIFIED = datetime.now()
+
 def extract_season_episode(title):
     match = re.search(r'Saison (\d+) Épisode (\d+)', title)
     if match:
@@ -482,66 +1957,525 @@ def extract_episode_number(title):
 def sort_streams_by_episode(streams):
     """Trie les streams par numéro d'épisode."""
     def get_sort_key(stream):
-        return extract_episode_number(stream.get('title', ''))
+        title = stream.get('title', '')
+        if re.search(r'Saison \d+ Épisode \d+', title):
+            return extract_season_episode(title)
+        return 1, extract_episode_number(title)
     
     return sorted(streams, key=get_sort_key)
 
+# Index de recherche local (titres récoltés depuis les catalogues, recherches et métas)
+SEARCH_INDEX_ENABLE = os.getenv("SEARCH_INDEX_ENABLE", "true").lower() == "true"
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "")  # Fichier JSON pour persister l'index (vide = mémoire seulement)
+SEARCH_PAGE_SIZE = 20  # Résultats par page de recherche (comme Akwam)
+# Hits exacts (sans trigrammes) nécessaires pour répondre depuis l'index ; en dessous, recherche Akwam.
+# L'index ne contient que les titres déjà vus : une page entière évite de masquer ceux jamais parcourus.
+SEARCH_INDEX_MIN_HITS = int(os.getenv("SEARCH_INDEX_MIN_HITS", SEARCH_PAGE_SIZE))
+SEARCH_SOURCES_MAX = 2000  # Requêtes dont la source de pagination (index ou Akwam) est retenue
 
-async def fetch_entries_by_genre(url):
-    """Gather entries for a specific genre (async)."""
-    try:
-        response = await flaresolverr_get_async(url)
-        if response.status_code != 200:
-            return []
+_ARABIC_DIACRITICS = re.compile(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+_ARABIC_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+})
+_NON_WORD = re.compile(r'[\W_]+')
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        entries = []
+def normalize_search_text(text):
+    """Normalise un texte arabe/latin pour la recherche (tashkeel, hamza/alef, taa marbuta, casse)."""
+    text = _ARABIC_DIACRITICS.sub('', text or '')
+    text = text.translate(_ARABIC_FOLDING).lower()
+    return _NON_WORD.sub(' ', text).strip()
 
-        widget_body = soup.find('div', class_='widget-body row flex-wrap')
-        if not widget_body:
-            return []
+def media_type_from_url(url):
+    """Déduit le type Stremio depuis une URL Akwam (/movie/... ou /series/...)."""
+    if '/movie/' in url:
+        return 'movie'
+    if '/series/' in url:
+        return 'series'
+    return None
 
-        for item in widget_body.find_all('div', class_='col-lg-auto col-md-4 col-6 mb-12'):
-            entry_box = item.find('div', class_='entry-box')
-            if not entry_box:
-                continue
+class SearchIndex:
+    """Index en mémoire des titres Akwam : correspondance par préfixe puis par trigrammes."""
+    MIN_PREFIX = 2
+    MAX_PREFIX = 15
+    FUZZY_THRESHOLD = 0.6
 
-            title_elem = entry_box.find('h3', class_='entry-title')
-            title = title_elem.text.strip() if title_elem else 'No Title'
+    def __init__(self):
+        self.docs = {}
+        self._prefixes = {}
+        self._grams = {}
+        self._lock = threading.Lock()
 
-            link_elem = entry_box.find('a', class_='box')
-            link = link_elem['href'] if link_elem else '#'
+    @staticmethod
+    def _tokens(normalized):
+        tokens = set()
+        for token in normalized.split():
+            tokens.add(token)
+            # "الجزيرة" doit aussi être trouvé avec "جزيرة"
+            if token.startswith('ال') and len(token) > 3:
+                tokens.add(token[2:])
+        return tokens
 
-            thumb_elem = entry_box.find('img', class_='img-fluid w-100 lazy')
-            thumb = thumb_elem['data-src'] if thumb_elem and thumb_elem.has_attr('data-src') else thumb_elem['src'] if thumb_elem else ''
+    def _token_prefixes(self, token):
+        # Le token complet est toujours indexé pour que "5" ou "2" restent trouvables
+        prefixes = {token[:n] for n in range(self.MIN_PREFIX, min(len(token), self.MAX_PREFIX) + 1)}
+        prefixes.add(token[:self.MAX_PREFIX])
+        return prefixes
 
-            year_elem = entry_box.find('span', class_='badge badge-pill badge-secondary')
-            year = year_elem.text.strip() if year_elem else 'N/A'
+    @staticmethod
+    def _trigrams(token):
+        padded = f" {token} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
 
-            tags = []
-            for tag_elem in entry_box.find_all('span', class_='badge badge-pill badge-light'):
-                tags.append(tag_elem.text.strip())
+    def add(self, title, url, poster='', year=''):
+        """Ajoute (ou met à jour) un titre dans l'index."""
+        if not title or not url or title == 'No Title':
+            return
+        media_type = media_type_from_url(url)
+        if not media_type:
+            return
+        normalized = normalize_search_text(title)
+        if not normalized:
+            return
+        with self._lock:
+            existing = self.docs.get(url)
+            if existing and existing['norm'] == normalized:
+                # On complète seulement les champs manquants
+                existing['poster'] = existing['poster'] or poster
+                existing['year'] = existing['year'] or year
+                return
+            if existing:
+                self._unindex(url, existing['norm'])
+            self.docs[url] = {"title": title, "url": url, "type": media_type,
+                              "poster": poster or '', "year": year or '', "norm": normalized}
+            for token in self._tokens(normalized):
+                for prefix in self._token_prefixes(token):
+                    self._prefixes.setdefault(prefix, set()).add(url)
+                for gram in self._trigrams(token):
+                    self._grams.setdefault(gram, set()).add(url)
 
-            entries.append((title, link, thumb, year, tags))
+    def _unindex(self, url, normalized):
+        for token in self._tokens(normalized):
+            for prefix in self._token_prefixes(token):
+                self._prefixes.get(prefix, set()).discard(url)
+            for gram in self._trigrams(token):
+                self._grams.get(gram, set()).discard(url)
 
-        return entries
-    except Exception as e:
-        print(f"Error fetching entries: {e}")
-        return []
+    def _match_token(self, token, fuzzy=True):
+        """Retourne {url: score} pour un token de la requête."""
+        matches = {}
+        for url in self._prefixes.get(token[:self.MAX_PREFIX], ()):
+            matches[url] = 2
+        if fuzzy and len(token) >= 4:
+            # Tolérance aux fautes de frappe via les trigrammes
+            grams = self._trigrams(token)
+            counts = {}
+            for gram in grams:
+                for url in self._grams.get(gram, ()):
+                    counts[url] = counts.get(url, 0) + 1
+            for url, count in counts.items():
+                if url not in matches and count / len(grams) >= self.FUZZY_THRESHOLD:
+                    matches[url] = 1
+        return matches
 
-async def fetch_entries_for_page(url, page):
-    """Fetch entries for a specific page (async)."""
+    def search(self, query, media_type=None, fuzzy=True):
+        """Cherche les titres correspondant à tous les mots de la requête, triés par pertinence.
+
+        fuzzy=False : préfixes seulement, sans la tolérance aux fautes des trigrammes.
+        """
+        normalized = normalize_search_text(query)
+        tokens = normalized.split()
+        if not tokens:
+            return []
+        with self._lock:
+            scores = None
+            for token in tokens:
+                matches = self._match_token(token, fuzzy)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {url: s + matches[url] for url, s in scores.items() if url in matches}
+                if not scores:
+                    return []
+            results = []
+            for url, score in scores.items():
+                doc = self.docs[url]
+                if media_type and doc['type'] != media_type:
+                    continue
+                if doc['norm'] == normalized:
+                    score += 10
+                elif doc['norm'].startswith(normalized):
+                    score += 5
+                results.append((score, doc))
+        results.sort(key=lambda item: (-item[0], len(item[1]['title'])))
+        return [doc for _, doc in results]
+
+    def lookup_title(self, title, media_type=None):
+        """Retourne {titre: url} des documents dont le titre normalisé est identique."""
+        normalized = normalize_search_text(title)
+        return {doc['title']: doc['url'] for doc in self.search(title, media_type) if doc['norm'] == normalized}
+
+    def save(self, path):
+        with self._lock:
+            docs = [{k: v for k, v in doc.items() if k != 'norm'} for doc in self.docs.values()]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(docs, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        print(f"💾 Index de recherche sauvegardé: {len(docs)} titres")
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, encoding='utf-8') as f:
+            docs = json.load(f)
+        for doc in docs:
+            self.add(doc.get('title'), doc.get('url'), doc.get('poster', ''), doc.get('year', ''))
+        print(f"📂 Index de recherche chargé: {len(self.docs)} titres")
+
+search_index = SearchIndex()
+
+def index_title(title, url, poster='', year=''):
+    """Alimente l'index de recherche local (sans jamais faire échouer l'appelant)."""
+    if not SEARCH_INDEX_ENABLE:
+        return
+    try:
+        search_index.add(title, url, poster, year)
+    except Exception as e:
+        print(f"⚠️ Erreur indexation '{title}': {e}")
+
+async def load_search_index():
+    if SEARCH_INDEX_ENABLE and SEARCH_INDEX_PATH:
+        try:
+            search_index.load(SEARCH_INDEX_PATH)
+        except Exception as e:
+            print(f"⚠️ Impossible de charger l'index de recherche: {e}")
+
+async def save_search_index():
+    if SEARCH_INDEX_ENABLE and SEARCH_INDEX_PATH:
+        try:
+            search_index.save(SEARCH_INDEX_PATH)
+        except Exception as e:
+            print(f"⚠️ Impossible de sauvegarder l'index de recherche: {e}")
+
+# Stockage local des métadonnées (alimenté par les scrapes et le crawler)
+METADATA_STORE_ENABLE = os.getenv("METADATA_STORE_ENABLE", "true").lower() == "true"
+METADATA_STORE_PATH = os.getenv("METADATA_STORE_PATH", "")  # Fichier SQLite (vide = pas de base ; ":memory:" = non persistant)
+METADATA_REFRESH_AFTER = int(os.getenv("METADATA_REFRESH_AFTER_SECONDS", 6 * 3600))  # Au-delà, /meta relance un scrape en fond
+
+class MetadataStore:
+    """Métadonnées par URL Akwam (forme canonique) dans SQLite : nom, images, année, genres, note, description, épisodes."""
+    FIELDS = ("name", "poster", "background", "year", "genres", "imdbRating", "description", "videos")
+    JSON_FIELDS = ("genres", "videos")
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                url TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                name TEXT, poster TEXT, background TEXT, year TEXT,
+                genres TEXT, imdbRating TEXT, description TEXT, videos TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE TABLE IF NOT EXISTS content_ids (id TEXT PRIMARY KEY, url TEXT NOT NULL, title TEXT)")
+        # Contenus déjà vus par le crawler (distinct de metadata, que les scrapes à la demande remplissent aussi)
+        self.db.execute("CREATE TABLE IF NOT EXISTS crawled (url TEXT PRIMARY KEY)")
+        self.db.commit()
+
+    def put(self, url, media_type, metadata):
+        url = canonical_url(url)
+        values = [json.dumps(metadata[field], ensure_ascii=False) if field in self.JSON_FIELDS and field in metadata
+                  else metadata.get(field) for field in self.FIELDS]
+        with self.lock:
+            self.db.execute(
+                f"INSERT OR REPLACE INTO metadata (url, type, {', '.join(self.FIELDS)}, updated_at) "
+                f"VALUES (?, ?, {', '.join('?' for _ in self.FIELDS)}, ?)",
+                [url, media_type, *values, time.time()],
+            )
+            self.db.commit()
+
+    def get(self, url):
+        """Retourne (métadonnées, date de mise à jour) ou (None, None)."""
+        url = canonical_url(url)
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT {', '.join(self.FIELDS)}, updated_at FROM metadata WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None, None
+        metadata = {}
+        for field, value in zip(self.FIELDS, row):
+            if value is not None:
+                metadata[field] = json.loads(value) if field in self.JSON_FIELDS else value
+        return metadata, datetime.fromtimestamp(row[-1])
+
+    def has(self, url):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM metadata WHERE url = ?", (canonical_url(url),)).fetchone() is not None
+
+    def was_crawled(self, url):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM crawled WHERE url = ?", (canonical_url(url),)).fetchone() is not None
+
+    def mark_crawled(self, url):
+        with self.lock:
+            self.db.execute("INSERT OR IGNORE INTO crawled (url) VALUES (?)", (canonical_url(url),))
+            self.db.commit()
+
+    def count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+    def put_content_ids(self, rows):
+        """Enregistre [(id, url, titre), ...] en une seule transaction."""
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO content_ids (id, url, title) VALUES (?, ?, ?)", rows)
+            self.db.commit()
+
+    def get_content_id(self, content_id):
+        """Retourne (titre, url) ou None."""
+        with self.lock:
+            row = self.db.execute("SELECT title, url FROM content_ids WHERE id = ?", (content_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+# Les appels à la base sont bloquants (verrou + SQLite) : depuis le code async, passer par run_in_thread
+metadata_store = MetadataStore(METADATA_STORE_PATH) if METADATA_STORE_ENABLE and METADATA_STORE_PATH else None
+
+# Identifiants courts : "akwam-" + type + identifiant numérique Akwam (ex. akwam-m1234 pour /movie/1234/...)
+CONTENT_KINDS = {"movie": "m", "series": "s", "episode": "e"}
+RGX_CONTENT_URL = re.compile(r'/(movie|series|episode)/(\d+)')
+RGX_CONTENT_ID = re.compile(r'akwam-([mse])(\d+)')
+
+CONTENT_IDS_MAX = int(os.getenv("CONTENT_IDS_MAX", 50000))  # Identifiants gardés en mémoire (les autres restent en base)
+
+_content_ids = OrderedDict()  # id court -> (titre, url), les plus récemment enregistrés en fin
+_content_ids_pending = []  # [(id, url, titre)] pas encore écrits en base
+_content_ids_lock = threading.Lock()
+
+def content_id(title, url):
+    """Identifiant Stremio d'un contenu : court si l'URL porte l'identifiant numérique Akwam, sinon "titre::url" en base64."""
+    match = RGX_CONTENT_URL.search(url)
+    if match:
+        return f"akwam-{CONTENT_KINDS[match.group(1)]}{match.group(2)}"
+    return "akwam" + base64.urlsafe_b64encode(f"{title}::{url}".encode()).decode()
+
+def register_content(title, url):
+    """Calcule l'identifiant d'un contenu et retient l'URL correspondante pour le décoder plus tard."""
+    cid = content_id(title, url)
+    if RGX_CONTENT_ID.fullmatch(cid):
+        with _content_ids_lock:
+            if _content_ids.get(cid) != (title, url):
+                _content_ids[cid] = (title, url)
+                if metadata_store:
+                    # Écrit en lot par save_content_ids (une transaction par réponse, hors boucle)
+                    _content_ids_pending.append((cid, url, title))
+            _content_ids.move_to_end(cid)
+            while len(_content_ids) > CONTENT_IDS_MAX:
+                _content_ids.popitem(last=False)
+    return cid
+
+def flush_content_ids():
+    """Écrit en base les identifiants enregistrés depuis le dernier appel (bloquant : dans un thread)."""
+    with _content_ids_lock:
+        rows = _content_ids_pending[:]
+        del _content_ids_pending[:]
+    if rows and metadata_store:
+        metadata_store.put_content_ids(rows)
+    return len(rows)
+
+async def save_content_ids():
+    """À appeler après avoir enregistré les identifiants d'une réponse (catalogue, recherche, fiche)."""
+    if _content_ids_pending:
+        await run_in_thread(flush_content_ids)
+
+async def decode_content_id_async(raw_id):
+    """decode_content_id pour le code async : la mémoire d'abord, la base seulement dans un thread."""
+    known = _content_ids.get(raw_id)
+    if known:
+        return known
+    return await run_in_thread(decode_content_id, raw_id)
+
+def decode_content_id(raw_id):
+    """Retourne (titre, url) pour un identifiant court ou ancien ("titre::url" ou titre seul en base64).
+
+    Le titre vaut None pour un identifiant court inconnu, l'url None pour un ancien identifiant
+    sans URL. Lève une exception si l'identifiant n'est pas un identifiant Akwam.
+    """
+    match = RGX_CONTENT_ID.fullmatch(raw_id)
+    if match:
+        known = _content_ids.get(raw_id) or (metadata_store.get_content_id(raw_id) if metadata_store else None)
+        if known:
+            return known
+        # Akwam accepte l'URL sans le slug
+        kind = next(kind for kind, letter in CONTENT_KINDS.items() if letter == match.group(1))
+        return None, f"https://ak.sv/{kind}/{match.group(2)}"
+    decoded = base64.urlsafe_b64decode(raw_id.replace("akwam", "")).decode("utf-8")
+    if "::" in decoded:
+        title, url = decoded.split("::", 1)
+        return title, url
+    return decoded, None
+
+def content_title(url):
+    """Titre connu localement pour une URL (index de recherche, base de métadonnées), sinon le slug.
+
+    Lit la base : depuis le code async, passer par run_in_thread.
+    """
+    doc = search_index.docs.get(url)
+    if doc:
+        return doc["title"]
+    if metadata_store:
+        stored, _ = metadata_store.get(url)
+        if stored and stored.get("name"):
+            return stored["name"]
+    slug = unquote(url.rstrip("/").rsplit("/", 1)[-1])
+    return slug.replace("-", " ") if not slug.isdigit() else f"Akwam {slug}"
+
+
+# Analyse HTML hors de la boucle d'événements : pool de processus optionnel
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", 0))  # 0 = analyse dans le processus courant
+
+_parse_executor = None
+
+def get_parse_executor():
+    global _parse_executor
+    if _parse_executor is None:
+        # spawn : pas de fork d'un processus qui a déjà des threads et des sockets ouverts
+        _parse_executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _parse_executor
+
+def shutdown_parse_executor():
+    global _parse_executor
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait=False, cancel_futures=True)
+        _parse_executor = None
+
+async def run_parser(fn, *args):
+    """Exécute une fonction d'analyse pure, dans le pool de processus si PARSE_WORKERS > 0."""
+    global _parse_executor
+    with trace_span("parse"):
+        if PARSE_WORKERS <= 0:
+            return fn(*args)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(get_parse_executor(), fn, *args)
+        except BrokenProcessPool:
+            # Un worker est mort (OOM...) : recréer le pool au prochain appel, analyser ici cette fois
+            print("⚠️ Pool d'analyse cassé, analyse dans le processus")
+            _parse_executor = None
+            return fn(*args)
+
+def parse_listing_page(content):
+    """Extrait les entrées (titre, lien, vignette, année, tags) d'une page de liste Akwam.
+
+    Fonction pure (octets en entrée, tuples en sortie) : peut tourner dans un autre processus.
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    entries = []
+
+    widget_body = soup.find('div', class_='widget-body row flex-wrap')
+    if not widget_body:
+        return []
+
+    for item in widget_body.find_all('div', class_='col-lg-auto col-md-4 col-6 mb-12'):
+        entry_box = item.find('div', class_='entry-box')
+        if not entry_box:
+            continue
+
+        title_elem = entry_box.find('h3', class_='entry-title')
+        title = title_elem.text.strip() if title_elem else 'No Title'
+
+        link_elem = entry_box.find('a', class_='box')
+        link = link_elem['href'] if link_elem else '#'
+
+        thumb_elem = entry_box.find('img', class_='img-fluid w-100 lazy')
+        thumb = thumb_elem['data-src'] if thumb_elem and thumb_elem.has_attr('data-src') else thumb_elem['src'] if thumb_elem else ''
+
+        year_elem = entry_box.find('span', class_='badge badge-pill badge-secondary')
+        year = year_elem.text.strip() if year_elem else 'N/A'
+
+        tags = []
+        for tag_elem in entry_box.find_all('span', class_='badge badge-pill badge-light'):
+            tags.append(tag_elem.text.strip())
+
+        entries.append((title, link, thumb, year, tags))
+
+    return entries
+
+async def fetch_entries_by_genre(url):
+    """Gather entries for a specific genre (async)."""
+    try:
+        response = await flaresolverr_get_async(url)
+        if response.status_code != 200:
+            return []
+
+        entries = await run_parser(parse_listing_page, response.content)
+        for title, link, thumb, year, tags in entries:
+            index_title(title, link, thumb, year)
+
+        return entries
+    except Exception as e:
+        print(f"Error fetching entries: {e}")
+        return []
+
+async def fetch_entries_for_page(url, page):
+    """Fetch entries for a specific page (async)."""
     page_url = f"{url}&page={page}"
     return await fetch_entries_by_genre(page_url)
 
+RGX_DOWNLOAD_PAGE = r'https?://(\w*\.*\w+\.\w+/download/.*?)"'  # Lien /download/ sur la page /link/
+RGX_FINAL_LINK = r'([a-z0-9]{4,}\.\w+\.\w+/download/.*?)"'  # Lien du fichier sur la page /download/
+
+def resolve_direct_url(quality_url, hops=None):
+    """Suit les pages /link/ puis /download/ d'une qualité jusqu'à l'URL finale (None si introuvable).
+
+    Si `hops` est une liste, on y ajoute les clés de cache des pages intermédiaires.
+    """
+    try:
+        if not quality_url.startswith(('http://', 'https://')):
+            quality_url = HTTP + quality_url
+
+        if hops is not None:
+            hops += [make_cache_key(quality_url), match_cache_key(quality_url, RGX_DOWNLOAD_PAGE)]
+        with trace_span("link", quality_url):
+            parsed = fetch_matches_sync(quality_url, RGX_DOWNLOAD_PAGE)
+
+        download_url = parsed[0]
+        if not download_url.startswith(('http://', 'https://')):
+            download_url = HTTP + download_url
+
+        if hops is not None:
+            hops += [make_cache_key(download_url), match_cache_key(download_url, RGX_FINAL_LINK)]
+        with trace_span("download", download_url):
+            parsed = fetch_matches_sync(download_url, RGX_FINAL_LINK)
+
+        final_url = parsed[0]
+        if not final_url.startswith(('http://', 'https://')):
+            final_url = HTTP + final_url
+
+        return final_url
+    except Exception as e:
+        return None
+
 class Akwam:
     def __init__(self, url):
         response = flaresolverr_get_sync(url)
         url = str(response.url)
         self.url = [url, url[:-1]][url[-1] == '/']
+        add_akwam_host(urlsplit(self.url).hostname)
         self.search_url = self.url + '/search?q='
         self.cur_page = None
         self.qualities = {}
+        self.sizes = {}
         self.results = None
         self.posters = {}
         self.parsed = None
@@ -561,7 +2495,8 @@ class Akwam:
         self.cur_page = flaresolverr_get_sync(search_url)
         
         # Scraper les résultats avec BeautifulSoup pour récupérer les images
-        soup = BeautifulSoup(self.cur_page.content, 'html.parser')
+        with trace_span("parse"):
+            soup = BeautifulSoup(self.cur_page.content, 'html.parser')
         self.results = {}
         self.posters = {}  # Dictionnaire pour stocker les posters
         
@@ -584,45 +2519,30 @@ class Akwam:
                 if title and link:
                     self.results[title] = link
                     self.posters[title] = thumb
+                    index_title(title, link, thumb)
         
         print(f"🔍 Found {len(self.results)} results from Akwam")
 
     def load(self):
-        self.cur_page = flaresolverr_get_sync(self.cur_url)
-        self.parse(RGX_QUALITY_TAG, no_multi_line=True)
-        i = 0
-        for q in ['1080p', '720p', '480p']:
-            if f'>{q}</' in self.cur_page.text:
-                self.qualities[q] = self.parsed[i]
-                i += 1
+        # Les onglets de qualité précèdent leur contenu : on s'arrête quand chaque qualité annoncée
+        # a son lien et sa taille
+        def quality_scan_done(matches):
+            links, sizes, labels = parse_quality_scan(matches)
+            return bool(labels) and all(q in links and q in sizes for q in labels)
+
+        self.parsed = fetch_matches_sync(self.cur_url, RGX_QUALITY_SCAN, quality_scan_done, no_multi_line=True)
+        self.qualities, self.sizes, _ = parse_quality_scan(self.parsed)
 
     def get_direct_url(self, quality='720p'):
         try:
-            quality_url = self.qualities[quality]
-            if not quality_url.startswith(('http://', 'https://')):
-                quality_url = HTTP + quality_url
-
-            self.cur_page = flaresolverr_get_sync(quality_url)
-            self.parse(r'https?://(\w*\.*\w+\.\w+/download/.*?)"')
-
-            download_url = self.parsed[0]
-            if not download_url.startswith(('http://', 'https://')):
-                download_url = HTTP + download_url
-
-            self.cur_page = flaresolverr_get_sync(download_url)
-            self.parse(r'([a-z0-9]{4,}\.\w+\.\w+/download/.*?)"')
-
-            final_url = self.parsed[0]
-            if not final_url.startswith(('http://', 'https://')):
-                final_url = HTTP + final_url
-
-            self.dl_url = final_url
+            self.dl_url = resolve_direct_url(self.qualities[quality])
         except Exception as e:
             self.dl_url = None
 
     def fetch_episodes(self):
         self.cur_page = flaresolverr_get_sync(self.cur_url)
-        soup = BeautifulSoup(self.cur_page.content, 'html.parser')
+        with trace_span("parse"):
+            soup = BeautifulSoup(self.cur_page.content, 'html.parser')
         self.results = {}
         
         # Trouver tous les épisodes dans le HTML
@@ -660,8 +2580,9 @@ async def root():
 @app.get("/cache/stats")
 async def cache_stats():
     """Retourne les statistiques du cache et de la session."""
-    total_entries = len(_cache)
-    total_expired = sum(1 for key in _cache_expiry if datetime.now() >= _cache_expiry[key])
+    with _cache_lock:
+        total_entries = len(_cache)
+        total_expired = sum(1 for key in _cache_expiry if datetime.now() >= _cache_expiry[key])
     total_valid = total_entries - total_expired
     
     session_info = {
@@ -679,17 +2600,84 @@ async def cache_stats():
             "valid_entries": total_valid,
             "expired_entries": total_expired,
             "cache_ttl_seconds": CACHE_TTL,
-            "memory_usage_estimate_mb": round(sum(len(str(v)) for v in _cache.values()) / 1024 / 1024, 2)
+            "memory_usage_estimate_mb": round(sum(len(str(v)) for v in _cache.values()) / 1024 / 1024, 2),
+            "max_entries": CACHE_MAX_ENTRIES,
+            "admission": CACHE_ADMISSION,
+            "hit_ratio": round(_cache_stats["hits"] / max(1, _cache_stats["hits"] + _cache_stats["misses"]), 3),
+            **_cache_stats
+        },
+        "session": session_info,
+        "transport": {
+            upstream: {
+                "max_connections": int(transport_setting(upstream, "MAX_CONNECTIONS")),
+                "max_keepalive": int(transport_setting(upstream, "MAX_KEEPALIVE")),
+                "http2": HTTP2_AVAILABLE and transport_setting(upstream, "HTTP2").lower() == "true",
+            }
+            for upstream in HTTP_TRANSPORT_DEFAULTS
+        },
+        "dns_cache_entries": len(_dns_cache),
+        "streaming": _stream_stats,
+        "links": {"tracked": len(_link_tracker), **_link_stats},
+        "scheduler": {
+            "rate_per_host": UPSTREAM_RATE,
+            "burst": UPSTREAM_BURST,
+            "tokens": {host: round(bucket.tokens, 2) for host, bucket in upstream_scheduler.buckets.items()},
+            "by_priority": upstream_scheduler.stats,
+        },
+        "concurrency": {
+            "adaptive": ADAPTIVE_CONCURRENCY_ENABLE,
+            "limit": round(concurrency_limiter.limit, 2),
+            "in_flight": concurrency_limiter.in_flight,
+            "min": concurrency_limiter.minimum,
+            "max": concurrency_limiter.maximum,
+            "latency_target_seconds": CONCURRENCY_LATENCY_TARGET,
+            **concurrency_limiter.stats
+        },
+        "canonical_urls": canonical_report(),
+        "inflight_fetches": len(_inflight),
+        "cancellation": _cancel_stats,
+        "l2": cache_l2.report() if cache_l2 else {"enabled": False},
+        "seasons": {"enabled": SEASON_FANOUT_ENABLE, **_season_stats},
+        "images": {
+            "enabled": IMAGE_PROXY_ENABLE,
+            "downscale": IMAGE_DOWNSCALE,
+            **({"entries": len(image_cache.entries), "bytes": image_cache.total, **image_cache.stats} if image_cache else {}),
         },
-        "session": session_info
+        "metadata_store": {
+            "enabled": metadata_store is not None,
+            "entries": await run_in_thread(metadata_store.count) if metadata_store else 0,
+            "crawler": _crawl_stats,
+        },
+        "meta_prefetch": {
+            "enabled": META_PREFETCH_ENABLE,
+            "pending": len(_meta_prefetch_pending),
+            "awaiting_open": len(_meta_prefetched),
+            **_meta_prefetch_stats
+        },
+        "render_cache": {
+            "entries": len(_render_cache),
+            "bytes": sum(len(r.body) + sum(len(v) for v in r.variants.values()) for r in _render_cache.values()),
+            "brotli": brotli is not None,
+            **_render_stats
+        }
     })
 
+@app.get("/trace/{trace_id}")
+async def get_trace(trace_id: str):
+    """Trace détaillée d'une requête faite avec X-Trace: 1 ou ?trace=1."""
+    trace = _traces.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return JSONResponse(content=trace)
+
 @app.post("/cache/clear")
 async def clear_cache():
-    """Vide le cache complètement."""
-    count = len(_cache)
-    _cache.clear()
-    _cache_expiry.clear()
+    """Vide le cache local (le L2 partagé, s'il existe, expire de lui-même)."""
+    with _cache_lock:
+        count = len(_cache)
+        _cache.clear()
+        _cache_expiry.clear()
+    _render_cache.clear()
     return JSONResponse(content={"message": "Cache cleared successfully", "entries_removed": count})
 
 @app.post("/session/refresh")
@@ -712,89 +2700,318 @@ async def configure(request: Request):
 
 @app.get("/manifest.json")
 @app.get("/{params}/manifest.json")
-async def get_manifest():
-    return JSONResponse(content=manifest_data)
+async def get_manifest(request: Request):
+    return cached_json_response(request, manifest_data, "manifest", last_modified=MANIFEST_LAST_MODIFIED, body=MANIFEST_BODY)
 
 @app.get("/static/{file_path:path}")
 async def function(file_path: str):
     response = FileResponse(f"templates/{file_path}")
     return response
 
+# Proxy d'images : affiches et fonds Akwam récupérés une fois, servis depuis un cache disque borné
+IMAGE_PROXY_ENABLE = os.getenv("IMAGE_PROXY_ENABLE", "false").lower() == "true"
+IMAGE_PROXY_BASE_URL = os.getenv("IMAGE_PROXY_BASE_URL", "").rstrip("/")  # URL publique de l'addon (vide = hôte de la requête)
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_MB", 256)) * 1024 * 1024
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_MB", 10)) * 1024 * 1024  # Au-delà, redirection vers l'original
+IMAGE_MAX_AGE = int(os.getenv("IMAGE_MAX_AGE_SECONDS", 30 * 24 * 3600))
+IMAGE_DOWNSCALE = os.getenv("IMAGE_DOWNSCALE", "true").lower() == "true" and Image is not None
+IMAGE_THUMB_SIZE = (260, 380)  # Taille des vignettes des listes Akwam
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+    (b"RIFF", "image/webp"),
+)
+
+def image_type(data):
+    """Type MIME d'après les premiers octets (None pour une page HTML, un défi Cloudflare...)."""
+    for signature, media_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return media_type
+    return None
+
+class ImageCache:
+    """Images sur disque, évincées de la moins récemment servie quand la taille totale dépasse max_bytes."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # clé -> taille
+        self.total = 0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "downscaled": 0, "fallbacks": 0}
+        os.makedirs(directory, exist_ok=True)
+        files = [entry for entry in os.scandir(directory) if entry.is_file() and not entry.name.endswith(".tmp")]
+        for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+            self.entries[entry.name] = entry.stat().st_size
+            self.total += entry.stat().st_size
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+        try:
+            with open(os.path.join(self.directory, key), "rb") as f:
+                return f.read()
+        except OSError:
+            self.remove(key)
+            return None
+
+    def put(self, key, data):
+        path = os.path.join(self.directory, key)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+        with self.lock:
+            self.total += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.stats["stored"] += 1
+            victims = []
+            while self.total > self.max_bytes and len(self.entries) > 1:
+                victim, size = self.entries.popitem(last=False)
+                self.total -= size
+                victims.append(victim)
+            self.stats["evicted"] += len(victims)
+        for victim in victims:
+            try:
+                os.remove(os.path.join(self.directory, victim))
+            except OSError:
+                pass
+
+    def remove(self, key):
+        with self.lock:
+            self.total -= self.entries.pop(key, 0)
+
+image_cache = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES) if IMAGE_PROXY_ENABLE else None
+_image_fetches = {}
+
+def is_akwam_image(url):
+    """Seules les images des domaines Akwam et de leurs sous-domaines passent par le proxy (pas de proxy ouvert)."""
+    host = (urlsplit(url).hostname or "").lower()
+    return host in _akwam_hosts or any(host.endswith("." + akwam_host) for akwam_host in _akwam_hosts)
+
+def proxy_image_url(url, request, variant="full"):
+    """URL du proxy pour une image Akwam ; les autres URL (placeholders...) sont laissées telles quelles."""
+    if not IMAGE_PROXY_ENABLE or not url or not url.startswith(("http://", "https://")) or not is_akwam_image(url):
+        return url
+    if variant == "thumb" and not IMAGE_DOWNSCALE:
+        variant = "full"
+    token = base64.urlsafe_b64encode(url.encode()).decode().rstrip("=")
+    return f"{IMAGE_PROXY_BASE_URL or str(request.base_url).rstrip('/')}/img/{variant}/{token}"
+
+def proxy_meta_images(request, meta):
+    """Affiche réduite à la taille des vignettes, fond en taille réelle."""
+    if "poster" in meta:
+        meta["poster"] = proxy_image_url(meta["poster"], request, "thumb")
+    if "background" in meta:
+        meta["background"] = proxy_image_url(meta["background"], request)
+    return meta
+
+def downscale_image(data):
+    """Réduit une image à IMAGE_THUMB_SIZE (JPEG) ; renvoie l'original si elle est déjà petite ou illisible."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width <= IMAGE_THUMB_SIZE[0] and image.height <= IMAGE_THUMB_SIZE[1]:
+                return data
+            image.thumbnail(IMAGE_THUMB_SIZE)
+            output = io.BytesIO()
+            image.convert("RGB").save(output, "JPEG", quality=85, optimize=True)
+    except Exception as e:
+        print(f"⚠️ Réduction d'image impossible: {e}")
+        return data
+    image_cache.stats["downscaled"] += 1
+    return output.getvalue()
+
+async def download_image(url, variant, key):
+    """Télécharge une image (une seule fois pour des demandes simultanées), la réduit si besoin et la met en cache."""
+    await upstream_scheduler.acquire_async(url)
+    with trace_span("download", "image"):
+        response = await get_http_client(url).get(url)
+    data = response.content
+    if response.status_code != 200 or len(data) > IMAGE_MAX_BYTES or image_type(data) is None:
+        print(f"⚠️ Image non récupérable ({response.status_code}): {url[:80]}")
+        return None
+    if variant == "thumb":
+        data = await run_in_thread(downscale_image, data)
+    await run_in_thread(image_cache.put, key, data)
+    return data
+
+@app.get("/img/{variant}/{token}")
+async def image_proxy(request: Request, variant: str, token: str):
+    if not IMAGE_PROXY_ENABLE or variant not in ("full", "thumb"):
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        url = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not url.startswith(("http://", "https://")) or not is_akwam_image(url):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    # Une image Akwam ne change pas de contenu : la clé suffit comme ETag
+    key = hashlib.md5(f"{variant}:{canonical_url(url)}".encode()).hexdigest()
+    headers = {"Cache-Control": f"public, max-age={IMAGE_MAX_AGE}, immutable", "ETag": f'"{key}"'}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    data = await run_in_thread(image_cache.get, key)
+    if data is None:
+        if key not in _image_fetches:
+            _image_fetches[key] = asyncio.ensure_future(download_image(url, variant, key))
+            _image_fetches[key].add_done_callback(lambda _: _image_fetches.pop(key, None))
+        try:
+            data = await asyncio.shield(_image_fetches[key])
+        except Exception as e:
+            print(f"⚠️ Proxy d'image: {e}")
+            data = None
+    if data is None:
+        # Dernier recours : le client va chercher l'image à la source
+        image_cache.stats["fallbacks"] += 1
+        return RedirectResponse(url=url, status_code=302)
+    return Response(content=data, media_type=image_type(data) or "image/jpeg", headers=headers)
+
 from concurrent.futures import ThreadPoolExecutor
 
+# Déconnexion du client : arrêter le travail que lui seul attend
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL_SECONDS", 0.5))
+
+_request_cancelled = contextvars.ContextVar("request_cancelled", default=None)
+
+def request_cancelled():
+    """Vrai si le client de la requête en cours s'est déconnecté (utilisable depuis les threads)."""
+    cancelled = _request_cancelled.get()
+    return cancelled is not None and cancelled.is_set()
+
+async def run_in_thread(fn, *args):
+    """run_in_executor en conservant le contexte (priorité, trace, annulation)."""
+    return await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, fn, *args)
+
+async def run_until_disconnected(request, coro):
+    """Exécute le traitement d'une route et l'annule si le client se déconnecte avant la fin.
+
+    Les coroutines sont annulées ; le code des threads voit request_cancelled() et abandonne
+    les tâches pas encore commencées. Les requêtes partagées ou déjà envoyées continuent.
+    """
+    cancelled = threading.Event()
+    _request_cancelled.set(cancelled)
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        cancelled.set()
+        raise
+    print(f"🔌 Client déconnecté, abandon de: {request.url.path}")
+    _cancel_stats["disconnects"] += 1
+    cancelled.set()
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+    return Response(status_code=499)
+
 @app.get("/stream/{stream_type}/{stream_id}")
 @app.get("/{config}/stream/{stream_type}/{stream_id}")
 async def get_results(
+    request: Request,
     config: str = None,
     stream_type: str = Path(..., description="Media type"),
     stream_id: str = Path(..., description="ID du contenu"),
 ):
     print("Getting stream link for", stream_id)
+    _upstream_priority.set("stream")  # Contexte propre à la requête
+    return await run_until_disconnected(request, run_in_thread(find_streams, stream_type, stream_id))
+
+def find_streams(stream_type, stream_id):
+    """Recherche les flux d'un identifiant (dans un thread : tout le code Akwam est synchrone)."""
     try:
-        title = stream_id.replace("akwam", "").replace(".json", "")
-        try:
-            title = title.split(":")[0]
-        except:
-            pass
-        decoded_data = base64.urlsafe_b64decode(title).decode("utf-8")
-        is_base64 = True
+        decoded_title, direct_url = decode_content_id(stream_id.replace(".json", "").split(":")[0])
+        is_akwam_id = True
     except Exception:
-        is_base64 = False
-
-    if is_base64:
-        # Vérifier si le format contient une URL (nouveau format: "titre::url")
-        if "::" in decoded_data:
-            parts = decoded_data.split("::", 1)
-            decoded_title = parts[0]
-            direct_url = parts[1]
+        is_akwam_id = False
+
+    if is_akwam_id:
+        # Identifiant court ou ancien format "titre::url" : l'URL est connue
+        if direct_url:
+            decoded_title = decoded_title or content_title(direct_url)
             print(f"🎯 Direct URL found for '{decoded_title}': {direct_url}")
             
             # Utiliser directement l'URL sans refaire de recherche
             akwam_results = {decoded_title: direct_url}
         else:
             # Ancien format : juste le titre, il faut faire une recherche
-            decoded_title = decoded_data
-            print(f"Searching for '{decoded_title}' in Akwam directly (type: {stream_type})")
-            akwam = Akwam('https://ak.sv/')
-            akwam.type = stream_type
-            akwam.search(decoded_title)
-            akwam_results = akwam.results
+            akwam_results = search_index.lookup_title(decoded_title, stream_type) if SEARCH_INDEX_ENABLE else {}
+            if akwam_results:
+                print(f"📇 '{decoded_title}' trouvé dans l'index local")
+            else:
+                print(f"Searching for '{decoded_title}' in Akwam directly (type: {stream_type})")
+                akwam = Akwam('https://ak.sv/')
+                akwam.type = stream_type
+                akwam.search(decoded_title)
+                akwam_results = akwam.results
             
             print(f"Found {len(akwam_results)} results for '{decoded_title}'")
             if akwam_results:
                 print(f"Results: {list(akwam_results.keys())}")
 
         streams = []
-        # Limiter à 3 threads max pour éviter de surcharger FlareSolverr
-        max_workers = int(os.getenv("MAX_WORKERS", 3))
+        # Autant de titres en parallèle que la limite de concurrence courante (les requêtes restent bornées par elle)
+        max_workers = max(1, int(concurrency_limiter.limit))
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             futures = []
             for akwam_title, akwam_url in akwam_results.items():
+                if request_cancelled():
+                    break
                 # Détecter si on a un lien direct vers un épisode spécifique
                 is_episode_direct = "/episode/" in akwam_url
                 
-                if stream_type == "series" and not is_episode_direct:
+                merged_episodes = season_episodes(akwam_url) if stream_type == "series" and not is_episode_direct else None
+                if merged_episodes:
+                    # Série déjà fusionnée (toutes saisons) : pas de nouvelle page à télécharger
+                    prefetch_cache([streams_cache_key(link) for _, _, link in merged_episodes])
+                    for season, episode, episode_url in merged_episodes:
+                        futures.append(submit_with_priority(executor, get_stream_link, episode_url,
+                                                            f"Saison {season} Épisode {episode}", stream_type))
+                elif stream_type == "series" and not is_episode_direct:
                     # Pour les séries (page principale), récupérer tous les épisodes
                     akwam_series = Akwam('https://ak.sv/')
                     akwam_series.type = stream_type
                     akwam_series.cur_url = akwam_url
                     akwam_series.fetch_episodes()
+                    prefetch_cache([streams_cache_key(link) for link in akwam_series.results.values()])
                     for episode_key, episode_url in akwam_series.results.items():
-                        futures.append(executor.submit(get_stream_link, episode_url, episode_key, stream_type))
+                        futures.append(submit_with_priority(executor, get_stream_link, episode_url, episode_key, stream_type))
                 else:
                     # Pour les films OU les épisodes directs
                     print(f"Adding item to process: {akwam_title}")
-                    futures.append(executor.submit(get_stream_link, akwam_url, akwam_title, stream_type))
+                    futures.append(submit_with_priority(executor, get_stream_link, akwam_url, akwam_title, stream_type))
 
             print(f"Processing {len(futures)} items...")
-            for future in as_completed(futures):
-                try:
-                    stream = future.result()
-                    if stream:
-                        print(f"Got stream: {stream['title']}")
-                        streams.append(stream)
-                except Exception as e:
-                    print(f"Error when getting link : {e}")
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=DISCONNECT_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        item_streams = future.result()
+                        if item_streams:
+                            print(f"Got {len(item_streams)} stream(s): {item_streams[0]['title']}")
+                            streams.extend(item_streams)
+                    except Exception as e:
+                        print(f"Error when getting link : {e}")
+                if request_cancelled():
+                    # Les titres déjà en cours continuent et alimentent le cache, les autres sont abandonnés
+                    _cancel_stats["cancelled_jobs"] += sum(future.cancel() for future in pending)
+                    break
 
         # Trier les streams par numéro d'épisode pour les séries
         if stream_type == "series" and streams:
@@ -819,27 +3036,103 @@ def extract_season_episode(title):
         return int(match.group(1)), int(match.group(2))
     return 1, 1
 
-def get_stream_link(url, title, stream_type):
-    """Gathers stream link for a given URL."""
+STREAM_QUALITIES = ['1080p', '720p', '480p']
+STREAM_RESOLVE_BUDGET = float(os.getenv("STREAM_RESOLVE_BUDGET_SECONDS", 25))  # Budget par titre pour toutes les qualités
+STREAM_PARTIAL_TTL = int(os.getenv("STREAM_PARTIAL_TTL_SECONDS", 120))  # Résultat incomplet (budget dépassé) gardé peu de temps
+
+def parse_size(size_text):
+    """Convertit "1.2 GB" / "700 MB" en octets (None si illisible)."""
+    match = re.match(r'\s*([0-9.]+)\s*([KMG]?B)', size_text or '')
+    if not match:
+        return None
+    try:
+        value = float(match.group(1))
+    except ValueError:
+        return None
+    return int(value * {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}[match.group(2)])
+
+def streams_cache_key(url):
+    """Clé des streams d'une page : sans le titre, qui dépend du chemin d'appel (épisode seul ou saison fusionnée)."""
+    return make_cache_key(f"streams:{canonical_url(url)}")
+
+def titled_streams(streams, title):
+    """Streams en cache (sans titre) -> streams Stremio titrés pour l'appelant."""
+    titled = []
+    for stream in streams:
+        stream = dict(stream)
+        size = stream.pop("size", None)
+        stream["title"] = f"{title}\n💾 {size}" if size else title
+        titled.append(stream)
+    return titled
+
+def get_stream_link(url, title, stream_type, track=True):
+    """Gathers every available quality for a given URL, resolved in parallel (one stream per quality)."""
+    if track:
+        track_link_request(url, title, stream_type)
+    cache_key = streams_cache_key(url)
+    cached_streams = get_cache(cache_key)
+    if cached_streams:
+        return titled_streams(cached_streams, title)
+    if request_cancelled():
+        _cancel_stats["cancelled_jobs"] += 1
+        return None
+
     try:
         # Créer une nouvelle instance Akwam pour chaque thread
         akwam = Akwam('https://ak.sv/')
         akwam.type = stream_type
         akwam.cur_url = url
         akwam.load()
-        
-        # Essayer différentes qualités jusqu'à en trouver une qui fonctionne
-        for quality in ['1080p', '720p', '480p']:
-            if quality in akwam.qualities:
-                akwam.get_direct_url(quality)
-                if akwam.dl_url:
-                    print(f"✓ Found {quality} link for: {title}")
-                    return {
-                        "title": title,  # Titre sans la qualité
-                        "name": f"Akwam {quality}",  # Nom du provider avec qualité
-                        "url": akwam.dl_url
-                    }
-        
+        if request_cancelled():
+            # La page du titre est en cache, les liens seront résolus à la prochaine demande
+            _cancel_stats["cancelled_jobs"] += 1
+            return None
+
+        # Résoudre toutes les qualités en même temps : la latence est celle de la chaîne la plus lente.
+        # Un thread par qualité du titre : le budget court dès le départ des chaînes, sans file
+        # partagée avec les autres titres (la concurrence upstream reste bornée par le limiteur).
+        hops = {quality: [] for quality in akwam.qualities}
+        executor = ThreadPoolExecutor(max_workers=max(1, len(akwam.qualities)))
+        futures = {submit_with_priority(executor, resolve_direct_url, quality_url, hops[quality]): quality
+                   for quality, quality_url in akwam.qualities.items()}
+        done, pending = wait(futures, timeout=STREAM_RESOLVE_BUDGET)
+        # Les chaînes en retard continuent en fond et alimentent le cache des pages
+        executor.shutdown(wait=False)
+        for future in pending:
+            print(f"⏱️ {futures[future]} non résolu dans le budget pour: {title}")
+
+        resolved = {}
+        for future in done:
+            try:
+                dl_url = future.result()
+            except Exception as e:
+                print(f"✗ Error resolving {futures[future]} for {title}: {e}")
+                continue
+            if dl_url:
+                resolved[futures[future]] = dl_url
+
+        streams = []
+        for quality in STREAM_QUALITIES:
+            if quality not in resolved:
+                continue
+            size = akwam.sizes.get(quality)
+            stream = {
+                "size": size,  # Le titre est ajouté à la lecture (titled_streams)
+                "name": f"Akwam {quality}",  # Nom du provider avec qualité
+                "url": resolved[quality]
+            }
+            size_bytes = parse_size(size)
+            if size_bytes:
+                stream["behaviorHints"] = {"videoSize": size_bytes}
+            streams.append(stream)
+
+        if streams:
+            print(f"✓ Found {', '.join(resolved)} for: {title}")
+            # Résultat incomplet : gardé peu de temps, la prochaine demande profitera des pages déjà en cache
+            set_cache(cache_key, streams, ttl=STREAM_PARTIAL_TTL if pending else None)
+            track_resolved_links(url, {q: (resolved[q], hops[q]) for q in resolved})
+            return titled_streams(streams, title)
+
         print(f"✗ No valid quality found for: {title}")
     except Exception as e:
         print(f"✗ Error getting stream link for {title}: {e}")
@@ -847,183 +3140,358 @@ def get_stream_link(url, title, stream_type):
         traceback.print_exc()
     return None
     
+# Suivi de fraîcheur des liens de téléchargement résolus
+LINK_TRACKER_ENABLE = os.getenv("LINK_TRACKER_ENABLE", "true").lower() == "true"
+LINK_PROBE_INTERVAL = int(os.getenv("LINK_PROBE_INTERVAL_SECONDS", 300))
+LINK_PROBE_TOP = int(os.getenv("LINK_PROBE_TOP", 20))  # Nombre de titres les plus demandés vérifiés par tour
+LINK_MAX_AGE = int(os.getenv("LINK_MAX_AGE_SECONDS", CACHE_TTL))  # Durée de vie supposée d'un lien résolu
+LINK_REFRESH_RATIO = 0.8  # Re-résoudre avant l'expiration, à 80% de la durée de vie
+
+_link_tracker = {}  # URL du titre -> {"title", "type", "hits", "resolved_at", "links": {qualité: (url, clés des pages)}}
+_link_tracker_lock = threading.Lock()
+_link_stats = {"probes": 0, "probe_failures": 0, "refreshes": 0}
+
+def track_link_request(url, title, stream_type):
+    """Compte une demande de streams pour un titre (sert à choisir les titres à surveiller)."""
+    if not LINK_TRACKER_ENABLE:
+        return
+    with _link_tracker_lock:
+        entry = _link_tracker.setdefault(url, {"title": title, "type": stream_type, "hits": 0,
+                                               "resolved_at": None, "links": {}})
+        entry["hits"] += 1
+
+def track_resolved_links(url, links):
+    """Mémorise les URLs finales d'un titre et les pages /link/ et /download/ qui y mènent."""
+    if not LINK_TRACKER_ENABLE:
+        return
+    with _link_tracker_lock:
+        entry = _link_tracker.get(url)
+        if entry is not None:
+            entry["links"] = links
+            entry["resolved_at"] = datetime.now()
+
+def invalidate_links(url):
+    """Oublie les streams d'un titre et les pages intermédiaires qui ont servi à les résoudre."""
+    with _link_tracker_lock:
+        entry = _link_tracker.get(url)
+        links = dict(entry["links"]) if entry else {}
+    invalidate_cache(streams_cache_key(url))
+    for dl_url, hop_keys in links.values():
+        for key in hop_keys:
+            invalidate_cache(key)
+
+async def probe_link(dl_url):
+    """Vérifie qu'un lien répond encore : HEAD, puis GET d'un seul octet si HEAD est refusé."""
+    client = get_http_client(dl_url)
+    try:
+        response = await client.head(dl_url)
+        if response.status_code < 400:
+            return True
+        if response.status_code not in (403, 405, 501):
+            return False
+        response = await client.get(dl_url, headers={"Range": "bytes=0-0"})
+        return response.status_code in (200, 206)
+    except Exception as e:
+        print(f"⚠️ Sonde échouée pour {dl_url[:60]}: {e}")
+        return False
+
+async def refresh_title_links(url):
+    """Invalide puis re-résout les liens d'un titre en arrière-plan."""
+    with _link_tracker_lock:
+        entry = dict(_link_tracker.get(url) or {})
+    if not entry:
+        return
+    invalidate_links(url)
+    _link_stats["refreshes"] += 1
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _run_with_priority, "warm", get_stream_link, url, entry["title"], entry["type"], False)
+
+async def check_hot_links():
+    """Un tour de vérification : sonde les titres les plus demandés et rafraîchit ceux qui en ont besoin."""
+    now = datetime.now()
+    with _link_tracker_lock:
+        hottest = sorted(_link_tracker.items(), key=lambda item: item[1]["hits"], reverse=True)[:LINK_PROBE_TOP]
+        hottest = [(url, entry["resolved_at"], dict(entry["links"])) for url, entry in hottest]
+        for entry in _link_tracker.values():
+            # Décroissance : les titres ne restent "chauds" que s'ils sont encore demandés
+            entry["hits"] //= 2
+
+    for url, resolved_at, links in hottest:
+        if not resolved_at or not links:
+            continue
+        if (now - resolved_at).total_seconds() > LINK_MAX_AGE * LINK_REFRESH_RATIO:
+            print(f"♻️ Liens proches de l'expiration, re-résolution: {url}")
+            await refresh_title_links(url)
+            continue
+        for quality, (dl_url, hop_keys) in links.items():
+            _link_stats["probes"] += 1
+            if not await probe_link(dl_url):
+                _link_stats["probe_failures"] += 1
+                print(f"💀 Lien {quality} mort, re-résolution: {url}")
+                await refresh_title_links(url)
+                break
+
+    # Oublier les titres qui ne sont plus demandés
+    hot_urls = {url for url, _, _ in hottest}
+    with _link_tracker_lock:
+        for url in [url for url, entry in _link_tracker.items() if entry["hits"] == 0 and url not in hot_urls]:
+            del _link_tracker[url]
+
+async def link_tracker_loop():
+    while True:
+        await asyncio.sleep(LINK_PROBE_INTERVAL)
+        try:
+            await check_hot_links()
+        except Exception as e:
+            print(f"⚠️ Erreur du suivi des liens: {e}")
+
+_link_tracker_task = None
+
+async def start_link_tracker():
+    global _link_tracker_task
+    if LINK_TRACKER_ENABLE:
+        _link_tracker_task = asyncio.create_task(link_tracker_loop())
+
+async def stop_link_tracker():
+    if _link_tracker_task:
+        _link_tracker_task.cancel()
+
 @app.get("/catalog/{catalog_type}/{catalog_id}.json")
 @app.get("/{param}/catalog/{catalog_type}/{catalog_id}.json")
 async def get_catalog(
+    request: Request,
     param: str = None,
     catalog_type: str = Path(..., description="Catalog type (Akwam Movies or Akwam Series)"),
     catalog_id: str = Path(..., description="Catalog ID"),
     skip: int = Query(default=0, description="Number of elements to skip"),
 ):
-    limit = 24
-
-    akwam = Akwam('https://ak.sv/')
-    # Garder le type Stremio original (movie ou series)
-    stremio_type = catalog_type
-    
-    # Convertir pour l'URL Akwam (movies ou series)
-    akwam_type = "movies" if catalog_type == "movie" else catalog_type
-    genre_url = f'{akwam.url}/{akwam_type}?category=0'
-
-    page = (skip // limit) + 1
-    genre_url_with_page = f"{genre_url}&page={page}"
-    print(f"Fetching page {page} from: {genre_url_with_page}")
-
-    try:
-        entries = await fetch_entries_by_genre(genre_url_with_page)
-    except Exception as e:
-        print(f"Error when getting page {page}: {e}")
-        return JSONResponse(content={"metas": []})
-
-    start_index = skip % limit
-    end_index = start_index + limit
-    paginated_entries = entries[start_index:end_index]
-
-    metas = []
-    for title, link, thumb, year, tags in paginated_entries:
-        # Utiliser le format title::url pour avoir les métadonnées complètes
-        encoded_id = base64.urlsafe_b64encode(f"{title}::{link}".encode()).decode()
-        metas.append({
-            "id": f"akwam{encoded_id}",
-            "type": stremio_type,  # Utiliser le type Stremio original
-            "name": title,
-            "poster": thumb,
-            "year": year,
-            "genres": tags,
-            "background": thumb
-        })
-    print(f"Returning {len(metas)} metas (skip={skip}, limit={limit})")
-    return JSONResponse(content={"metas": metas})
+    return await render_catalog(request, catalog_type, 0, skip)
 
 @app.get("/catalog/{catalog_type}/{catalog_id}/genre={genre}&skip={skip}.json")
 @app.get("/{param}/catalog/{catalog_type}/{catalog_id}/genre={genre}&skip={skip}.json")
 async def get_catalog_by_genre_with_skip(
+    request: Request,
     param: str = None,
     catalog_type: str = Path(..., description="Catalog type (Akwam Movies or Akwam Series)"),
     catalog_id: str = Path(..., description="Catalog ID"),
     genre: str = Path(..., description="Selected genre"),
     skip: int = Path(..., description="Nombre d'éléments à sauter"),
 ):
-    return await get_catalog_by_genre(param, catalog_type, catalog_id, genre, skip)
+    return await get_catalog_by_genre(request, param, catalog_type, catalog_id, genre, skip)
 
 @app.get("/catalog/{catalog_type}/{catalog_id}/genre={genre}.json")
 @app.get("/{param}/catalog/{catalog_type}/{catalog_id}/genre={genre}.json")
 async def get_catalog_by_genre_initial(
+    request: Request,
     param: str = None,
     catalog_type: str = Path(..., description="Catalog type (Akwam Movies or Akwam Series)"),
     catalog_id: str = Path(..., description="Catalog ID"),
     genre: str = Path(..., description="Selected genre"),
 ):
-    return await get_catalog_by_genre(param, catalog_type, catalog_id, genre, skip=0)
+    return await get_catalog_by_genre(request, param, catalog_type, catalog_id, genre, skip=0)
 
 async def get_catalog_by_genre(
+    request: Request,
     param: str,
     catalog_type: str,
     catalog_id: str,
     genre: str,
     skip: int,
 ):
-    limit = 24
-    akwam = Akwam('https://ak.sv/')
-    # Garder le type Stremio original (movie ou series)
-    stremio_type = catalog_type
-    
-    genres = get_genres(catalog_type)
-
     genre_id = None
-    for name, id_ in genres:
+    for name, id_ in get_genres(catalog_type):
         if name == genre:
             genre_id = id_
             break
 
     if not genre_id:
-        return JSONResponse(content={"metas": []})
-
-    # Convertir pour l'URL Akwam (movies ou series)
-    akwam_type = "movies" if catalog_type == "movie" else catalog_type
-    genre_url = f'{akwam.url}/{akwam_type}?category={genre_id}'
-
-    page = (skip // limit) + 1
-    genre_url_with_page = f"{genre_url}&page={page}"
-    print(f"Fetching page {page} from: {genre_url_with_page}")
-
-    try:
-        entries = await fetch_entries_by_genre(genre_url_with_page)
-    except Exception as e:
-        print(f"Error when getting page {page}: {e}")
-        return JSONResponse(content={"metas": []})
+        return cached_json_response(request, {"metas": []}, "catalog", max_age=HTTP_CACHE_EMPTY_MAX_AGE)
 
-    start_index = skip % limit
-    end_index = start_index + limit
-    paginated_entries = entries[start_index:end_index]
-
-    metas = []
-    for title, link, thumb, year, tags in paginated_entries:
-        # Utiliser le format title::url pour avoir les métadonnées complètes
-        encoded_id = base64.urlsafe_b64encode(f"{title}::{link}".encode()).decode()
-        metas.append({
-            "id": f"akwam{encoded_id}",
-            "type": stremio_type,  # Utiliser le type Stremio original
-            "name": title,
-            "poster": thumb,
-            "year": year,
-            "genres": tags,
-            "background": thumb
-        })
-    print(f"Returning {len(metas)} metas (skip={skip}, limit={limit})")
-    return JSONResponse(content={"metas": metas})
+    return await render_catalog(request, catalog_type, genre_id, skip)
 
 @app.get("/catalog/{catalog_type}/{catalog_id}/skip={skip}.json")
 @app.get("/{param}/catalog/{catalog_type}/{catalog_id}/skip={skip}.json")
 async def get_catalog_with_skip(
+    request: Request,
     param: str = None,
     catalog_type: str = Path(..., description="Catalog type (Akwam Movies or Akwam Series)"),
     catalog_id: str = Path(..., description="Catalog ID"),
     skip: int = Path(..., description="Number of elements to skip"),
 ):
-    limit = 24
+    return await render_catalog(request, catalog_type, 0, skip)
+
+# Moteur de catalogue commun (toutes catégories, tous genres)
+CATALOG_PAGE_SIZE = 24  # Nombre d'entrées par page Akwam
+CATALOG_PREFETCH_ENABLE = os.getenv("CATALOG_PREFETCH_ENABLE", "true").lower() == "true"
+
+_background_tasks = set()
+
+def spawn_background(coro, priority="prefetch"):
+    """Lance une tâche de fond en gardant une référence (sinon elle peut être collectée)."""
+    async def run_detached():
+        # La tâche hérite du contexte de la requête : ne pas polluer ses dépendances de rendu
+        _render_sources.set(None)
+        _request_cancelled.set(None)
+        _upstream_priority.set(priority)
+        try:
+            return await coro
+        except Exception as e:
+            print(f"⚠️ Tâche de fond échouée: {e}")
+
+    task = asyncio.create_task(run_detached())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def fetch_catalog_window(category_url, skip, limit=CATALOG_PAGE_SIZE):
+    """Récupère les entrées [skip, skip + limit) en chargeant en parallèle les pages Akwam couvertes."""
+    first_page = skip // CATALOG_PAGE_SIZE + 1
+    last_page = (skip + limit - 1) // CATALOG_PAGE_SIZE + 1
+    pages = list(range(first_page, last_page + 1))
+    print(f"Fetching pages {pages} from: {category_url}")
+    if cache_l2:
+        # Toutes les pages de la fenêtre en un seul MGET plutôt qu'un GET par page
+        await run_in_thread(prefetch_cache, [make_cache_key(f"{category_url}&page={page}") for page in pages])
+    results = await asyncio.gather(*(fetch_entries_for_page(category_url, page) for page in pages))
+    entries = [entry for page_entries in results for entry in page_entries]
+    offset = skip - (first_page - 1) * CATALOG_PAGE_SIZE
+    page_urls = [f"{category_url}&page={page}" for page in pages]
+    return entries[offset:offset + limit], page_urls
+
+async def prefetch_catalog_page(category_url, page):
+    """Réchauffe la page suivante du catalogue si elle n'est pas déjà en cache."""
+    page_url = f"{category_url}&page={page}"
+    if await get_cache_async(make_cache_key(page_url)) is not None:
+        return
+    print(f"⏩ Prefetch page {page} from: {category_url}")
+    await fetch_entries_for_page(category_url, page)
+
+# Préchargement des pages de contenu listées dans un catalogue ou une recherche (opt-in)
+META_PREFETCH_ENABLE = os.getenv("META_PREFETCH_ENABLE", "false").lower() == "true"
+META_PREFETCH_PER_PAGE = int(os.getenv("META_PREFETCH_PER_PAGE", 12))  # Premières entrées préchargées par page servie
+META_PREFETCH_CONCURRENCY = int(os.getenv("META_PREFETCH_CONCURRENCY", 2))
+META_PREFETCH_MAX_PENDING = int(os.getenv("META_PREFETCH_MAX_PENDING", 48))  # Au-delà, les nouvelles demandes sont abandonnées
+
+_meta_prefetched = OrderedDict()  # url -> date du préchargement, en attente d'une ouverture
+_meta_prefetch_pending = set()
+_meta_prefetch_semaphore = None
+_meta_prefetch_stats = {"scheduled": 0, "skipped": 0, "dropped": 0, "fetched": 0, "failed": 0, "used": 0, "wasted": 0}
+
+def expire_meta_prefetches():
+    """Compte comme gaspillés les préchargements jamais ouverts avant l'expiration du cache."""
+    limit = datetime.now() - timedelta(seconds=CACHE_TTL)
+    while _meta_prefetched:
+        url, fetched_at = next(iter(_meta_prefetched.items()))
+        if fetched_at > limit and len(_meta_prefetched) <= CACHE_MAX_ENTRIES:
+            break
+        _meta_prefetched.popitem(last=False)
+        _meta_prefetch_stats["wasted"] += 1
+
+def record_meta_open(akwam_url):
+    """Marque un préchargement comme utile si la page est encore en cache à l'ouverture."""
+    fetched_at = _meta_prefetched.pop(akwam_url, None)
+    if fetched_at is None:
+        return
+    with _cache_lock:
+        still_cached = make_cache_key(akwam_url) in _cache
+    _meta_prefetch_stats["used" if still_cached else "wasted"] += 1
+
+async def prefetch_meta_page(akwam_url, media_type):
+    """Charge et analyse une page de contenu pour que le prochain /meta la trouve en cache."""
+    global _meta_prefetch_semaphore
+    if _meta_prefetch_semaphore is None:
+        _meta_prefetch_semaphore = asyncio.Semaphore(META_PREFETCH_CONCURRENCY)
+    try:
+        async with _meta_prefetch_semaphore:
+            metadata = await scrape_akwam_metadata(akwam_url, media_type)
+        if metadata:
+            _meta_prefetched[akwam_url] = datetime.now()
+            _meta_prefetch_stats["fetched"] += 1
+        else:
+            _meta_prefetch_stats["failed"] += 1
+    finally:
+        _meta_prefetch_pending.discard(akwam_url)
+
+def schedule_meta_prefetch(urls, media_type):
+    """Programme en basse priorité le préchargement des premières entrées d'une page servie."""
+    if not META_PREFETCH_ENABLE:
+        return
+    expire_meta_prefetches()
+    for akwam_url in urls[:META_PREFETCH_PER_PAGE]:
+        if akwam_url in _meta_prefetch_pending or akwam_url in _meta_prefetched:
+            continue
+        with _cache_lock:
+            cached = make_cache_key(akwam_url) in _cache
+        if cached:
+            _meta_prefetch_stats["skipped"] += 1
+            continue
+        if len(_meta_prefetch_pending) >= META_PREFETCH_MAX_PENDING:
+            _meta_prefetch_stats["dropped"] += 1
+            continue
+        _meta_prefetch_pending.add(akwam_url)
+        _meta_prefetch_stats["scheduled"] += 1
+        spawn_background(prefetch_meta_page(akwam_url, media_type))
+
+async def render_catalog(request, catalog_type, category, skip):
+    """Réponse d'un catalogue, abandonnée si le client se déconnecte."""
+    return await run_until_disconnected(request, build_catalog_response(request, catalog_type, category, skip))
+
+async def build_catalog_response(request, catalog_type, category, skip):
+    """Construit la réponse d'un catalogue (catégorie 0 = tout) à partir de skip."""
+    limit = CATALOG_PAGE_SIZE
+    _upstream_priority.set("catalog")
+    render_key, rendered = get_rendered(request)
+    if rendered:
+        return rendered_response(request, rendered)
 
-    akwam = Akwam('https://ak.sv/')
-    # Garder le type Stremio original (movie ou series)
-    stremio_type = catalog_type
-    
     # Convertir pour l'URL Akwam (movies ou series)
     akwam_type = "movies" if catalog_type == "movie" else catalog_type
-    genre_url = f'{akwam.url}/{akwam_type}?category=0'
-
-    page = (skip // limit) + 1
-    genre_url_with_page = f"{genre_url}&page={page}"
-    print(f"Fetching page {page} from: {genre_url_with_page}")
 
     try:
-        entries = await fetch_entries_by_genre(genre_url_with_page)
+        # Résolution async du domaine : jamais de fetch sync (scheduler, limiteur) sur la boucle
+        category_url = f'{await resolve_base_url()}/{akwam_type}?category={category}'
+        entries, page_urls = await fetch_catalog_window(category_url, skip, limit)
     except Exception as e:
-        print(f"Error when getting page {page}: {e}")
-        return JSONResponse(content={"metas": []})
-
-    start_index = skip % limit
-    end_index = start_index + limit
-    paginated_entries = entries[start_index:end_index]
+        print(f"Error when getting catalog window (skip={skip}): {e}")
+        return cached_json_response(request, {"metas": []}, "catalog", max_age=HTTP_CACHE_EMPTY_MAX_AGE)
 
     metas = []
-    for title, link, thumb, year, tags in paginated_entries:
-        # Utiliser le format title::url pour avoir les métadonnées complètes
-        encoded_id = base64.urlsafe_b64encode(f"{title}::{link}".encode()).decode()
+    for title, link, thumb, year, tags in entries:
         metas.append({
-            "id": f"akwam{encoded_id}",
-            "type": stremio_type,  # Utiliser le type Stremio original
+            "id": register_content(title, link),
+            "type": catalog_type,  # Garder le type Stremio original (movie ou series)
             "name": title,
-            "poster": thumb,
+            "poster": proxy_image_url(thumb, request),
             "year": year,
             "genres": tags,
-            "background": thumb
+            "background": proxy_image_url(thumb, request)
         })
+
+    if CATALOG_PREFETCH_ENABLE and len(entries) == limit:
+        # Dernière page couverte par la fenêtre suivante (les autres sont déjà en cache)
+        next_page = (skip + 2 * limit - 1) // CATALOG_PAGE_SIZE + 1
+        spawn_background(prefetch_catalog_page(category_url, next_page))
+    schedule_meta_prefetch([link for _, link, _, _, _ in entries], catalog_type)
+    await save_content_ids()
+
     print(f"Returning {len(metas)} metas (skip={skip}, limit={limit})")
-    return JSONResponse(content={"metas": metas})
+    fetched_at = [t for t in (page_last_modified(url) for url in page_urls) if t]
+    return cached_json_response(request, {"metas": metas}, "catalog",
+                                last_modified=max(fetched_at) if fetched_at else None,
+                                max_age=None if metas else HTTP_CACHE_EMPTY_MAX_AGE, render_key=render_key)
+
+_search_sources = OrderedDict()  # (type, requête normalisée) -> "index" ou "akwam"
+
+def remember_search_source(key, source):
+    _search_sources[key] = source
+    _search_sources.move_to_end(key)
+    while len(_search_sources) > SEARCH_SOURCES_MAX:
+        _search_sources.popitem(last=False)
 
 @app.get("/catalog/{catalog_type}/{catalog_id}/search={search_query}.json")
 @app.get("/{param}/catalog/{catalog_type}/{catalog_id}/search={search_query}.json")
 async def get_catalog_search(
+    request: Request,
     param: str = None,
     catalog_type: str = Path(..., description="Catalog type"),
     catalog_id: str = Path(..., description="Catalog ID"),
@@ -1031,32 +3499,326 @@ async def get_catalog_search(
     skip: int = Query(default=0, description="Number of elements to skip"),
 ):
     print(f"Searching Akwam for: '{search_query}' (type: {catalog_type})")
-    limit = 20
-    
-    akwam = Akwam('https://ak.sv/')
-    akwam.type = catalog_type
-    
+    _upstream_priority.set("catalog")
+    return await run_until_disconnected(request, build_search_response(request, catalog_type, search_query, skip))
+
+async def build_search_response(request, catalog_type, search_query, skip):
+    """Résultats d'une recherche : index local ou recherche Akwam (une seule source par requête)."""
+    limit = SEARCH_PAGE_SIZE
+    render_key, rendered = get_rendered(request)
+    if rendered:
+        return rendered_response(request, rendered)
+
+    # Répondre depuis l'index local s'il a assez de hits exacts, sans appel à Akwam.
+    # Toutes les pages d'une même requête viennent de la même source (skip n'a pas le même sens).
+    source_key = (catalog_type, normalize_search_text(search_query))
+    source = _search_sources.get(source_key)
+    hits = []
+    if SEARCH_INDEX_ENABLE and source != "akwam":
+        hits = search_index.search(search_query, media_type=catalog_type, fuzzy=False)
+        if source is None:
+            source = "index" if len(hits) >= SEARCH_INDEX_MIN_HITS else "akwam"
+    remember_search_source(source_key, source or "akwam")
+    if source == "index":
+        page_hits = hits[skip:skip + limit]
+        metas = []
+        for doc in page_hits:
+            metas.append({
+                "id": register_content(doc['title'], doc['url']),
+                "type": catalog_type,
+                "name": doc['title'],
+                "poster": proxy_image_url(doc['poster'], request) or "https://via.placeholder.com/300x450?text=No+Image",
+            })
+        print(f"📇 Returning {len(metas)} search results from local index")
+        schedule_meta_prefetch([doc['url'] for doc in page_hits], catalog_type)
+        await save_content_ids()
+        return cached_json_response(request, {"metas": metas}, "search",
+                                    max_age=None if metas else HTTP_CACHE_EMPTY_MAX_AGE, render_key=render_key)
+
     # Calculer la page pour Akwam (ils utilisent aussi la pagination)
     page = (skip // limit) + 1
-    akwam.search(search_query, page=page)
+    # Akwam() et search() font des requêtes sync : dans un thread, jamais sur la boucle
+    akwam = await run_in_thread(search_akwam, search_query, catalog_type, page)
     
     print(f"Found {len(akwam.results)} results for '{search_query}'")
     
     metas = []
     for title, url in list(akwam.results.items())[:limit]:
-        # Stocker l'URL et le titre ensemble pour éviter de perdre l'information
-        # Format: titre::url
-        id_data = f"{title}::{url}"
         poster = akwam.posters.get(title, "https://via.placeholder.com/300x450?text=No+Image")
         metas.append({
-            "id": f"akwam{base64.urlsafe_b64encode(id_data.encode()).decode()}",
+            "id": register_content(title, url),
             "type": catalog_type,
             "name": title,
-            "poster": poster,
+            "poster": proxy_image_url(poster, request),
         })
     
     print(f"Returning {len(metas)} search results")
-    return JSONResponse(content={"metas": metas})
+    schedule_meta_prefetch(list(akwam.results.values())[:limit], catalog_type)
+    await save_content_ids()
+    return cached_json_response(request, {"metas": metas}, "search",
+                                max_age=None if metas else HTTP_CACHE_EMPTY_MAX_AGE, render_key=render_key)
+
+# Séries en plusieurs saisons : Akwam publie chaque saison sur sa propre page /series/
+SEASON_FANOUT_ENABLE = os.getenv("SEASON_FANOUT_ENABLE", "true").lower() == "true"
+SEASON_FANOUT_MAX_PAGES = int(os.getenv("SEASON_FANOUT_MAX_PAGES", 12))  # Autres saisons récupérées au plus
+SEASON_FANOUT_CONCURRENCY = int(os.getenv("SEASON_FANOUT_CONCURRENCY", 4))
+SEASON_FANOUT_BUDGET = float(os.getenv("SEASON_FANOUT_BUDGET_SECONDS", 20))  # Au-delà, on sert les saisons déjà reçues
+
+RGX_SEASON = re.compile(r'\b(?:الموسم|موسم|season|saison)\s+(\S+(?:\s+عشر)?)')
+RGX_SERIES_LINK = re.compile(r'/series/\d+')
+RGX_SERIES_WORD = re.compile(r'^(?:مسلسل|series)\s+')
+# Ordinaux arabes sous leur forme normalisée (normalize_search_text)
+SEASON_ORDINALS = {
+    'الاول': 1, 'الثاني': 2, 'الثالث': 3, 'الرابع': 4, 'الخامس': 5, 'السادس': 6,
+    'السابع': 7, 'الثامن': 8, 'التاسع': 9, 'العاشر': 10, 'الحادي عشر': 11, 'الثاني عشر': 12,
+}
+
+_season_stats = {"merged": 0, "unit_hits": 0, "pages_fetched": 0, "pages_failed": 0, "over_budget": 0}
+
+def season_number(text):
+    """Numéro de saison lu dans un titre ("الموسم الثاني", "Season 3"...), None s'il n'y en a pas."""
+    match = RGX_SEASON.search(normalize_search_text(text))
+    if not match:
+        return None
+    word = match.group(1)
+    if word.isdigit():
+        return int(word)
+    return SEASON_ORDINALS.get(word) or SEASON_ORDINALS.get(word.split()[0])
+
+def season_base(text):
+    """Titre d'une série sans la mention de saison : identique pour toutes les saisons d'une même série."""
+    text = RGX_SEASON.sub(' ', normalize_search_text(text))
+    return RGX_SERIES_WORD.sub('', re.sub(r'\s+', ' ', text).strip())
+
+def season_links(soup, name):
+    """Liens vers les autres saisons de la même série : [(numéro, url), ...] triés par saison."""
+    base = season_base(name)
+    found = {}
+    if not base:
+        return []
+    for link in soup.find_all('a', href=RGX_SERIES_LINK):
+        href = link['href']
+        slug = unquote(href.rstrip('/').rsplit('/', 1)[-1]).replace('-', ' ')
+        for text in (link.get_text(' ', strip=True), link.get('title', ''), slug):
+            number = season_number(text)
+            if number and season_base(text) == base:
+                found.setdefault(href, number)
+                break
+    return sorted((number, href) for href, number in found.items())
+
+def parse_meta_page(content, media_type='movie'):
+    """Extrait les métadonnées (et les épisodes pour une série) d'une page de contenu Akwam.
+
+    Fonction pure (octets en entrée, dict en sortie) : peut tourner dans un autre processus.
+    """
+    page_text = content.decode('utf-8', errors='ignore')
+    soup = BeautifulSoup(content, 'html.parser')
+    metadata = {}
+    
+    # Titre
+    title_elem = soup.find('h1', class_='entry-title')
+    if title_elem:
+        metadata['name'] = title_elem.text.strip()
+    
+    # Poster
+    poster_img = soup.find('div', class_='col-lg-3').find('img') if soup.find('div', class_='col-lg-3') else None
+    if poster_img and poster_img.get('src'):
+        metadata['poster'] = poster_img['src'].replace('thumb/260x380/', '')
+    
+    # Année
+    year_match = re.search(r'السنة\s*:\s*(\d{4})', page_text)
+    if year_match:
+        metadata['year'] = year_match.group(1)
+    
+    # Description (قصة الفيلم ou قصة المسلسل)
+    story_widget = soup.find('div', class_='widget-body')
+    if story_widget:
+        story_text = story_widget.find('div', class_='text-white')
+        if story_text:
+            # Extraire le texte et nettoyer
+            desc = story_text.get_text(separator=' ', strip=True)
+            # Enlever les répétitions et nettoyer
+            desc = re.sub(r'مشاهدة و تحميل (فيلم|مسلسل) .+? حيث يدور العمل حول ', '', desc)
+            desc = re.sub(r'\s+', ' ', desc).strip()
+            # Prendre seulement le premier paragraphe s'il y a répétition
+            paragraphs = desc.split('.')
+            if paragraphs:
+                metadata['description'] = '.'.join(paragraphs[:2]) + '.' if len(paragraphs) > 1 else paragraphs[0]
+    
+    # Genres
+    genres = []
+    genre_badges = soup.find_all('a', class_='badge badge-pill badge-light')
+    for badge in genre_badges:
+        genre_name = badge.text.strip()
+        if genre_name:
+            genres.append(genre_name)
+    metadata['genres'] = genres
+    
+    # Rating
+    rating_elem = soup.find('span', class_='mx-2')
+    if rating_elem:
+        rating_text = rating_elem.text.strip()
+        rating_match = re.search(r'(\d+\.?\d*)\s*/\s*(\d+\.?\d*)', rating_text)
+        if rating_match:
+            # Utiliser la deuxième valeur (note sur 10)
+            metadata['imdbRating'] = rating_match.group(2)
+    
+    # Background (première image de la galerie)
+    gallery_img = soup.find('a', attrs={'data-fancybox': 'movie-gallery'})
+    if gallery_img and gallery_img.get('href'):
+        metadata['background'] = gallery_img['href']
+    elif poster_img and poster_img.get('src'):
+        # Fallback: utiliser le poster comme background
+        metadata['background'] = poster_img['src'].replace('thumb/260x380/', '')
+    
+    # Pour les séries : récupérer les épisodes
+    if media_type == 'series':
+        videos = []
+        episode_links = []
+        season = season_number(metadata.get('name', '')) or 1
+        
+        # Dictionnaire pour convertir les mois arabes en numéros
+        arabic_months = {
+            'يناير': '01', 'فبراير': '02', 'مارس': '03', 'أبريل': '04',
+            'مايو': '05', 'يونيو': '06', 'يوليو': '07', 'أغسطس': '08',
+            'سبتمبر': '09', 'أكتوبر': '10', 'نوفمبر': '11', 'ديسمبر': '12'
+        }
+        
+        # Chercher tous les épisodes dans la page
+        episodes = soup.find_all('div', class_='bg-primary2')
+        for episode_div in episodes:
+            h2 = episode_div.find('h2', class_='font-size-18')
+            if not h2:
+                continue
+            
+            link = h2.find('a')
+            if not link:
+                continue
+            
+            episode_url = link.get('href', '')
+            episode_title = link.text.strip()
+            
+            # Extraire la date de sortie
+            date_elem = episode_div.find('p', class_='entry-date')
+            released_date = f"{metadata.get('year', '2025')}-01-01T00:00:00.000Z"  # Default
+            if date_elem:
+                date_text = date_elem.text.strip()
+                # Format: "السبت 01 فبراير 2020 - 10:42 صباحا"
+                # Extraire: jour, mois (arabe), année
+                date_match = re.search(r'(\d{2})\s+(\w+)\s+(\d{4})', date_text)
+                if date_match:
+                    day = date_match.group(1)
+                    month_ar = date_match.group(2)
+                    year = date_match.group(3)
+                    month = arabic_months.get(month_ar, '01')
+                    released_date = f"{year}-{month}-{day}T00:00:00.000Z"
+            
+            # Extraire le numéro d'épisode depuis "حلقة 1 : ..."
+            episode_match = re.search(r'حلقة\s*(\d+)', episode_title)
+            if episode_match:
+                episode_num = int(episode_match.group(1))
+                
+                # Créer l'objet vidéo au format Stremio avec la vraie date
+                video = {
+                    "id": content_id(f"Episode {episode_num}", episode_url),
+                    "title": f"Episode {episode_num}",
+                    "episode": episode_num,
+                    "season": season,
+                    "released": released_date
+                }
+                videos.append(video)
+                episode_links.append((f"Episode {episode_num}", episode_url))
+        
+        # Trier les épisodes par numéro
+        videos.sort(key=lambda x: x['episode'])
+        metadata['videos'] = videos
+        metadata['episode_links'] = episode_links  # Pour enregistrer les identifiants côté appelant
+        metadata['season'] = season
+        metadata['season_links'] = season_links(soup, metadata.get('name', ''))
+    
+    return metadata
+
+def season_unit_key(season_url):
+    """Clé du cache qui mène d'une page de saison à la liste fusionnée de toute la série."""
+    return make_cache_key(f"season-unit:{canonical_url(season_url)}")
+
+async def fetch_season_page(season_url):
+    """Télécharge et analyse la page d'une autre saison ; None en cas d'échec."""
+    response = await flaresolverr_get_async(season_url)
+    if response.status_code != 200:
+        return None
+    return await run_parser(parse_meta_page, response.content, 'series')
+
+async def merge_seasons(akwam_url, metadata):
+    """Fusionne les épisodes de toutes les saisons liées depuis la page d'une série.
+
+    Les autres saisons sont récupérées en parallèle (SEASON_FANOUT_CONCURRENCY à la fois,
+    SEASON_FANOUT_BUDGET au plus). La liste fusionnée est mise en cache comme un tout, sous une
+    clé commune à toutes les saisons, et réutilisée par la recherche de flux.
+    """
+    own_url = canonical_url(akwam_url)
+    seasons = {own_url: metadata.get('season', 1)}
+    for number, season_url in metadata['season_links']:
+        season_url = canonical_url(season_url)
+        if season_url not in seasons and number not in seasons.values() and len(seasons) <= SEASON_FANOUT_MAX_PAGES:
+            seasons[season_url] = number
+    if len(seasons) < 2:
+        return
+
+    unit_key = make_cache_key("seasons:" + "|".join(sorted(seasons)))
+    unit = await get_cache_async(unit_key)
+    if unit is not None:
+        _season_stats["unit_hits"] += 1
+        metadata['videos'] = unit["videos"]
+        return
+
+    semaphore = asyncio.Semaphore(SEASON_FANOUT_CONCURRENCY)
+
+    async def fetch(season_url):
+        async with semaphore:
+            return season_url, await fetch_season_page(season_url)
+
+    with trace_span("seasons", f"{len(seasons) - 1} pages"):
+        tasks = [asyncio.ensure_future(fetch(season_url)) for season_url in seasons if season_url != own_url]
+        done, pending = await asyncio.wait(tasks, timeout=SEASON_FANOUT_BUDGET)
+    for task in pending:
+        task.cancel()
+    _season_stats["over_budget"] += len(pending)
+
+    pages = {own_url: metadata}
+    for task in done:
+        if task.cancelled() or task.exception() is not None or task.result()[1] is None:
+            _season_stats["pages_failed"] += 1
+            continue
+        season_url, page = task.result()
+        pages[season_url] = page
+        _season_stats["pages_fetched"] += 1
+
+    videos, episodes = [], []
+    for season_url, page in pages.items():
+        number = seasons[season_url]
+        for title, link in page.pop('episode_links', []):
+            register_content(title, link)
+        for video in page.get('videos', []):
+            videos.append({**video, "season": number})
+            episodes.append((number, video["episode"], (await decode_content_id_async(video["id"]))[1]))
+    videos.sort(key=lambda video: (video["season"], video["episode"]))
+    episodes.sort()
+    metadata['videos'] = videos
+    print(f"📚 {len(pages)}/{len(seasons)} saisons fusionnées ({len(videos)} épisodes)")
+
+    if len(pages) == len(seasons):
+        # Unité complète seulement : une saison manquante sera retentée au prochain accès
+        set_cache(unit_key, {"videos": videos, "episodes": episodes})
+        for season_url in seasons:
+            set_cache(season_unit_key(season_url), unit_key)
+        _season_stats["merged"] += 1
+
+def season_episodes(series_url):
+    """Épisodes de toutes les saisons [(saison, épisode, url), ...] si la série a déjà été fusionnée."""
+    unit_key = get_cache(season_unit_key(series_url))
+    unit = get_cache(unit_key) if unit_key else None
+    return unit["episodes"] if unit else None
 
 async def scrape_akwam_metadata(akwam_url, media_type='movie'):
     """Scrape les métadonnées directement depuis la page Akwam (async)."""
@@ -1067,130 +3829,20 @@ async def scrape_akwam_metadata(akwam_url, media_type='movie'):
             print(f"✗ Failed to fetch Akwam page: {response.status_code}")
             return None
         
-        soup = BeautifulSoup(response.content, 'html.parser')
-        metadata = {}
-        
-        # Titre
-        title_elem = soup.find('h1', class_='entry-title')
-        if title_elem:
-            metadata['name'] = title_elem.text.strip()
-        
-        # Poster
-        poster_img = soup.find('div', class_='col-lg-3').find('img') if soup.find('div', class_='col-lg-3') else None
-        if poster_img and poster_img.get('src'):
-            metadata['poster'] = poster_img['src'].replace('thumb/260x380/', '')
-        
-        # Année
-        year_match = re.search(r'السنة\s*:\s*(\d{4})', response.text)
-        if year_match:
-            metadata['year'] = year_match.group(1)
-        
-        # Description (قصة الفيلم ou قصة المسلسل)
-        story_widget = soup.find('div', class_='widget-body')
-        if story_widget:
-            story_text = story_widget.find('div', class_='text-white')
-            if story_text:
-                # Extraire le texte et nettoyer
-                desc = story_text.get_text(separator=' ', strip=True)
-                # Enlever les répétitions et nettoyer
-                desc = re.sub(r'مشاهدة و تحميل (فيلم|مسلسل) .+? حيث يدور العمل حول ', '', desc)
-                desc = re.sub(r'\s+', ' ', desc).strip()
-                # Prendre seulement le premier paragraphe s'il y a répétition
-                paragraphs = desc.split('.')
-                if paragraphs:
-                    metadata['description'] = '.'.join(paragraphs[:2]) + '.' if len(paragraphs) > 1 else paragraphs[0]
-        
-        # Genres
-        genres = []
-        genre_badges = soup.find_all('a', class_='badge badge-pill badge-light')
-        for badge in genre_badges:
-            genre_name = badge.text.strip()
-            if genre_name:
-                genres.append(genre_name)
-        metadata['genres'] = genres
-        
-        # Rating
-        rating_elem = soup.find('span', class_='mx-2')
-        if rating_elem:
-            rating_text = rating_elem.text.strip()
-            rating_match = re.search(r'(\d+\.?\d*)\s*/\s*(\d+\.?\d*)', rating_text)
-            if rating_match:
-                # Utiliser la deuxième valeur (note sur 10)
-                metadata['imdbRating'] = rating_match.group(2)
-        
-        # Background (première image de la galerie)
-        gallery_img = soup.find('a', attrs={'data-fancybox': 'movie-gallery'})
-        if gallery_img and gallery_img.get('href'):
-            metadata['background'] = gallery_img['href']
-        elif poster_img and poster_img.get('src'):
-            # Fallback: utiliser le poster comme background
-            metadata['background'] = poster_img['src'].replace('thumb/260x380/', '')
-        
-        # Pour les séries : récupérer les épisodes
-        if media_type == 'series':
-            print(f"📺 Scraping episodes for series")
-            videos = []
-            
-            # Dictionnaire pour convertir les mois arabes en numéros
-            arabic_months = {
-                'يناير': '01', 'فبراير': '02', 'مارس': '03', 'أبريل': '04',
-                'مايو': '05', 'يونيو': '06', 'يوليو': '07', 'أغسطس': '08',
-                'سبتمبر': '09', 'أكتوبر': '10', 'نوفمبر': '11', 'ديسمبر': '12'
-            }
-            
-            # Chercher tous les épisodes dans la page
-            episodes = soup.find_all('div', class_='bg-primary2')
-            for episode_div in episodes:
-                h2 = episode_div.find('h2', class_='font-size-18')
-                if not h2:
-                    continue
-                
-                link = h2.find('a')
-                if not link:
-                    continue
-                
-                episode_url = link.get('href', '')
-                episode_title = link.text.strip()
-                
-                # Extraire la date de sortie
-                date_elem = episode_div.find('p', class_='entry-date')
-                released_date = f"{metadata.get('year', '2025')}-01-01T00:00:00.000Z"  # Default
-                if date_elem:
-                    date_text = date_elem.text.strip()
-                    # Format: "السبت 01 فبراير 2020 - 10:42 صباحا"
-                    # Extraire: jour, mois (arabe), année
-                    date_match = re.search(r'(\d{2})\s+(\w+)\s+(\d{4})', date_text)
-                    if date_match:
-                        day = date_match.group(1)
-                        month_ar = date_match.group(2)
-                        year = date_match.group(3)
-                        month = arabic_months.get(month_ar, '01')
-                        released_date = f"{year}-{month}-{day}T00:00:00.000Z"
-                
-                # Extraire le numéro d'épisode depuis "حلقة 1 : ..."
-                episode_match = re.search(r'حلقة\s*(\d+)', episode_title)
-                if episode_match:
-                    episode_num = int(episode_match.group(1))
-                    
-                    # Créer l'ID encodé pour l'épisode au format: titre::url
-                    episode_id_data = f"Episode {episode_num}::{episode_url}"
-                    episode_id_encoded = base64.urlsafe_b64encode(episode_id_data.encode()).decode()
-                    
-                    # Créer l'objet vidéo au format Stremio avec la vraie date
-                    video = {
-                        "id": f"akwam{episode_id_encoded}",
-                        "title": f"Episode {episode_num}",
-                        "episode": episode_num,
-                        "season": 1,  # Pour l'instant on met toujours saison 1
-                        "released": released_date
-                    }
-                    videos.append(video)
-            
-            # Trier les épisodes par numéro
-            videos.sort(key=lambda x: x['episode'])
-            metadata['videos'] = videos
-            print(f"✓ Found {len(videos)} episodes")
+        metadata = await run_parser(parse_meta_page, response.content, media_type)
+        for episode_title, episode_url in metadata.pop('episode_links', []):
+            register_content(episode_title, episode_url)
+        if metadata.get('season_links') and SEASON_FANOUT_ENABLE:
+            await merge_seasons(akwam_url, metadata)
+        metadata.pop('season', None)
+        metadata.pop('season_links', None)
+        if 'videos' in metadata:
+            print(f"📺 Found {len(metadata['videos'])} episodes")
         
+        index_title(metadata.get('name'), akwam_url, metadata.get('poster', ''), metadata.get('year', ''))
+        if metadata_store and metadata.get('name'):
+            await run_in_thread(metadata_store.put, akwam_url, media_type, metadata)
+        await save_content_ids()
         print(f"✓ Scraped metadata: {metadata.get('name', 'Unknown')}")
         return metadata
         
@@ -1200,27 +3852,280 @@ async def scrape_akwam_metadata(akwam_url, media_type='movie'):
         traceback.print_exc()
         return None
 
+# Crawler incrémental : parcourt les listes (plus récents en premier) jusqu'au premier contenu connu
+# Actif par défaut seulement avec une base persistante : en mémoire, chaque redémarrage re-scraperait tout
+METADATA_CRAWL_ENABLE = os.getenv("METADATA_CRAWL_ENABLE", "false" if METADATA_STORE_PATH in ("", ":memory:") else "true").lower() == "true"
+METADATA_CRAWL_INTERVAL = int(os.getenv("METADATA_CRAWL_INTERVAL_SECONDS", 1800))
+METADATA_CRAWL_MAX_PAGES = int(os.getenv("METADATA_CRAWL_MAX_PAGES", 3))  # Par liste et par passage (borne du premier remplissage)
+
+_crawl_stats = {"runs": 0, "pages": 0, "scraped": 0, "failed": 0, "last_run": None}
+_metadata_crawler_task = None
+
+async def crawl_listing(base_url, akwam_type, media_type):
+    """Scrape les nouveautés d'une liste ; s'arrête au premier contenu déjà vu par un passage précédent.
+
+    Un contenu déjà en base (scrape à la demande) n'est pas re-scrapé mais n'arrête pas le passage.
+    """
+    category_url = f"{base_url}/{akwam_type}?category=0"
+    for page in range(1, METADATA_CRAWL_MAX_PAGES + 1):
+        entries = await fetch_entries_for_page(category_url, page)
+        _crawl_stats["pages"] += 1
+        if not entries:
+            return
+        for _, link, _, _, _ in entries:
+            if await run_in_thread(metadata_store.was_crawled, link):
+                return
+            if await run_in_thread(metadata_store.has, link):
+                await run_in_thread(metadata_store.mark_crawled, link)
+            elif await scrape_akwam_metadata(link, media_type):
+                _crawl_stats["scraped"] += 1
+                await run_in_thread(metadata_store.mark_crawled, link)
+            else:
+                _crawl_stats["failed"] += 1
+
+async def crawl_new_metadata():
+    base_url = await resolve_base_url()
+    for akwam_type, media_type in (("movies", "movie"), ("series", "series")):
+        await crawl_listing(base_url, akwam_type, media_type)
+    _crawl_stats["runs"] += 1
+    _crawl_stats["last_run"] = datetime.now().isoformat(timespec="seconds")
+    print(f"🕷️ Crawl terminé: {await run_in_thread(metadata_store.count)} contenus en base")
+
+async def metadata_crawler_loop():
+    _upstream_priority.set("warm")
+    while not _readiness["ready"]:
+        # Laisser passer le préchauffage d'abord
+        await asyncio.sleep(1)
+    while True:
+        try:
+            await crawl_new_metadata()
+        except Exception as e:
+            print(f"⚠️ Erreur du crawler de métadonnées: {e}")
+        await asyncio.sleep(METADATA_CRAWL_INTERVAL)
+
+async def start_metadata_crawler():
+    global _metadata_crawler_task
+    if metadata_store and METADATA_CRAWL_ENABLE:
+        _metadata_crawler_task = asyncio.create_task(metadata_crawler_loop())
+
+async def stop_metadata_crawler():
+    if _metadata_crawler_task:
+        _metadata_crawler_task.cancel()
+
+_metadata_refreshing = set()
+
+async def refresh_metadata(akwam_url, media_type):
+    """Rafraîchit une fiche de la base (une seule fois à la fois par URL)."""
+    if akwam_url in _metadata_refreshing:
+        return
+    _metadata_refreshing.add(akwam_url)
+    try:
+        await scrape_akwam_metadata(akwam_url, media_type)
+    finally:
+        _metadata_refreshing.discard(akwam_url)
+
+# Préchauffage à la demande (avant une sortie attendue) : jobs de fond suivis par identifiant
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # Vide = API d'administration désactivée
+WARM_MAX_ITEMS = int(os.getenv("WARM_MAX_ITEMS", 50))  # Éléments par job
+WARM_SEARCH_RESULTS = int(os.getenv("WARM_SEARCH_RESULTS", 1))  # Titres préchauffés par terme de recherche
+WARM_JOB_CONCURRENCY = int(os.getenv("WARM_JOB_CONCURRENCY", 2))  # Liens résolus en parallèle par job
+WARM_JOBS_KEEP = int(os.getenv("WARM_JOBS_KEEP", 20))
+
+_warm_jobs = OrderedDict()
+
+def require_admin(request):
+    """Vérifie le jeton d'administration (Authorization: Bearer ... ou X-Admin-Token)."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API disabled (ADMIN_TOKEN not set)")
+    supplied = request.headers.get("x-admin-token") or request.headers.get("authorization", "")
+    if supplied.startswith("Bearer "):
+        supplied = supplied[len("Bearer "):]
+    if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+class WarmJob:
+    """Job de préchauffage : une liste d'URL, d'identifiants ou de termes de recherche traités en fond."""
+
+    def __init__(self, items, media_type=None, streams=True):
+        self.id = uuid.uuid4().hex[:12]
+        self.media_type = media_type
+        self.streams = streams
+        self.items = [{"input": item, "status": "pending"} for item in items]
+        self.created = datetime.now()
+        self.finished = None
+        self.task = None
+
+    def report(self, with_items=True):
+        counts = {}
+        for item in self.items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        report = {
+            "id": self.id,
+            "status": "finished" if self.finished else "running",
+            "created": self.created.isoformat(timespec="seconds"),
+            "finished": self.finished.isoformat(timespec="seconds") if self.finished else None,
+            "progress": f"{counts.get('done', 0) + counts.get('failed', 0)}/{len(self.items)}",
+            "counts": counts,
+        }
+        if with_items:
+            report["items"] = self.items
+        return report
+
+def search_akwam(term, media_type, page=1):
+    """Recherche Akwam synchrone (dans un thread) : l'instance avec ses results et posters."""
+    akwam = Akwam('https://ak.sv/')
+    akwam.type = media_type
+    akwam.search(term, page=page)
+    return akwam
+
+async def resolve_warm_target(raw, media_type):
+    """Transforme une entrée du job en [(titre, url, type), ...]."""
+    if raw.startswith(("http://", "https://")):
+        return [(await run_in_thread(content_title, raw), raw, media_type_from_url(raw) or media_type or "series")]
+    try:
+        title, url = await decode_content_id_async(raw)
+    except Exception:
+        title, url = raw, None
+    if url:
+        return [(title or await run_in_thread(content_title, url), url, media_type_from_url(url) or media_type or "series")]
+
+    # Terme de recherche : index local d'abord, puis Akwam
+    hits = search_index.search(title, media_type) if SEARCH_INDEX_ENABLE else []
+    if hits:
+        return [(doc['title'], doc['url'], doc['type']) for doc in hits[:WARM_SEARCH_RESULTS]]
+    targets = []
+    for search_type in ([media_type] if media_type else ["movie", "series"]):
+        akwam = await run_in_thread(search_akwam, title, search_type)
+        targets.extend((found, url, search_type) for found, url in list(akwam.results.items())[:WARM_SEARCH_RESULTS])
+    return targets[:WARM_SEARCH_RESULTS]
+
+async def warm_title(job, item, title, url, media_type):
+    """Page de contenu, liste d'épisodes (toutes saisons) puis liens finaux d'un titre."""
+    if "/episode/" in url:
+        links = [(title, url)]
+    else:
+        metadata = await scrape_akwam_metadata(url, media_type)
+        if metadata is None:
+            raise RuntimeError(f"Page inaccessible: {url}")
+        if media_type != "series":
+            links = [(metadata.get('name') or title, url)]
+        else:
+            merged = season_episodes(url)
+            if merged:
+                links = [(f"Saison {season} Épisode {episode}", link) for season, episode, link in merged]
+            else:
+                links = [(f"Episode {video['episode']}", (await decode_content_id_async(video['id']))[1])
+                         for video in metadata.get('videos', [])]
+    item["episodes"] = item.get("episodes", 0) + (len(links) if media_type == "series" else 0)
+    if not job.streams:
+        return
+
+    semaphore = asyncio.Semaphore(WARM_JOB_CONCURRENCY)
+
+    async def resolve(link_title, link):
+        async with semaphore:
+            return await run_in_thread(get_stream_link, link, link_title, media_type, False)
+
+    results = await asyncio.gather(*(resolve(link_title, link) for link_title, link in links), return_exceptions=True)
+    item["streams"] = item.get("streams", 0) + sum(len(result) for result in results if isinstance(result, list))
+    failures = [result for result in results if not isinstance(result, list) or not result]
+    if failures:
+        item["unresolved"] = item.get("unresolved", 0) + len(failures)
+
+async def warm_item(job, item):
+    item["status"] = "running"
+    try:
+        targets = await resolve_warm_target(item["input"], job.media_type)
+        if not targets:
+            raise LookupError("Aucun titre trouvé")
+        item["titles"] = [target_url for _, target_url, _ in targets]
+        for title, url, media_type in targets:
+            await warm_title(job, item, title, url, media_type)
+        if job.streams and not item.get("streams"):
+            raise LookupError("Aucun lien résolu")
+        item["status"] = "done"
+    except Exception as e:
+        item["status"] = "failed"
+        item["error"] = str(e)
+        print(f"⚠️ Préchauffage échoué pour '{item['input']}': {e}")
+
+async def run_warm_job(job):
+    print(f"🔥 Job de préchauffage {job.id}: {len(job.items)} élément(s)")
+    try:
+        # Un élément à la fois : les liens d'un titre sont déjà résolus en parallèle
+        for item in job.items:
+            await warm_item(job, item)
+    finally:
+        job.finished = datetime.now()
+        print(f"🔥 Job {job.id} terminé: {job.report(with_items=False)['counts']}")
+
+@app.post("/cache/warm")
+async def warm_cache(request: Request):
+    """Lance un job de préchauffage : {"items": [url | id | terme, ...], "type": "movie"|"series", "streams": true}."""
+    require_admin(request)
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    items = body.get("items") if isinstance(body, dict) else None
+    if not items or not isinstance(items, list) or not all(isinstance(item, str) and item.strip() for item in items):
+        raise HTTPException(status_code=400, detail="'items' must be a non-empty list of strings")
+    if len(items) > WARM_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {WARM_MAX_ITEMS} items per job")
+    media_type = body.get("type")
+    if media_type not in (None, "movie", "series"):
+        raise HTTPException(status_code=400, detail="'type' must be 'movie' or 'series'")
+
+    job = WarmJob([item.strip() for item in items], media_type, bool(body.get("streams", True)))
+    _warm_jobs[job.id] = job
+    while len(_warm_jobs) > WARM_JOBS_KEEP:
+        oldest = next((job_id for job_id, old in _warm_jobs.items() if old.finished), None)
+        if oldest is None:
+            break
+        del _warm_jobs[oldest]
+    # Priorité "warm" : le job passe après le trafic des utilisateurs dans le budget upstream
+    job.task = spawn_background(run_warm_job(job), priority="warm")
+    return JSONResponse(status_code=202, content={"job": job.id, "status_url": f"/cache/warm/{job.id}", "items": len(job.items)})
+
+@app.get("/cache/warm")
+async def list_warm_jobs(request: Request):
+    require_admin(request)
+    return JSONResponse(content={"jobs": [job.report(with_items=False) for job in reversed(_warm_jobs.values())]})
+
+@app.get("/cache/warm/{job_id}")
+async def get_warm_job(request: Request, job_id: str):
+    """Avancement d'un job : état de chaque élément, liens résolus et erreurs."""
+    require_admin(request)
+    job = _warm_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job.report())
+
 @app.get("/meta/{meta_type}/{meta_id}.json")
 @app.get("/{param}/meta/{meta_type}/{meta_id}.json")
 async def get_meta(
+    request: Request,
     param: str = None,
     meta_type: str = Path(..., description="Metadata type"),
     meta_id: str = Path(..., description="Element ID"),
 ):
     print(f"Fetching metadata for {meta_type} with ID: {meta_id}")
+    _upstream_priority.set("meta")
+    return await run_until_disconnected(request, build_meta_response(request, meta_type, meta_id))
+
+async def build_meta_response(request, meta_type, meta_id):
+
+    render_key, rendered = get_rendered(request)
+    if rendered:
+        return rendered_response(request, rendered)
 
+    # Identifiant court, ancien format "titre::url" ou simple titre
     try:
-        meta_id_decoded = base64.urlsafe_b64decode(meta_id.replace("akwam", "")).decode("utf-8")
+        title, akwam_url = await decode_content_id_async(meta_id)
     except Exception:
-        meta_id_decoded = meta_id
-
-    # Extraire titre et URL si format "titre::url"
-    if "::" in meta_id_decoded:
-        title = meta_id_decoded.split("::", 1)[0]
-        akwam_url = meta_id_decoded.split("::", 1)[1]
-    else:
-        title = meta_id_decoded
-        akwam_url = None
+        title, akwam_url = meta_id, None
+    if title is None:
+        title = await run_in_thread(content_title, akwam_url)
 
     # Métadonnées par défaut
     meta = {
@@ -1236,8 +4141,20 @@ async def get_meta(
         "imdbRating": "N/A",
     }
 
+    # Répondre depuis la base locale ; le scrape en direct ne sert qu'à rafraîchir
+    stored_data, stored_at = await run_in_thread(metadata_store.get, akwam_url) if metadata_store and akwam_url else (None, None)
+    if stored_data:
+        record_meta_open(akwam_url)
+        meta.update(stored_data)
+        if datetime.now() - stored_at > timedelta(seconds=METADATA_REFRESH_AFTER):
+            spawn_background(refresh_metadata(akwam_url, meta_type), priority="meta")
+        print(f"🗄️ Meta served from local store")
+        return cached_json_response(request, {"meta": proxy_meta_images(request, meta)}, "meta", last_modified=stored_at)
+
     # Si on a l'URL Akwam, scraper les vraies infos
+    scraped_data = None
     if akwam_url:
+        record_meta_open(akwam_url)
         scraped_data = await scrape_akwam_metadata(akwam_url, meta_type)
         if scraped_data:
             # Mettre à jour avec les données scrapées
@@ -1248,7 +4165,127 @@ async def get_meta(
     else:
         print(f"⚠️ No Akwam URL in meta ID")
 
-    return JSONResponse(content={"meta": meta})
+    if not scraped_data:
+        return cached_json_response(request, {"meta": meta}, "meta", max_age=HTTP_CACHE_EMPTY_MAX_AGE)
+    return cached_json_response(request, {"meta": proxy_meta_images(request, meta)}, "meta", last_modified=page_last_modified(akwam_url),
+                                render_key=render_key)
+
+# Démarrage à chaud et arrêt propre
+WARMUP_CATALOG_PAGES = int(os.getenv("WARMUP_CATALOG_PAGES", 1))  # Pages de films et de séries chargées au démarrage
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT_SECONDS", 120))
+
+_readiness = {"ready": False, "steps": {}}
+_warmup_task = None
+
+async def warmup_step(name, coro):
+    """Exécute une étape de préchauffage et note son résultat pour /ready."""
+    start = time.monotonic()
+    try:
+        detail = await coro
+        _readiness["steps"][name] = {"status": "ok", "detail": detail}
+    except Exception as e:
+        print(f"⚠️ Préchauffage '{name}' échoué: {e}")
+        _readiness["steps"][name] = {"status": "failed", "detail": str(e)}
+    _readiness["steps"][name]["seconds"] = round(time.monotonic() - start, 3)
+
+async def resolve_base_url():
+    """Suit la redirection de ak.sv (la réponse reste en cache pour les Akwam() suivants)."""
+    response = await flaresolverr_get_async('https://ak.sv/')
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    url = str(response.url).rstrip('/')
+    add_akwam_host(urlsplit(url).hostname)
+    return url
+
+async def create_flaresolverr_session():
+    if not FLARESOLVERR_ENABLE:
+        return "disabled"
+    session_id = await get_or_create_session()
+    if not session_id:
+        raise RuntimeError("session non créée")
+    return session_id
+
+async def warm_catalog_pages(base_url):
+    """Charge les premières pages des catalogues films et séries (toutes catégories)."""
+    pages = [(f"{base_url}/{akwam_type}?category=0", page)
+             for akwam_type in ("movies", "series") for page in range(1, WARMUP_CATALOG_PAGES + 1)]
+    results = await asyncio.gather(*(fetch_entries_for_page(url, page) for url, page in pages))
+    return sum(len(entries) for entries in results)
+
+async def warm_up():
+    """Session FlareSolverr, URL de base puis pages clés ; /ready passe à vrai à la fin."""
+    _upstream_priority.set("warm")
+    try:
+        await asyncio.wait_for(_warm_up_steps(), WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"⏱️ Préchauffage interrompu après {WARMUP_TIMEOUT:.0f}s")
+        _readiness["steps"]["timeout"] = {"status": "failed", "detail": WARMUP_TIMEOUT}
+    _readiness["ready"] = True
+    print("✅ Préchauffage terminé")
+
+async def start_parse_workers():
+    """Démarre les workers d'analyse (import de ce module dans chacun) avant les premières requêtes."""
+    if PARSE_WORKERS <= 0:
+        return "disabled"
+    await asyncio.gather(*(run_parser(parse_listing_page, b"<html></html>") for _ in range(PARSE_WORKERS)))
+    return PARSE_WORKERS
+
+async def _warm_up_steps():
+    await warmup_step("parse_workers", start_parse_workers())
+    await warmup_step("session", create_flaresolverr_session())
+    await warmup_step("base_url", resolve_base_url())
+    base_url = _readiness["steps"]["base_url"]["detail"] if _readiness["steps"]["base_url"]["status"] == "ok" else None
+    if base_url and WARMUP_CATALOG_PAGES > 0:
+        await warmup_step("catalog_pages", warm_catalog_pages(base_url))
+
+async def close_http_clients():
+    for client in http_clients.values():
+        await client.aclose()
+    for client in http_clients_sync.values():
+        client.close()
+
+@asynccontextmanager
+async def lifespan(app):
+    """Démarrage : cache et index rechargés avant d'accepter des requêtes, puis préchauffage en tâche de fond.
+
+    Arrêt : tâches stoppées, index et cache sauvegardés, session FlareSolverr détruite, clients fermés.
+    """
+    global _warmup_task
+    if CACHE_SNAPSHOT_PATH:
+        await warmup_step("cache_snapshot", asyncio.get_running_loop().run_in_executor(
+            None, load_cache_snapshot, CACHE_SNAPSHOT_PATH))
+    await load_search_index()
+    await start_link_tracker()
+    await start_metadata_crawler()
+    _warmup_task = asyncio.create_task(warm_up())
+
+    yield
+
+    _readiness["ready"] = False
+    _warmup_task.cancel()
+    await stop_link_tracker()
+    await stop_metadata_crawler()
+    for task in list(_background_tasks):
+        task.cancel()
+    await save_search_index()
+    if CACHE_SNAPSHOT_PATH:
+        try:
+            save_cache_snapshot(CACHE_SNAPSHOT_PATH)
+        except Exception as e:
+            print(f"⚠️ Impossible d'écrire l'instantané du cache: {e}")
+    await destroy_session()
+    await close_http_clients()
+    if cache_l2:
+        await run_in_thread(cache_l2.close)  # Vide les écritures en attente
+    if metadata_store:
+        await run_in_thread(flush_content_ids)
+        await run_in_thread(metadata_store.close)
+    shutdown_parse_executor()
+
+@app.get("/ready")
+async def ready():
+    """Prêt une fois le préchauffage terminé (503 avant, pour les sondes de readiness)."""
+    return JSONResponse(content=_readiness, status_code=200 if _readiness["ready"] else 503)
 
 if __name__ == "__main__":
     import uvicorn